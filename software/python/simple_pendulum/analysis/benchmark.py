@@ -5,30 +5,99 @@ Benchmarks
 
 import time
 import yaml
+import multiprocessing
 import numpy as np
 
 from simple_pendulum.model.pendulum_plant import PendulumPlant
 from simple_pendulum.simulation.simulation import Simulator
+from simple_pendulum.simulation.batch_simulation import BatchSimulator
 
 
-def modify_pendulum_parameter(par):
+def modify_pendulum_parameter(par, rng=np.random):
     """
     Randomly modify a given parameter
+
+    Parameters
+    ----------
+    par : float
+        the parameter to be modified
+    rng : numpy.random.Generator, default=np.random
+        random number generator for the modification
+        defaults to the global numpy random state
     """
     mod_par = np.copy(par)
-    mod_par += np.random.rand()*0.1
-    mod_par *= np.random.rand()*1.0 + 0.5
+    mod_par += rng.random()*0.1
+    mod_par *= rng.random()*1.0 + 0.5
     return mod_par
 
 
+# benchmarker instance of a worker process, set by _init_worker
+_worker_benchmarker = None
+
+
+def _init_worker(ben):
+    """
+    Initialize a worker process of the parallel benchmark.
+    Every worker keeps its own copy of the benchmarker and with it its own
+    controller and simulator instances.
+    """
+    global _worker_benchmarker
+    _worker_benchmarker = ben
+
+
+def _run_trial(task):
+    """
+    Run a single benchmark trial (check, iteration, kwargs)
+    in a worker process.
+    """
+    return _worker_benchmarker._run_trial(task)
+
+
 class benchmarker():
     def __init__(self,
                  dt=0.01,
                  max_time=10.0,
                  integrator="runge_kutta",
-                 benchmark_iterations=10):
+                 benchmark_iterations=10,
+                 seed=None,
+                 energy_estimate="reference",
+                 settle_time=None):
         """
         Benchmark class
+
+        Parameters
+        ----------
+        dt : float, default=0.01
+            time step of the simulation [s]
+        max_time : float, default=10.0
+            maximum time of a single trial [s]
+        integrator : string, default="runge_kutta"
+            integrator of the simulation
+        benchmark_iterations : int, default=10
+            number of trials per check
+        seed : int, default=None
+            seed from which the random number generators of the single
+            trials are derived. If None, a random seed is drawn.
+            The seed is stored in self.seed and in the results of
+            benchmark.
+        energy_estimate : string, default="reference"
+            how the energy consumption of the regular execution is
+            estimated. The consumed energy is the energy difference
+            between the actuated pendulum and a free reference pendulum
+            after every step.
+            "reference": the reference pendulum is stepped along with
+                         the actuated pendulum at every step
+            "batched": the reference steps from all recorded states are
+                       computed in one batched pass after the rollout
+                       (same result as "reference")
+            "work": the mechanical work |tau*v|*dt of the motor
+                    (trapezoidal in v, no reference simulation) with the
+                    torque clipped to the torque limit of the pendulum
+        settle_time : float, default=None
+            if not None, the regular execution stops early once the
+            pendulum has stayed in the goal region for settle_time
+            seconds. The energy and smoothness are then only evaluated
+            up to this point.
         """
         self.dt = dt
         self.max_time = max_time
@@ -36,6 +105,17 @@ class benchmarker():
         self.integrator = "runge_kutta"
         self.iterations = benchmark_iterations
 
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = int(seed)
+
+        if energy_estimate not in ["reference", "batched", "work"]:
+            raise NotImplementedError(
+                f'Sorry, the energy estimate {energy_estimate} '
+                'is not implemented.')
+        self.energy_estimate = energy_estimate
+        self.settle_time = settle_time
+
         self.x0 = np.array([0.0, 0.0])
         self.goal = np.array([np.pi, 0.0])
         self.epsilon = np.array([0.1, 0.1])
@@ -91,13 +171,13 @@ class benchmarker():
                                           inertia=self.pen_inertia,
                                           torque_limit=self.pen_torque_limit)
 
-        self.simulator = Simulator(plant=self.pendulum)
-        self.ref_simulator = Simulator(plant=self.ref_pendulum)
+        self.simulator = Simulator(plant=self.pendulum, recorder=None)
+        self.ref_simulator = Simulator(plant=self.ref_pendulum, recorder=None)
 
     def set_controller(self, controller):
         self.controller = controller
 
-    def check_regular_execution(self):
+    def check_regular_execution(self, rng=np.random):
 
         t0 = 0.0
         self.controller.set_goal(x=self.goal)
@@ -109,52 +189,116 @@ class benchmarker():
         self.ref_simulator.reset_data_recorder()
         self.simulator.set_state(time=t, x=np.copy(x))
 
-        tau_list = []
+        x_values = np.zeros((self.max_steps+1, 2))
+        tau_values = np.zeros(self.max_steps)
+        x_values[0] = x
         energy_consumed = 0.0
         swingup_time = 0.0
         swingup_success = False
 
+        if self.settle_time is not None:
+            settle_steps = int(np.round(self.settle_time / self.dt))
+        else:
+            settle_steps = np.inf
+        steps_in_goal = 0
+
+        n_steps = self.max_steps
         for i in range(self.max_steps):
             _, _, tau = self.controller.get_control_output(meas_pos=x[0],
                                                            meas_vel=x[1],
                                                            meas_tau=0,
                                                            meas_time=t)
-            tau_list.append(float(np.squeeze(tau)))
+            tau_values[i] = float(np.squeeze(tau))
 
-            self.ref_simulator.set_state(time=t, x=np.copy(x))
+            if self.energy_estimate == "reference":
+                self.ref_simulator.set_state(time=t, x=np.copy(x))
+                self.ref_simulator.step(0.0, self.dt,
+                                        integrator=self.integrator)
 
             self.simulator.step(tau, self.dt, integrator=self.integrator)
-            self.ref_simulator.step(0.0, self.dt, integrator=self.integrator)
-
             t, x = self.simulator.get_state()
-            t_ref, x_ref = self.ref_simulator.get_state()
+            x_values[i+1] = x
 
-            energy = np.abs(self.pendulum.total_energy(x) -
-                            self.pendulum.total_energy(x_ref))
-            energy_consumed += energy
+            if self.energy_estimate == "reference":
+                t_ref, x_ref = self.ref_simulator.get_state()
+                energy = np.abs(self.pendulum.total_energy(x) -
+                                self.pendulum.total_energy(x_ref))
+                energy_consumed += energy
 
             diff = x - self.goal
             diff[0] = (diff[0] + np.pi) % (2*np.pi) - np.pi
-            if np.abs(diff[0]) < self.epsilon[0]:
-                if np.abs(diff[1]) < self.epsilon[1]:
-                    swingup_success = True
+            if np.abs(diff[0]) < self.epsilon[0] and \
+               np.abs(diff[1]) < self.epsilon[1]:
+                swingup_success = True
+                steps_in_goal += 1
+            else:
+                steps_in_goal = 0
             if not swingup_success:
                 swingup_time += self.dt
+            if steps_in_goal >= settle_steps:
+                n_steps = i + 1
+                break
 
         if not swingup_success:
             swingup_time = np.inf
 
-        tau_diff = np.diff(tau_list)
+        x_values = x_values[:n_steps+1]
+        tau_values = tau_values[:n_steps]
+        if self.energy_estimate == "batched":
+            energy_consumed = self.batched_energy_consumption(x_values)
+        elif self.energy_estimate == "work":
+            # the plant applies the torque clipped to its torque limit
+            tl = self.pendulum.torque_limit
+            tau_applied = np.clip(tau_values, -tl, tl)
+            v_mean = 0.5*(x_values[:-1, 1] + x_values[1:, 1])
+            energy_consumed = np.sum(np.abs(tau_applied*v_mean))*self.dt
+
+        tau_diff = np.diff(tau_values)
         tau_diff_std = np.std(tau_diff)
 
         return swingup_success, swingup_time, energy_consumed, tau_diff_std
 
-    def check_consistency(self):
+    def batched_energy_consumption(self, x_values):
+        """
+        Energy consumption of a recorded rollout.
+        The free reference steps from all recorded states are integrated
+        in one batched pass and the absolute energy differences to the
+        recorded successor states are summed up.
+
+        Parameters
+        ----------
+        x_values : array-like, shape=(N+1, 2)
+            recorded states of the rollout including the start state
+
+        Returns
+        -------
+        float : the consumed energy [J]
+        """
+        x_values = np.asarray(x_values)
+        n = len(x_values) - 1
+        if n < 1:
+            return 0.0
+        ref_sim = BatchSimulator(n=n,
+                                 mass=self.pen_mass,
+                                 length=self.pen_length,
+                                 damping=self.pen_damping,
+                                 gravity=self.pen_gravity,
+                                 coulomb_fric=self.pen_cfric,
+                                 inertia=self.pen_inertia,
+                                 torque_limit=self.pen_torque_limit)
+        ref_sim.set_state(0.0, x_values[:-1])
+        ref_sim.step(0.0, self.dt, integrator=self.integrator)
+        _, x_ref = ref_sim.get_state()
+        energy = np.abs(self.pendulum.total_energy(x_values[1:].T) -
+                        self.pendulum.total_energy(x_ref.T))
+        return float(np.sum(energy))
+
+    def check_consistency(self, rng=np.random):
         # different starting positions
         t0 = 0.0
         x0 = np.zeros(2)
-        x0[0] = np.random.rand()*2*np.pi - np.pi  # in range [-pi, pi]
-        x0[1] = np.random.rand()*6*np.pi - 3*np.pi  # in range [-3pi, 3pi]
+        x0[0] = rng.random()*2*np.pi - np.pi  # in range [-pi, pi]
+        x0[1] = rng.random()*6*np.pi - 3*np.pi  # in range [-3pi, 3pi]
         self.controller.set_goal(x=self.goal)
         self.controller.init(x0=x0)
 
@@ -184,7 +328,7 @@ class benchmarker():
 
         return swingup_success
 
-    def check_robustness(self):
+    def check_robustness(self, rng=np.random):
         # random perturbations during executions
         t0 = 0.0
         self.controller.set_goal(x=self.goal)
@@ -210,7 +354,7 @@ class benchmarker():
             if p_counter < len(perturbation_times):
                 if t > perturbation_times[p_counter] or p_step_counter > 0:
                     if p_step_counter == 0:
-                        perturbation = np.random.rand()*4.0 - 2.0
+                        perturbation = rng.random()*4.0 - 2.0
                     tau += perturbation
                     p_step_counter += 1
                     if p_step_counter >= 100:
@@ -230,14 +374,14 @@ class benchmarker():
 
         return swingup_success
 
-    def check_sensitivity(self):
+    def check_sensitivity(self, rng=np.random):
         # sensitivity to model parameters
 
-        mass = modify_pendulum_parameter(self.pen_mass)
-        length = modify_pendulum_parameter(self.pen_length)
-        damping = modify_pendulum_parameter(self.pen_damping)
-        cfric = modify_pendulum_parameter(self.pen_cfric)
-        inertia = modify_pendulum_parameter(self.pen_inertia)
+        mass = modify_pendulum_parameter(self.pen_mass, rng)
+        length = modify_pendulum_parameter(self.pen_length, rng)
+        damping = modify_pendulum_parameter(self.pen_damping, rng)
+        cfric = modify_pendulum_parameter(self.pen_cfric, rng)
+        inertia = modify_pendulum_parameter(self.pen_inertia, rng)
 
         modified_pendulum = PendulumPlant(mass=mass,
                                           length=length,
@@ -247,7 +391,7 @@ class benchmarker():
                                           inertia=inertia,
                                           torque_limit=self.pen_torque_limit)
 
-        modified_simulator = Simulator(plant=modified_pendulum)
+        modified_simulator = Simulator(plant=modified_pendulum, recorder=None)
 
         t0 = 0.0
         self.controller.set_goal(x=self.goal)
@@ -278,7 +422,7 @@ class benchmarker():
 
         return swingup_success
 
-    def check_reduced_torque_limit(self, tl=np.inf):
+    def check_reduced_torque_limit(self, tl=np.inf, rng=np.random):
         t0 = 0.0
         self.controller.set_goal(x=self.goal)
         self.controller.init(x0=self.x0)
@@ -311,12 +455,143 @@ class benchmarker():
 
         return swingup_success
 
-    def check_speed(self, N=1000):
+    def trial_seed_sequence(self, check, iteration):
+        """
+        Seed sequence of a single benchmark trial. It only depends on the
+        benchmarker seed, the check and the iteration, so that trials give
+        the same results independent of their execution order.
+
+        Parameters
+        ----------
+        check : string
+            name of the check method, e.g. "check_consistency"
+        iteration : int
+            iteration of the check
+
+        Returns
+        -------
+        numpy.random.SeedSequence : the seed sequence of the trial
+        """
+        check_id = [ord(c) for c in check]
+        return np.random.SeedSequence([self.seed, iteration] + check_id)
+
+    def trial_rng(self, check, iteration):
+        """
+        Independent random number generator of a single benchmark trial.
+
+        Parameters
+        ----------
+        check : string
+            name of the check method, e.g. "check_consistency"
+        iteration : int
+            iteration of the check
+
+        Returns
+        -------
+        numpy.random.Generator : the random number generator of the trial
+        """
+        return np.random.default_rng(self.trial_seed_sequence(check,
+                                                              iteration))
+
+    def replay_trial(self, check, iteration, **kwargs):
+        """
+        Run a single benchmark trial with the random numbers it had during
+        the benchmark, e.g. to rerun a failed trial. The benchmarker has to
+        be created with the seed of the benchmark run, i.e.
+        benchmarker(seed=<saved seed>), the seed is printed by benchmark
+        and saved in its results file.
+
+        Parameters
+        ----------
+        check : string
+            name of the check method, e.g. "check_consistency"
+        iteration : int
+            iteration of the check. For "check_reduced_torque_limit" this
+            is the index of the torque limit in the list of torque limits.
+        **kwargs
+            further keyword arguments of the check, e.g. tl for
+            "check_reduced_torque_limit"
+
+        Returns
+        -------
+        the return value of the check
+        """
+        return self._run_trial((check, iteration, kwargs))
+
+    def _run_trial(self, task):
+        """
+        Run a single benchmark trial.
+
+        Parameters
+        ----------
+        task : tuple
+            (check, iteration, kwargs) with the name of the check method,
+            the iteration of the check and its keyword arguments
+
+        Returns
+        -------
+        the return value of the check
+        """
+        check, iteration, kwargs = task
+        seq = self.trial_seed_sequence(check, iteration)
+        # the global random state is seeded as well for controllers
+        # which draw random numbers internally (e.g. the iLQR initial guess)
+        np.random.seed(seq.generate_state(1)[0])
+        rng = np.random.default_rng(seq)
+        return getattr(self, check)(rng=rng, **kwargs)
+
+    def _run_trials(self, check, iterations=None, kwargs_list=None,
+                    pool=None):
+        """
+        Run several trials of a check, either serially or on the
+        worker processes of pool.
+
+        Parameters
+        ----------
+        check : string
+            name of the check method, e.g. "check_consistency"
+        iterations : int, default=None
+            number of trials. Defaults to self.iterations.
+            Ignored if kwargs_list is given.
+        kwargs_list : list, default=None
+            list of keyword argument dictionaries, one per trial
+        pool : multiprocessing.pool.Pool, default=None
+            process pool for the trials. If None the trials are executed
+            serially in this process.
+
+        Returns
+        -------
+        list : the results of the trials in order of their iteration
+        """
+        if kwargs_list is None:
+            if iterations is None:
+                iterations = self.iterations
+            kwargs_list = iterations*[{}]
+        tasks = [(check, i, kwargs) for i, kwargs in enumerate(kwargs_list)]
+        if pool is None:
+            return [self._run_trial(task) for task in tasks]
+        return pool.map(_run_trial, tasks)
+
+    def _get_pool(self, n_workers):
+        """
+        Create a process pool for the benchmark trials.
+        The "fork" start method is used where available, so that every
+        worker starts with a copy of this benchmarker (and its controller)
+        without pickling. Otherwise the benchmarker has to be picklable.
+        """
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing.get_context()
+        return context.Pool(n_workers, initializer=_init_worker,
+                            initargs=(self,))
+
+    def check_speed(self, N=1000, rng=np.random):
 
         self.controller.set_goal(x=self.goal)
         self.controller.init(x0=self.x0)
-        pos = np.random.rand(N)*2*np.pi - np.pi  # in range [-pi, pi]
-        vel = np.random.rand(N)*4*np.pi - 2*np.pi
+        pos = rng.random(N)*2*np.pi - np.pi  # in range [-pi, pi]
+        vel = rng.random(N)*4*np.pi - 2*np.pi
         start = time.time()
         for i in range(N):
             _, _, tau = self.controller.get_control_output(meas_pos=pos[i],
@@ -336,15 +611,56 @@ class benchmarker():
                   check_robustness=True,
                   check_sensitivity=True,
                   check_torque_limit=True,
-                  save_path=None):
+                  save_path=None,
+                  n_workers=1):
+        """
+        Run the benchmark.
+
+        Parameters
+        ----------
+        check_speed, check_energy, check_time, check_smoothness,
+        check_consistency, check_robustness, check_sensitivity,
+        check_torque_limit : bool, default=True
+            which criteria to check
+        save_path : string, default=None
+            path to a yaml file where the results are saved
+            if None, the results are not saved
+        n_workers : int, default=1
+            number of worker processes for the trials.
+            If n_workers > 1, independent trials are executed in parallel
+            with per-worker controller and simulator instances.
+            The speed check is always executed in this process.
+        """
 
+        # the seed is needed to replay single trials of this run
+        print("Benchmark seed:", self.seed)
+        save_dict = {}
         if save_path is not None:
-            save_dict = {}
             save_dict["iterations"] = self.iterations
+            save_dict["seed"] = self.seed
+
+        pool = None
+        if n_workers > 1:
+            pool = self._get_pool(n_workers)
+        try:
+            self._benchmark(check_speed, check_energy, check_time,
+                            check_smoothness, check_consistency,
+                            check_robustness, check_sensitivity,
+                            check_torque_limit, save_path, save_dict,
+                            pool)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def _benchmark(self, check_speed, check_energy, check_time,
+                   check_smoothness, check_consistency, check_robustness,
+                   check_sensitivity, check_torque_limit, save_path,
+                   save_dict, pool):
 
         if check_speed:
             N = 1000
-            min_dt = self.check_speed(N)
+            min_dt = self._run_trial(("check_speed", 0, {"N": N}))
             print("\n*********************************")
             print("Controller Speed")
             print("Minimal dt: ", min_dt, "s (", 1./min_dt, " Hz)")
@@ -358,8 +674,9 @@ class benchmarker():
             times = []
             energies = []
             tau_diff_stds = []
-            for i in range(self.iterations):
-                s, t, e, tstd = self.check_regular_execution()
+            results = self._run_trials("check_regular_execution",
+                                       pool=pool)
+            for s, t, e, tstd in results:
                 successes.append(s)
                 times.append(t)
                 energies.append(e)
@@ -416,9 +733,9 @@ class benchmarker():
             ##########################
             # check consistency
             ##########################
-            c_success = 0
-            for i in range(self.iterations):
-                c_success += int(self.check_consistency())
+            c_success = sum(int(r) for r in self._run_trials(
+                                                "check_consistency",
+                                                pool=pool))
             print("\n*********************************")
             print("Consistency")
             print("(Varying start state)")
@@ -431,9 +748,9 @@ class benchmarker():
             ##########################
             # check robustness
             ##########################
-            s_success = 0
-            for i in range(self.iterations):
-                s_success += int(self.check_robustness())
+            s_success = sum(int(r) for r in self._run_trials(
+                                                "check_robustness",
+                                                pool=pool))
             print("\n*********************************")
             print("Robustness")
             print("(Random perturbations during execution)")
@@ -446,9 +763,9 @@ class benchmarker():
             ##########################
             # check sensitivity
             ##########################
-            sens_success = 0
-            for i in range(self.iterations):
-                sens_success += int(self.check_sensitivity())
+            sens_success = sum(int(r) for r in self._run_trials(
+                                                "check_sensitivity",
+                                                pool=pool))
             print("\n*********************************")
             print("Sensitivity")
             print("(Modified pendulum model parameters)")
@@ -463,11 +780,24 @@ class benchmarker():
             ##########################
             rtl_success = 0
             tlimits = [10.0, 5.0, 2.5, 2.0, 1.5, 1.0, 0.5, 0.25, 0.1]
-            for i in range(len(tlimits)):
-                s = self.check_reduced_torque_limit(tl=tlimits[i])
-                rtl_success += int(s)
-                if not s:
-                    break
+            if pool is None:
+                for i in range(len(tlimits)):
+                    s = self.replay_trial("check_reduced_torque_limit", i,
+                                          tl=tlimits[i])
+                    rtl_success += int(s)
+                    if not s:
+                        break
+            else:
+                # run all torque limits at once and count the successes
+                # until the first failure
+                results = self._run_trials(
+                                "check_reduced_torque_limit",
+                                kwargs_list=[{"tl": tl} for tl in tlimits],
+                                pool=pool)
+                for s in results:
+                    if not s:
+                        break
+                    rtl_success += 1
             print("\n*********************************")
             print("Reduced Torque Limit")
             print("(Reduced pendulum torque limit)")
@@ -486,5 +816,6 @@ class benchmarker():
                 else:
                     save_dict["min_successful_torque"] = np.inf
 
+        if save_path is not None:
             with open(save_path, "w") as f:
                 yaml.dump(save_dict, f)
@@ -27,15 +27,13 @@ def plot_policy(controller,
                              velocity_range[1],
                              samples_per_dim)
 
-    torques = np.zeros((samples_per_dim, samples_per_dim))
-
-    for p, pos in enumerate(positions):
-        for v, vel in enumerate(velocities):
-            _, _, u = controller.get_control_output(meas_pos=pos,
-                                                    meas_vel=vel)
-            if u is None:
-                u = 0
-            torques[p, v] = u
+    # all grid points in one batch, torques[p, v] belongs to
+    # positions[p] and velocities[v]
+    pos_grid, vel_grid = np.meshgrid(positions, velocities, indexing="ij")
+    _, _, u = controller.get_control_output_batch(meas_pos=pos_grid.ravel(),
+                                                  meas_vel=vel_grid.ravel())
+    # states without a control output (None) are plotted as 0
+    torques = np.nan_to_num(u, nan=0.0).reshape(pos_grid.shape)
 
     if plotstyle == "3d":
         fig = plt.figure(figsize=(30, 30))
@@ -0,0 +1,111 @@
+"""
+Unit Tests
+==========
+"""
+
+
+import os
+import tempfile
+import unittest
+import yaml
+import numpy as np
+
+from simple_pendulum.analysis.benchmark import benchmarker
+from simple_pendulum.controllers.energy_shaping.energy_shaping_controller \
+    import EnergyShapingAndLQRController
+
+
+class Test(unittest.TestCase):
+
+    seed = 7
+
+    def make_benchmarker(self, seed=seed, **kwargs):
+        ben = benchmarker(dt=0.01,
+                          max_time=2.0,
+                          integrator="runge_kutta",
+                          benchmark_iterations=3,
+                          seed=seed,
+                          **kwargs)
+        ben.init_pendulum(torque_limit=3.0)
+        # the controller is not limited, so that the plant saturates
+        # the torque
+        controller = EnergyShapingAndLQRController(mass=0.57288,
+                                                   length=0.5,
+                                                   damping=0.15,
+                                                   gravity=9.81,
+                                                   torque_limit=np.inf)
+        ben.set_controller(controller)
+        return ben
+
+    def test_0_parallel_benchmark(self):
+        """
+        Unit test comparing the serial benchmark with the benchmark on
+        worker processes
+        """
+        results = []
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for n_workers in [1, 2]:
+                path = os.path.join(tmp_dir, f"benchmark_{n_workers}.yml")
+                ben = self.make_benchmarker()
+                ben.benchmark(check_speed=False,
+                              save_path=path,
+                              n_workers=n_workers)
+                with open(path, "r") as f:
+                    results.append(yaml.safe_load(f))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0]["seed"], self.seed)
+
+    def test_1_replay_trial(self):
+        """
+        Unit test checking that trials are reproduced from the seed
+        """
+        ben = self.make_benchmarker(seed=None)
+        result = ben.replay_trial("check_sensitivity", 1)
+        rng = ben.trial_rng("check_sensitivity", 1)
+
+        # a new benchmarker with the same seed replays the trial
+        replay = self.make_benchmarker(seed=ben.seed)
+        self.assertEqual(replay.replay_trial("check_sensitivity", 1), result)
+        numbers = rng.random(5)
+        self.assertTrue(np.all(
+            replay.trial_rng("check_sensitivity", 1).random(5) == numbers))
+
+        # the trials have independent random numbers
+        self.assertFalse(np.any(
+            replay.trial_rng("check_sensitivity", 2).random(5) == numbers))
+
+    def test_2_energy_estimate(self):
+        """
+        Unit test comparing the energy estimates on the same rollout
+        """
+        energies = {}
+        for energy_estimate in ["reference", "batched", "work"]:
+            ben = self.make_benchmarker(energy_estimate=energy_estimate)
+            success, swingup_time, energy, smoothness = \
+                ben.replay_trial("check_regular_execution", 0)
+            self.assertTrue(success)
+            energies[energy_estimate] = energy
+
+        self.assertTrue(np.isclose(energies["batched"],
+                                   energies["reference"],
+                                   rtol=1e-9))
+        # the motor work only differs by the integration error
+        self.assertTrue(np.isclose(energies["work"],
+                                   energies["reference"],
+                                   rtol=0.05))
+
+        # the settle time ends the rollout in the goal region
+        ben = self.make_benchmarker(settle_time=0.1)
+        success, settle_swingup_time, settle_energy, _ = \
+            ben.replay_trial("check_regular_execution", 0)
+        self.assertTrue(success)
+        self.assertEqual(settle_swingup_time, swingup_time)
+        self.assertTrue(settle_energy <= energies["reference"] + 1e-9)
+
+    def test_3_energy_estimate_not_implemented(self):
+        with self.assertRaises(NotImplementedError):
+            benchmarker(energy_estimate="heat")
+
+
+if __name__ == '__main__':
+    unittest.main()
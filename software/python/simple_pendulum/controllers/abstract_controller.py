@@ -7,6 +7,7 @@ Abstract controller class to which all controller classes have to adhere.
 
 
 from abc import ABC, abstractmethod
+import numpy as np
 
 
 class AbstractController(ABC):
@@ -47,6 +48,54 @@ class AbstractController(ABC):
         des_tau = None
         return des_pos, des_vel, des_tau
 
+    def get_control_output_batch(self, meas_pos, meas_vel, meas_tau=None,
+                                 meas_time=0):
+        """
+        The function to compute the control inputs for many pendulum states
+        at once, e.g. for batch simulations or policy plots.
+        This default implementation calls get_control_output for every
+        state. Controllers which can evaluate all states with array
+        operations (or one forward pass of a neural network) should
+        overwrite it.
+
+        **Parameters**
+
+        ``meas_pos``: ``array like, shape=(M,)``
+            The positions of the pendulums [rad]
+        ``meas_vel``: ``array like, shape=(M,)``
+            The velocities of the pendulums [rad/s]
+        ``meas_tau``: ``array like, shape=(M,)``
+            The meastured torques of the pendulums [Nm], zeros if None
+        ``meas_time``: ``float``
+            The collapsed time [s]
+
+        Returns
+        -------
+        ``des_pos``: ``array like, shape=(M,)``
+            The desired positions of the pendulums [rad]
+        ``des_vel``: ``array like, shape=(M,)``
+            The desired velocities of the pendulums [rad/s]
+        ``des_tau``: ``array like, shape=(M,)``
+            The torques supposed to be applied by the actuators [Nm]
+
+        Outputs which the controller does not provide (None) are nan.
+        """
+
+        meas_pos = np.atleast_1d(np.asarray(meas_pos, dtype=float))
+        meas_vel = np.atleast_1d(np.asarray(meas_vel, dtype=float))
+        if meas_tau is None:
+            meas_tau = np.zeros_like(meas_pos)
+        outputs = np.full((3, len(meas_pos)), np.nan)
+        for i in range(len(meas_pos)):
+            output = self.get_control_output(meas_pos=meas_pos[i],
+                                             meas_vel=meas_vel[i],
+                                             meas_tau=meas_tau[i],
+                                             meas_time=meas_time)
+            for j, value in enumerate(output):
+                if value is not None:
+                    outputs[j, i] = np.squeeze(value)
+        return outputs[0], outputs[1], outputs[2]
+
     def init(self, x0):
         """
         Initialize the controller. May not be necessary.
@@ -48,6 +48,31 @@ class ddpg_controller(AbstractController):
 
         return None, None, control_output
 
+    def get_control_output_batch(self, meas_pos, meas_vel, meas_tau=None,
+                                 meas_time=0):
+        """
+        Vectorized version of get_control_output for many states,
+        see AbstractController.get_control_output_batch.
+        The model is evaluated for all states in one forward pass.
+        """
+        pos = np.asarray(meas_pos, dtype=float).ravel()
+        vel = np.asarray(meas_vel, dtype=float).ravel()
+
+        vel = np.clip(vel, self.low[-1], self.high[-1])
+        if self.state_representation == 2:
+            observations = np.stack((pos, vel), axis=1)
+        elif self.state_representation == 3:
+            observations = np.stack((np.cos(pos), np.sin(pos), vel), axis=1)
+        control_output = self.model.predict(observations.astype(np.float32))
+
+        control_output = np.reshape(control_output, (len(pos), -1))[:, 0]
+        control_output = np.clip(control_output*self.torque_limit,
+                                 -self.torque_limit,
+                                 self.torque_limit)
+
+        nan = np.full_like(control_output, np.nan)
+        return nan, nan, control_output
+
     def get_observation(self, state):
         st = np.copy(state)
         st[1] = np.clip(st[1], self.low[-1], self.high[-1])
@@ -120,6 +120,47 @@ class EnergyShapingController(AbstractController):
 
         return des_pos, des_vel, des_tau
 
+    def get_control_output_batch(self, meas_pos, meas_vel, meas_tau=None,
+                                 meas_time=0):
+        """
+        Vectorized version of get_control_output for many states,
+        see AbstractController.get_control_output_batch.
+
+        Parameters
+        ----------
+        meas_pos : array-like, shape=(M,)
+            the positions of the pendulums [rad]
+        meas_vel : array-like, shape=(M,)
+            the velocities of the pendulums [rad/s]
+        meas_tau : array-like, shape=(M,), default=None
+            the meastured torques of the pendulums [Nm]
+            (not used)
+        meas_time : float, default=0
+            the collapsed time [s]
+            (not used)
+
+        Returns
+        -------
+        des_pos : array-like, shape=(M,)
+            (not used, nan)
+        des_vel : array-like, shape=(M,)
+            (not used, nan)
+        des_tau : array-like, shape=(M,)
+            the torques supposed to be applied by the actuators [Nm]
+        """
+
+        pos = np.asarray(meas_pos, dtype=float).ravel()
+        vel = np.asarray(meas_vel, dtype=float).ravel()
+
+        total_energy = self.plant.total_energy([pos, vel])
+        des_tau = -self.k*vel*(total_energy - self.desired_energy) + \
+            self.b*vel
+        des_tau[(pos == 0.0) & (vel == 0.0)] = 0.1*self.torque_limit
+        des_tau = np.clip(des_tau, -self.torque_limit, self.torque_limit)
+
+        nan = np.full_like(des_tau, np.nan)
+        return nan, nan, des_tau
+
 
 class EnergyShapingAndLQRController(AbstractController):
     """
@@ -226,3 +267,48 @@ class EnergyShapingAndLQRController(AbstractController):
             des_pos, des_vel, u = (self.energy_shaping_controller.
                                    get_control_output(meas_pos, meas_vel))
         return des_pos, des_vel, u
+
+    def get_control_output_batch(self, meas_pos, meas_vel, meas_tau=None,
+                                 meas_time=0):
+        """
+        Vectorized version of get_control_output for many states,
+        see AbstractController.get_control_output_batch.
+        The lqr controller is used for the states where its torque is
+        within the torque limit, the energy shaping controller for the
+        others.
+
+        Parameters
+        ----------
+        meas_pos : array-like, shape=(M,)
+            the positions of the pendulums [rad]
+        meas_vel : array-like, shape=(M,)
+            the velocities of the pendulums [rad/s]
+        meas_tau : array-like, shape=(M,), default=None
+            the meastured torques of the pendulums [Nm]
+            (not used)
+        meas_time : float, default=0
+            the collapsed time [s]
+            (not used)
+
+        Returns
+        -------
+        des_pos : array-like, shape=(M,)
+            (not used, nan)
+        des_vel : array-like, shape=(M,)
+            (not used, nan)
+        des_tau : array-like, shape=(M,)
+            the torques supposed to be applied by the actuators [Nm]
+        """
+
+        _, _, u = self.lqr_controller.get_control_output_batch(meas_pos,
+                                                               meas_vel)
+        swingup = np.isnan(u)
+        if np.any(swingup):
+            _, _, u_es = (self.energy_shaping_controller.
+                          get_control_output_batch(
+                              np.asarray(meas_pos, dtype=float).ravel(),
+                              np.asarray(meas_vel, dtype=float).ravel()))
+            u[swingup] = u_es[swingup]
+
+        nan = np.full_like(u, np.nan)
+        return nan, nan, u
@@ -9,7 +9,8 @@ import numpy as np
 
 from simple_pendulum.model.pendulum_plant import PendulumPlant
 from simple_pendulum.simulation.simulation import Simulator
-from simple_pendulum.controllers.energy_shaping.energy_shaping_controller import EnergyShapingController
+from simple_pendulum.controllers.energy_shaping.energy_shaping_controller import EnergyShapingController, \
+                                                                              EnergyShapingAndLQRController
 
 
 class Test(unittest.TestCase):
@@ -60,3 +61,22 @@ class Test(unittest.TestCase):
                       "final state: ", X[-1])
 
         self.assertTrue(swingup_success)
+
+    def test_1_batch_output(self):
+        pos = np.random.rand(200)*4*np.pi - 2*np.pi
+        vel = np.random.rand(200)*8 - 4
+        pos[0], vel[0] = 0.0, 0.0
+        pos[1], vel[1] = np.pi - 0.05, 0.1
+        for controller in [EnergyShapingController(mass=0.57288,
+                                                   length=0.5,
+                                                   damping=0.05,
+                                                   torque_limit=1.0),
+                           EnergyShapingAndLQRController(mass=0.57288,
+                                                         length=0.5,
+                                                         damping=0.05,
+                                                         torque_limit=1.0)]:
+            controller.set_goal([np.pi, 0])
+            _, _, u_batch = controller.get_control_output_batch(pos, vel)
+            for i in range(len(pos)):
+                _, _, u = controller.get_control_output(pos[i], vel[i])
+                self.assertAlmostEqual(u, u_batch[i])
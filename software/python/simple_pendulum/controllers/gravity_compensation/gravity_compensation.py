@@ -6,6 +6,7 @@ Gravity Compensation Controller
 
 # Other imports
 import math
+import numpy as np
 
 # Local imports
 from simple_pendulum.controllers.abstract_controller import AbstractController
@@ -28,3 +29,14 @@ class GravityCompController(AbstractController):
         des_vel = 0
 
         return des_pos, des_vel, des_tau
+
+    def get_control_output_batch(self, meas_pos, meas_vel, meas_tau=None,
+                                 meas_time=0):
+        # compensate gravity with input torque for all states
+        pos = np.asarray(meas_pos, dtype=float).ravel()
+        des_tau = self.m * self.g * self.l * np.sin(pos)
+
+        des_pos = np.zeros_like(des_tau)
+        des_vel = np.zeros_like(des_tau)
+
+        return des_pos, des_vel, des_tau
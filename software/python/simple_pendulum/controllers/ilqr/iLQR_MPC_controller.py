@@ -5,29 +5,46 @@ iLQR MPC Controller
 
 
 # Other imports
+import importlib
+import importlib.util
+import threading
+import time
 import numpy as np
 from functools import partial
-try:
-    import pydrake
-    pydrake_available = True
-except ModuleNotFoundError:
-    pydrake_available = False
 
 # Local imports
 from simple_pendulum.controllers.abstract_controller import AbstractController
-if pydrake_available:
-    from simple_pendulum.trajectory_optimization.ilqr.ilqr import iLQR_Calculator
-else:
-    from simple_pendulum.trajectory_optimization.ilqr.ilqr_sympy import iLQR_Calculator
+from simple_pendulum.controllers.ilqr.warm_start_library import WarmStartLibrary
 from simple_pendulum.trajectory_optimization.ilqr.pendulum import pendulum_discrete_dynamics_euler, \
                                                                   pendulum_discrete_dynamics_rungekutta, \
+                                                                  pendulum_discrete_dynamics_symplectic_euler, \
+                                                                  pendulum_discrete_dynamics_verlet, \
                                                                   pendulum_swingup_stage_cost, \
                                                                   pendulum_swingup_final_cost, \
                                                                   pendulum3_discrete_dynamics_euler, \
                                                                   pendulum3_discrete_dynamics_rungekutta, \
+                                                                  pendulum3_discrete_dynamics_symplectic_euler, \
+                                                                  pendulum3_discrete_dynamics_verlet, \
                                                                   pendulum3_swingup_stage_cost, \
                                                                   pendulum3_swingup_final_cost
 
+# modules of the iLQR_Calculator backends
+ilqr_backends = {
+    "pydrake": "simple_pendulum.trajectory_optimization.ilqr.ilqr",
+    "sympy": "simple_pendulum.trajectory_optimization.ilqr.ilqr_sympy",
+    "analytic": "simple_pendulum.trajectory_optimization.ilqr.ilqr_analytic"}
+
+# discrete dynamics functions for n_x=2 and n_x=3
+ilqr_dynamics = {
+    "euler": (pendulum_discrete_dynamics_euler,
+              pendulum3_discrete_dynamics_euler),
+    "runge_kutta": (pendulum_discrete_dynamics_rungekutta,
+                    pendulum3_discrete_dynamics_rungekutta),
+    "symplectic_euler": (pendulum_discrete_dynamics_symplectic_euler,
+                         pendulum3_discrete_dynamics_symplectic_euler),
+    "velocity_verlet": (pendulum_discrete_dynamics_verlet,
+                        pendulum3_discrete_dynamics_verlet)}
+
 
 class iLQRMPCController(AbstractController):
     """
@@ -53,7 +70,15 @@ class iLQRMPCController(AbstractController):
                  fCv=10.0,
                  fCen=300.0,
                  dynamics="runge_kutta",
-                 n_x=3):
+                 n_x=3,
+                 backend="auto",
+                 alphas=None,
+                 deadline=None,
+                 asynchronous=False,
+                 warm_start=None,
+                 warm_start_iter=10,
+                 torque_limit=None,
+                 cache_dir="default"):
         """
         Controller which computes an ilqr solution at every timestep and uses
         the first control output.
@@ -96,11 +121,58 @@ class iLQRMPCController(AbstractController):
             final cost weight for the energy error
         dynamics : string, default="runge_kutta"
             string that selects the integrator to be used for the simulation
-            options are: "euler", "runge_kutta"
+            options are: "euler", "runge_kutta", "symplectic_euler",
+            "velocity_verlet" (the symplectic integrators are only
+            supported by the pydrake and sympy backends)
         n_x : int, default=3
             determines how the state space of the pendulum is represented
             n_x=2 means state = [position, velocity]
             n_x=3 means state = [cos(position), sin(position), velocity]
+        backend : string, default="auto"
+            iLQR_Calculator implementation which computes the derivatives
+            options are:
+            "pydrake": symbolic derivatives with pydrake.symbolic
+            "sympy": symbolic derivatives with sympy
+            "analytic": closed-form pendulum derivatives
+                        (no symbolic library needed)
+            "auto": "pydrake" if pydrake is installed, else "sympy"
+        alphas : array-like, default=None
+            step sizes of the line search in the iLQR forward pass,
+            e.g. [1.0, 0.5, 0.25, 0.125]
+            if None, only the full step is evaluated
+        deadline : float, default=None
+            wall clock time budget in seconds for the optimization at every
+            control step (e.g. 0.004 for a 250 Hz control loop).
+            The optimization runs at most max_iter iterations and returns
+            the best trajectory found so far when the next iteration would
+            exceed the deadline.
+            if None, the optimization is only limited by max_iter
+        asynchronous : bool, default=False
+            whether to run the optimization in a background thread.
+            In asynchronous mode init() starts a solver thread which keeps
+            re-solving from the latest measured state and
+            get_control_output returns immediately with
+            u_trj[i] + K_trj[i] (x - x_trj[i]) of the most recent solution,
+            where i is the time step since the measurement that solution
+            was computed from. Call stop() to end the solver thread.
+        warm_start : WarmStartLibrary or string, default=None
+            library of precomputed solutions (or the path to a saved
+            library). If set, init() starts from the solution of the
+            closest start state in the library and only refines it with
+            warm_start_iter iterations instead of computing a new initial
+            guess from scratch.
+        warm_start_iter : int, default=10
+            iLQR iterations to refine the solution from the library
+        torque_limit : float, default=None
+            torque limit of the control-limited iLQR optimization.
+            If None, the optimization is unconstrained and the torque is
+            only limited by the cost function.
+        cache_dir : string, default="default"
+            directory in which the sympy backend caches the generated
+            derivative modules. "default" uses the default directory of
+            the sympy backend (~/.cache/simple_pendulum/ilqr_sympy or the
+            environment variable SIMPLE_PENDULUM_ILQR_CACHE), None
+            disables the cache. Not used by the other backends.
         """
 
         self.mass = mass
@@ -108,6 +180,9 @@ class iLQRMPCController(AbstractController):
         self.damping = damping
         self.coulomb_friction = coulomb_friction
         self.gravity = gravity
+        self.inertia = inertia
+        self.dynamics = dynamics
+        self.goal = None
 
         self.N = n
         self.n_x = n_x
@@ -122,19 +197,51 @@ class iLQRMPCController(AbstractController):
 
         self.break_cost_redu = break_cost_redu
         self.max_iter = max_iter
+        self.alphas = alphas
+        self.deadline = deadline
+        self.dt = dt
+        self.reset_solver_stats()
+
+        # asynchronous mode
+        self.asynchronous = asynchronous
+        self.K_trj = None
+        self._worker = None
+        self._lock = threading.Lock()
+        self._new_measurement = threading.Event()
+        self._stop_worker = threading.Event()
+
+        # warm start library
+        if isinstance(warm_start, str):
+            warm_start = WarmStartLibrary.load(warm_start)
+        self.warm_start = warm_start
+        self.warm_start_iter = warm_start_iter
 
         # Setup dynamics function in ilqr calculator
-        self.iLQR = iLQR_Calculator(n_x=n_x, n_u=1)
-        if n_x == 2:
-            if dynamics == "euler":
-                dyn_func = pendulum_discrete_dynamics_euler
-            else:
-                dyn_func = pendulum_discrete_dynamics_rungekutta
-        elif n_x == 3:
-            if dynamics == "euler":
-                dyn_func = pendulum3_discrete_dynamics_euler
+        if backend == "auto":
+            # the backend modules (and pydrake/sympy) are only imported
+            # when a controller is created
+            if importlib.util.find_spec("pydrake") is not None:
+                backend = "pydrake"
             else:
-                dyn_func = pendulum3_discrete_dynamics_rungekutta
+                backend = "sympy"
+        if backend not in ilqr_backends:
+            raise NotImplementedError(
+                f'Sorry, the iLQR backend {backend} is not implemented.')
+        self.backend = backend
+        ilqr_module = importlib.import_module(ilqr_backends[backend])
+        self.iLQR = ilqr_module.iLQR_Calculator(n_x=n_x, n_u=1)
+        self._derivative_kwargs = {}
+        if backend == "sympy":
+            if cache_dir == "default":
+                cache_dir = ilqr_module.default_cache_dir
+            self._derivative_kwargs["cache_dir"] = cache_dir
+        self.torque_limit = torque_limit
+        if torque_limit is not None:
+            self.iLQR.set_control_limits(-torque_limit, torque_limit)
+        if dynamics not in ilqr_dynamics:
+            raise NotImplementedError(
+                f'Sorry, the dynamics {dynamics} are not implemented.')
+        dyn_func = ilqr_dynamics[dynamics][n_x - 2]
         dyn = partial(dyn_func,
                       dt=dt,
                       m=mass,
@@ -153,12 +260,175 @@ class iLQRMPCController(AbstractController):
         self.iLQR.set_start(x)
 
     def init(self, x0):
+        x = self.ilqr_state(x0)
+        self.stop()
+        self.iLQR.set_start(x)
+        if self.warm_start is not None:
+            self.compute_warm_start(x0)
+        else:
+            self.compute_initial_guess(verbose=False)
+        self.reset_solver_stats()
+        if self.asynchronous:
+            self._start_worker(x)
+
+    def _start_worker(self, x):
+        # the initial guess is the first solution, valid from t=0
+        self._measurement = (x, 0.0)
+        self._solution = (0.0, self.x_trj, self.u_trj, self.K_trj)
+        self._new_measurement.clear()
+        self._run_worker()
+
+    def _run_worker(self):
+        # (re)start the solver thread on the stored measurement and solution
+        self._stop_worker.clear()
+        self._worker = threading.Thread(target=self._solver_loop,
+                                        daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        '''
+        stop the solver thread of the asynchronous mode
+        (does nothing if no solver thread is running)
+        '''
+        if self._worker is not None:
+            self._stop_worker.set()
+            self._new_measurement.set()
+            self._worker.join()
+            self._worker = None
+
+    def _solver_loop(self):
+        while not self._stop_worker.is_set():
+            self._new_measurement.wait()
+            self._new_measurement.clear()
+            if self._stop_worker.is_set():
+                break
+            with self._lock:
+                state, t = self._measurement
+            t_prev, _, u_prev, _ = self._solution
+
+            # shift the previous solution to the time of the measurement
+            n_shift = int(round((t - t_prev) / self.dt))
+            n_shift = min(max(n_shift, 0), len(u_prev) - 1)
+            init_u_trj = np.concatenate((u_prev[n_shift:],
+                                         np.repeat(u_prev[-1:], n_shift,
+                                                   axis=0)))
+            x_trj, u_trj = self._solve(state, init_u_trj, shift=False)
+
+            # replace the whole solution at once, get_control_output reads
+            # it without waiting for the solver
+            self._solution = (t, x_trj, u_trj, self.iLQR.K_trj)
+
+    def reset_solver_stats(self):
+        '''
+        reset the statistics of the online optimization
+
+        The statistics are stored in the dictionary self.solver_stats with
+        the entries
+
+        - n_solves: number of optimizations (one per call of
+          get_control_output, or per solve of the asynchronous solver)
+        - iterations: iterations used in the last optimization
+        - solve_time: wall clock time of the last optimization [s]
+        - max_solve_time: longest optimization so far [s]
+        - total_iterations: iterations used in all optimizations
+        - total_solve_time: wall clock time of all optimizations [s]
+        - deadline_misses: number of optimizations which took longer
+          than the deadline (always 0 if no deadline is set)
+        '''
+        self.solver_stats = {"n_solves": 0,
+                             "iterations": 0,
+                             "solve_time": 0.0,
+                             "max_solve_time": 0.0,
+                             "total_iterations": 0,
+                             "total_solve_time": 0.0,
+                             "deadline_misses": 0}
+
+    def ilqr_state(self, x0):
+        '''
+        convert a pendulum state to the state representation of the
+        iLQR optimization
+
+        Parameters
+        ----------
+        x0 : array-like, shape=(2,)
+            pendulum state [position, velocity]
+
+        Returns
+        -------
+        x : array-like, shape=(n_x,)
+            [position, velocity] for n_x=2,
+            [cos(position), sin(position), velocity] for n_x=3
+        '''
         if self.n_x == 2:
             x = np.copy(x0)
         elif self.n_x == 3:
             x = np.array([np.cos(x0[0]), np.sin(x0[0]), x0[1]])
-        self.iLQR.set_start(x)
-        self.compute_initial_guess(verbose=False)
+        return x
+
+    def get_model_parameters(self):
+        '''
+        pendulum parameters of the controller model
+
+        Returns
+        -------
+        parameters : array-like, shape=(6,)
+            [mass, length, damping, coulomb_friction, gravity, inertia]
+        '''
+        return np.array([self.mass, self.length, self.damping,
+                         self.coulomb_friction, self.gravity, self.inertia])
+
+    def warm_start_settings(self):
+        '''
+        settings which have to match for the solutions of a warm start
+        library to be valid for this controller
+        (horizon, time step, state representation, integrator, goal,
+        cost weights and torque limit)
+
+        Returns
+        -------
+        settings : dict
+        '''
+        if self.goal is None:
+            raise ValueError("Set a goal before using a warm start library.")
+        return {"n": self.N,
+                "dt": self.dt,
+                "n_x": self.n_x,
+                "dynamics": self.dynamics,
+                "goal": [float(g) for g in self.goal],
+                "sCu": self.sCu,
+                "sCp": self.sCp,
+                "sCv": self.sCv,
+                "sCen": self.sCen,
+                "fCp": self.fCp,
+                "fCv": self.fCv,
+                "fCen": self.fCen,
+                "torque_limit": (np.inf if self.torque_limit is None
+                                 else self.torque_limit)}
+
+    def compute_warm_start(self, x0):
+        '''
+        initial guess from the closest solution in the warm start library,
+        refined with warm_start_iter iLQR iterations
+
+        Parameters
+        ----------
+        x0 : array-like, shape=(2,)
+            start state [position, velocity]
+        '''
+        self.warm_start.check_settings(self.warm_start_settings())
+        x_trj, u_trj, _ = self.warm_start.query(x0,
+                                                self.get_model_parameters())
+        self.iLQR.set_start(self.ilqr_state(x0))
+        (self.x_trj, self.u_trj,
+         cost_trace, regu_trace,
+         redu_ratio_trace,
+         redu_trace) = self.iLQR.run_ilqr(init_u_trj=u_trj,
+                                          init_x_trj=None,
+                                          max_iter=self.warm_start_iter,
+                                          regu_init=100,
+                                          break_cost_redu=1e-6,
+                                          alphas=self.alphas)
+        self.K_trj = self.iLQR.K_trj
 
     def load_initial_guess(self, filepath="Pendulum_data/trajectory.csv",
                            verbose=True):
@@ -236,7 +506,9 @@ class iLQRMPCController(AbstractController):
                                           init_x_trj=None,
                                           max_iter=500,
                                           regu_init=100,
-                                          break_cost_redu=1e-6)
+                                          break_cost_redu=1e-6,
+                                          alphas=self.alphas)
+        self.K_trj = self.iLQR.K_trj
         self.x_traj = self.x_trj[:self.N]
         self.u_traj = self.u_trj[:self.N]
         if verbose:
@@ -251,6 +523,12 @@ class iLQRMPCController(AbstractController):
         x : array-like
             goal state for the pendulum
         """
+        # the solver thread must not run while the costs are replaced,
+        # it is restarted with the new costs afterwards
+        restart_worker = self._worker is not None
+        self.stop()
+
+        self.goal = np.copy(x)
         if self.n_x == 2:
             s_cost_func = pendulum_swingup_stage_cost
             f_cost_func = pendulum_swingup_final_cost
@@ -284,7 +562,12 @@ class iLQRMPCController(AbstractController):
 
         self.iLQR.set_stage_cost(s_cost)
         self.iLQR.set_final_cost(f_cost)
-        self.iLQR.init_derivatives()
+        self.iLQR.init_derivatives(**self._derivative_kwargs)
+
+        if restart_worker:
+            # re-solve the latest measurement with the new goal
+            self._new_measurement.set()
+            self._run_worker()
 
     def get_control_output(self, meas_pos, meas_vel,
                            meas_tau=0, meas_time=0):
@@ -302,7 +585,8 @@ class iLQRMPCController(AbstractController):
             (not used)
         meas_time : float, default=0
             the collapsed time [s]
-            (not used)
+            (only used in asynchronous mode to select the time step of the
+            most recent solution)
 
         Returns
         -------
@@ -325,20 +609,68 @@ class iLQRMPCController(AbstractController):
             state = np.asarray([np.cos(pos),
                                 np.sin(pos),
                                 vel])
+
+        if self._worker is not None:
+            u = self._feedback_control(state, meas_time)
+        else:
+            self.x_trj, self.u_trj = self._solve(state, self.u_trj,
+                                                 shift=True)
+            self.K_trj = self.iLQR.K_trj
+            u = self.u_trj[0]
+
+        # since this is a pure torque controller,
+        # set pos_des and vel_des to None
+        des_pos = None
+        des_vel = None
+
+        return des_pos, des_vel, u
+
+    def _solve(self, state, init_u_trj, shift):
         self.iLQR.set_start(state)
-        (self.x_trj, self.u_trj,
+        t0 = time.perf_counter()
+        (x_trj, u_trj,
          cost_trace, regu_trace,
          redu_ratio_trace,
-         redu_trace) = self.iLQR.run_ilqr(init_u_trj=self.u_trj,
+         redu_trace) = self.iLQR.run_ilqr(init_u_trj=init_u_trj,
                                           init_x_trj=None,
-                                          shift=True,
+                                          shift=shift,
                                           max_iter=self.max_iter,
                                           regu_init=100,
-                                          break_cost_redu=self.break_cost_redu)
+                                          break_cost_redu=self.break_cost_redu,
+                                          alphas=self.alphas,
+                                          deadline=self.deadline)
+        solve_time = time.perf_counter() - t0
 
-        # since this is a pure torque controller,
-        # set pos_des and vel_des to None
-        des_pos = None
-        des_vel = None
+        # solver statistics, the cost trace has one entry per iteration
+        # in addition to the initial cost
+        stats = self.solver_stats
+        stats["n_solves"] += 1
+        stats["iterations"] = len(cost_trace) - 1
+        stats["solve_time"] = solve_time
+        stats["max_solve_time"] = max(stats["max_solve_time"], solve_time)
+        stats["total_iterations"] += stats["iterations"]
+        stats["total_solve_time"] += solve_time
+        if self.deadline is not None and solve_time > self.deadline:
+            stats["deadline_misses"] += 1
+        return x_trj, u_trj
+
+    def _feedback_control(self, state, meas_time):
+        # feedforward and feedback from the most recent solution
+        t0, x_trj, u_trj, K_trj = self._solution
+        n = int(round((meas_time - t0) / self.dt))
+        n = min(max(n, 0), len(u_trj) - 1)
+        u = np.array(u_trj[n], dtype=float)
+        if K_trj is not None:
+            dx = state - x_trj[n]
+            if self.n_x == 2:
+                dx[0] = (dx[0] + np.pi) % (2*np.pi) - np.pi
+            u += K_trj[n].dot(dx)
+        if self.torque_limit is not None:
+            u = np.clip(u, -self.torque_limit, self.torque_limit)
 
-        return des_pos, des_vel, self.u_trj[0]
+        # hand the measurement to the solver thread only after the control
+        # output is computed, so that the woken solver does not delay it
+        with self._lock:
+            self._measurement = (state, meas_time)
+        self._new_measurement.set()
+        return u
@@ -4,12 +4,16 @@ Unit Tests
 """
 
 
+import os
+import tempfile
+import time
 import unittest
 import numpy as np
 
 from simple_pendulum.model.pendulum_plant import PendulumPlant
 from simple_pendulum.simulation.simulation import Simulator
 from simple_pendulum.controllers.ilqr.iLQR_MPC_controller import iLQRMPCController
+from simple_pendulum.controllers.ilqr.warm_start_library import WarmStartLibrary
 
 
 class Test(unittest.TestCase):
@@ -60,7 +64,8 @@ class Test(unittest.TestCase):
                                        fCv=1.0,
                                        fCen=80.0,
                                        dynamics="runge_kutta",
-                                       n_x=n_x)
+                                       n_x=n_x,
+                                       cache_dir=None)
 
         controller.set_goal(goal)
         controller.init(x0=x0)
@@ -129,7 +134,8 @@ class Test(unittest.TestCase):
                                        fCv=1.0,
                                        fCen=80.0,
                                        dynamics="runge_kutta",
-                                       n_x=n_x)
+                                       n_x=n_x,
+                                       cache_dir=None)
 
         controller.set_goal(goal)
         controller.init(x0=x0)
@@ -153,3 +159,209 @@ class Test(unittest.TestCase):
                       "final state: ", X[-1])
 
         self.assertTrue(swingup_success)
+
+    def test_2_iLQR_MPC_swingup_analytic(self):
+        mass = 0.57288
+        length = 0.5
+        damping = 0.15
+        gravity = 9.81
+        coulomb_fric = 0.0
+        torque_limit = 10.0
+        inertia = mass*length*length
+
+        pendulum = PendulumPlant(mass=mass,
+                                 length=length,
+                                 damping=damping,
+                                 gravity=gravity,
+                                 coulomb_fric=coulomb_fric,
+                                 inertia=inertia,
+                                 torque_limit=torque_limit)
+
+        sim = Simulator(plant=pendulum)
+
+        dt = 0.02
+        t_final = 10.0
+        x0 = np.array([0.0, 0.0])
+        goal = np.array([np.pi, 0])
+
+        controller = iLQRMPCController(mass=mass,
+                                       length=length,
+                                       damping=damping,
+                                       coulomb_friction=coulomb_fric,
+                                       gravity=gravity,
+                                       inertia=inertia,
+                                       dt=dt,
+                                       n=50,  # horizon size
+                                       max_iter=1,
+                                       break_cost_redu=1e-1,
+                                       sCu=1.0,
+                                       sCp=10.0,
+                                       sCv=1.0,
+                                       sCen=1.0,
+                                       fCp=10.0,
+                                       fCv=1.0,
+                                       fCen=80.0,
+                                       dynamics="runge_kutta",
+                                       n_x=3,
+                                       backend="analytic")
+
+        controller.set_goal(goal)
+        controller.init(x0=x0)
+
+        T, X, U = sim.simulate(t0=0.0,
+                               x0=x0.copy(),
+                               tf=t_final,
+                               dt=dt,
+                               controller=controller,
+                               integrator="runge_kutta")
+
+        swingup_success = True
+        if np.abs((X[-1][0] % (2*np.pi)) - np.pi) > self.epsilon:
+            if np.abs(X[-1][1]) > self.epsilon:
+                swingup_success = False
+                print("ilqr MPC Controller (analytic) did not swingup",
+                      "final state: ", X[-1])
+
+        self.assertTrue(swingup_success)
+
+    def test_3_iLQR_MPC_deadline(self):
+        controller = iLQRMPCController(mass=0.57288,
+                                       length=0.5,
+                                       damping=0.15,
+                                       coulomb_friction=0.0,
+                                       gravity=9.81,
+                                       inertia=0.57288*0.5*0.5,
+                                       dt=0.02,
+                                       n=50,
+                                       max_iter=1000,
+                                       break_cost_redu=0.0,
+                                       n_x=3,
+                                       backend="analytic",
+                                       deadline=0.02)
+        controller.set_goal(np.array([np.pi, 0]))
+        controller.init(x0=np.array([0.0, 0.0]))
+
+        for _ in range(5):
+            controller.get_control_output(0.1, 0.0)
+        stats = controller.solver_stats
+        self.assertEqual(stats["n_solves"], 5)
+        # the deadline stops the optimization long before max_iter
+        self.assertTrue(1 <= stats["iterations"] < 1000)
+        # at least one iteration per solve, even if it misses the deadline
+        self.assertTrue(stats["total_iterations"] >= stats["n_solves"])
+
+    def test_4_iLQR_MPC_asynchronous(self):
+        controller = iLQRMPCController(mass=0.57288,
+                                       length=0.5,
+                                       damping=0.15,
+                                       coulomb_friction=0.0,
+                                       gravity=9.81,
+                                       inertia=0.57288*0.5*0.5,
+                                       dt=0.02,
+                                       n=50,
+                                       max_iter=1,
+                                       break_cost_redu=1e-1,
+                                       n_x=3,
+                                       backend="analytic",
+                                       asynchronous=True)
+        controller.set_goal(np.array([np.pi, 0]))
+        controller.init(x0=np.array([0.0, 0.0]))
+        u_trj = np.copy(controller.u_trj)
+
+        # on the initial guess the output is the feedforward torque
+        _, _, u = controller.get_control_output(0.0, 0.0, meas_time=0.0)
+        self.assertTrue(np.allclose(u, u_trj[0]))
+
+        # the solver thread re-solves from the measurement
+        for _ in range(500):
+            if controller.solver_stats["n_solves"] > 0:
+                break
+            time.sleep(0.01)
+        self.assertTrue(controller.solver_stats["n_solves"] > 0)
+
+        _, _, u = controller.get_control_output(0.1, 0.5, meas_time=0.1)
+        self.assertTrue(np.all(np.isfinite(u)))
+        controller.stop()
+        self.assertIsNone(controller._worker)
+
+    def test_5_iLQR_MPC_warm_start_library(self):
+        def make_controller(**kwargs):
+            controller = iLQRMPCController(mass=0.57288,
+                                           length=0.5,
+                                           damping=0.15,
+                                           coulomb_friction=0.0,
+                                           gravity=9.81,
+                                           inertia=0.57288*0.5*0.5,
+                                           dt=0.02,
+                                           n=50,
+                                           n_x=3,
+                                           backend="analytic",
+                                           **kwargs)
+            controller.set_goal(np.array([np.pi, 0]))
+            return controller
+
+        library = WarmStartLibrary()
+        library.add_solutions(make_controller(),
+                              start_states=[[0.0, 0.0], [np.pi/2, 0.0]])
+        self.assertEqual(len(library), 2)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "library.npz")
+            library.save(path)
+            loaded = WarmStartLibrary.load(path)
+        self.assertEqual(loaded.settings, library.settings)
+
+        # the closest start state is found across the angle wrap
+        params = make_controller().get_model_parameters()
+        x_trj, u_trj, _ = loaded.query([2*np.pi + 0.1, 0.0], params)
+        self.assertTrue(np.allclose(u_trj, library.u_trjs[0]))
+
+        controller = make_controller(warm_start=loaded, warm_start_iter=5)
+        controller.init(x0=np.array([0.05, 0.0]))
+        self.assertEqual(controller.u_trj.shape, library.u_trjs[0].shape)
+
+        # solutions for other cost weights are rejected
+        controller = make_controller(warm_start=loaded, fCp=1.0)
+        with self.assertRaises(ValueError):
+            controller.init(x0=np.array([0.0, 0.0]))
+
+    def test_6_iLQR_MPC_asynchronous_goal_change(self):
+        torque_limit = 0.5
+        controller = iLQRMPCController(mass=0.57288,
+                                       length=0.5,
+                                       damping=0.15,
+                                       coulomb_friction=0.0,
+                                       gravity=9.81,
+                                       inertia=0.57288*0.5*0.5,
+                                       dt=0.02,
+                                       n=50,
+                                       max_iter=1,
+                                       break_cost_redu=1e-1,
+                                       n_x=2,
+                                       backend="analytic",
+                                       asynchronous=True,
+                                       torque_limit=torque_limit)
+        controller.set_goal(np.array([np.pi, 0]))
+        controller.init(x0=np.array([0.0, 0.0]))
+
+        # the feedback term is clipped to the torque limit as well
+        _, _, u = controller.get_control_output(2.0, 5.0, meas_time=0.0)
+        self.assertTrue(np.all(np.abs(u) <= torque_limit))
+
+        # a new goal stops the solver thread and restarts it afterwards
+        worker = controller._worker
+        controller.set_goal(np.array([-np.pi, 0]))
+        self.assertFalse(worker.is_alive())
+        self.assertIsNotNone(controller._worker)
+        self.assertTrue(controller._worker.is_alive())
+        n_solves = controller.solver_stats["n_solves"]
+        for _ in range(500):
+            if controller.solver_stats["n_solves"] > n_solves:
+                break
+            time.sleep(0.01)
+        self.assertTrue(controller.solver_stats["n_solves"] > n_solves)
+
+        _, _, u = controller.get_control_output(0.1, 0.0, meas_time=0.02)
+        self.assertTrue(np.all(np.abs(u) <= torque_limit))
+        controller.stop()
+        self.assertIsNone(controller._worker)
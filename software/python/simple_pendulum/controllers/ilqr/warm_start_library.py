@@ -0,0 +1,226 @@
+"""
+Warm Start Library
+==================
+"""
+
+
+import json
+import numpy as np
+
+
+class WarmStartLibrary():
+    """
+    Library of converged iLQR solutions for the iLQR MPC controller.
+    The solutions are indexed by their start state and the pendulum
+    parameters of the controller model, so that the solution of the closest
+    problem can be used as initial guess.
+    """
+
+    parameter_names = ["mass", "length", "damping", "coulomb_friction",
+                       "gravity", "inertia"]
+
+    def __init__(self, settings=None, velocity_weight=0.2,
+                 parameter_weight=1.0):
+        """
+        Library of converged iLQR solutions for the iLQR MPC controller.
+
+        Parameters
+        ----------
+        settings : dict, default=None
+            settings of the controllers the solutions are computed with
+            (see iLQRMPCController.warm_start_settings), solutions are only
+            valid for controllers with the same settings.
+            If None, the settings of the first controller which adds
+            solutions are used.
+        velocity_weight : float, default=0.2
+            weight of the velocity in the distance of two start states.
+            The position enters the distance as [cos(pos), sin(pos)].
+        parameter_weight : float, default=1.0
+            weight of the relative deviation of the pendulum parameters
+            in the distance
+        """
+        self.settings = settings
+        self.velocity_weight = velocity_weight
+        self.parameter_weight = parameter_weight
+
+        self.states = np.zeros((0, 2))
+        self.parameters = np.zeros((0, len(self.parameter_names)))
+        self.x_trjs = None
+        self.u_trjs = None
+        self._tree = None
+
+    def __len__(self):
+        return self.states.shape[0]
+
+    def add(self, x0, parameters, x_trj, u_trj):
+        """
+        Add a solution to the library.
+
+        Parameters
+        ----------
+        x0 : array-like, shape=(2,)
+            start state [position, velocity] of the solution
+        parameters : array-like, shape=(6,)
+            pendulum parameters of the controller model
+            (see parameter_names)
+        x_trj : array-like, shape=(N, n_x)
+            state trajectory of the solution
+        u_trj : array-like, shape=(N-1, n_u)
+            control trajectory of the solution
+        """
+        x_trj = np.asarray(x_trj, dtype=float)[np.newaxis]
+        u_trj = np.asarray(u_trj, dtype=float)[np.newaxis]
+        if self.x_trjs is None:
+            self.x_trjs = x_trj
+            self.u_trjs = u_trj
+        else:
+            self.x_trjs = np.concatenate((self.x_trjs, x_trj))
+            self.u_trjs = np.concatenate((self.u_trjs, u_trj))
+        self.states = np.vstack((self.states, np.asarray(x0, dtype=float)))
+        self.parameters = np.vstack((self.parameters,
+                                     np.asarray(parameters, dtype=float)))
+        self._tree = None
+
+    def add_solutions(self, controller, start_states, verbose=False):
+        """
+        Compute iLQR solutions with the initial guess computation of a
+        controller and add them to the library. To cover a grid of
+        pendulum parameters, call this function with one controller per
+        parameter set.
+
+        Parameters
+        ----------
+        controller : iLQRMPCController
+            controller with the goal already set
+        start_states : array-like, shape=(M, 2)
+            start states [position, velocity]
+        verbose : bool, default=False
+            whether to print the progress
+        """
+        self.check_settings(controller.warm_start_settings())
+        parameters = controller.get_model_parameters()
+        for i, x0 in enumerate(np.atleast_2d(start_states)):
+            if verbose:
+                print("Warm start library: solution", i+1, "of",
+                      len(start_states))
+            controller.iLQR.set_start(controller.ilqr_state(x0))
+            controller.compute_initial_guess(verbose=False)
+            self.add(x0, parameters, controller.x_trj, controller.u_trj)
+
+    def check_settings(self, settings):
+        """
+        Check that solutions computed with the given controller settings
+        can be stored in (or taken from) this library.
+        If the library has no settings yet, the given settings are adopted.
+
+        Parameters
+        ----------
+        settings : dict
+            controller settings (see iLQRMPCController.warm_start_settings)
+
+        Raises
+        ------
+        ValueError
+            if the settings do not match the settings of the library
+        """
+        if self.settings is None:
+            self.settings = settings
+            return
+        if set(settings.keys()) != set(self.settings.keys()):
+            raise ValueError("The controller settings do not match the "
+                             "settings of the warm start library.")
+        for key, value in settings.items():
+            if isinstance(value, str):
+                match = value == self.settings[key]
+            else:
+                match = np.allclose(value, self.settings[key])
+            if not match:
+                raise ValueError(f"The controller setting {key}={value} "
+                                 "does not match the warm start library "
+                                 f"({key}={self.settings[key]}).")
+
+    def _features(self, states, parameters):
+        states = np.atleast_2d(states)
+        parameters = np.atleast_2d(parameters)
+        return np.hstack((np.cos(states[:, :1]),
+                          np.sin(states[:, :1]),
+                          self.velocity_weight*states[:, 1:2],
+                          self.parameter_weight*parameters /
+                          self._parameter_scale))
+
+    def _build_tree(self):
+        # scipy.spatial is slow to import, only needed for queries
+        from scipy.spatial import cKDTree
+
+        # parameters are compared relative to their mean magnitude
+        scale = np.mean(np.abs(self.parameters), axis=0)
+        self._parameter_scale = np.where(scale > 0.0, scale, 1.0)
+        self._tree = cKDTree(self._features(self.states, self.parameters))
+
+    def query(self, x0, parameters):
+        """
+        Find the solution of the closest problem in the library.
+
+        Parameters
+        ----------
+        x0 : array-like, shape=(2,)
+            start state [position, velocity]
+        parameters : array-like, shape=(6,)
+            pendulum parameters of the controller model
+
+        Returns
+        -------
+        x_trj : array-like, shape=(N, n_x)
+            state trajectory of the closest solution
+        u_trj : array-like, shape=(N-1, n_u)
+            control trajectory of the closest solution
+        distance : float
+            distance of the problems
+        """
+        if len(self) == 0:
+            raise ValueError("The warm start library is empty.")
+        if self._tree is None:
+            self._build_tree()
+        distance, i = self._tree.query(self._features(x0, parameters)[0])
+        return np.copy(self.x_trjs[i]), np.copy(self.u_trjs[i]), distance
+
+    def save(self, path):
+        """
+        Save the library to a .npz file.
+
+        Parameters
+        ----------
+        path : string
+            path of the file
+        """
+        np.savez(path,
+                 states=self.states,
+                 parameters=self.parameters,
+                 x_trjs=self.x_trjs,
+                 u_trjs=self.u_trjs,
+                 settings=json.dumps(self.settings),
+                 weights=[self.velocity_weight, self.parameter_weight])
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a library from a .npz file.
+
+        Parameters
+        ----------
+        path : string
+            path of the file
+
+        Returns
+        -------
+        library : WarmStartLibrary
+        """
+        with np.load(path) as data:
+            library = cls(settings=json.loads(str(data["settings"])),
+                          velocity_weight=float(data["weights"][0]),
+                          parameter_weight=float(data["weights"][1]))
+            library.states = data["states"]
+            library.parameters = data["parameters"]
+            library.x_trjs = data["x_trjs"]
+            library.u_trjs = data["u_trjs"]
+        return library
@@ -0,0 +1,4 @@
+"""
+Lookup Table Controller
+=======================
+"""
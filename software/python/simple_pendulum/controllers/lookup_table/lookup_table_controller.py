@@ -0,0 +1,358 @@
+"""
+Lookup Table Controller
+=======================
+
+Controller which serves the torques of another controller from a table
+sampled on a (position, velocity) grid. The table is computed once, e.g.
+from a learned policy or an MPC controller, and can be stored on disk.
+At runtime the torques are interpolated bilinearly or bicubically in
+constant time and only numpy is needed.
+"""
+
+
+# Other imports
+import math
+import numpy as np
+
+# Local imports
+from simple_pendulum.controllers.abstract_controller import AbstractController
+
+
+# basis matrix of the Catmull-Rom spline, the cubic through p1 and p2 with
+# the slopes (p2-p0)/2 and (p3-p1)/2 is [1, t, t^2, t^3] @ CR @ p
+CR = 0.5*np.array([[0., 2., 0., 0.],
+                   [-1., 0., 1., 0.],
+                   [2., -5., 4., -1.],
+                   [-1., 3., -3., 1.]])
+
+
+def wrap_position(pos, center=0.0):
+    """
+    Map positions to the interval [center - pi, center + pi).
+
+    Parameters
+    ----------
+    pos : float or array-like
+        positions [rad]
+    center : float, default=0.0
+        center of the interval [rad]
+
+    Returns
+    -------
+    pos : float or array-like
+        wrapped positions [rad]
+    """
+    return np.mod(pos - center + np.pi, 2*np.pi) + center - np.pi
+
+
+def create_lookup_table(controller,
+                        position_range=[-np.pi, np.pi],
+                        velocity_range=[-8., 8.],
+                        samples_per_dim=201,
+                        use_symmetry=False,
+                        meas_time=0.0,
+                        save_path=None):
+    """
+    Sample the torques of a controller on a regular (position, velocity)
+    grid. All grid points are evaluated with one call of
+    get_control_output_batch.
+
+    Parameters
+    ----------
+    controller : AbstractController
+        the controller to be sampled
+    position_range : array-like, shape=(2,), default=[-np.pi, np.pi]
+        position limits of the grid [rad]. If the range covers a full
+        rotation, the table is periodic in the position. Not used if
+        use_symmetry is True.
+    velocity_range : array-like, shape=(2,), default=[-8., 8.]
+        velocity limits of the grid [rad/s]
+    samples_per_dim : int or array-like, shape=(2,), default=201
+        number of grid points in position and velocity direction
+    use_symmetry : bool, default=False
+        whether to use the left/right symmetry of the pendulum like the
+        SacController, i.e. tau(-pos, -vel) = -tau(pos, vel). The table
+        then only covers the positions [0, pi] and needs half the samples
+        for the same resolution.
+    meas_time : float, default=0.0
+        time passed to the controller [s]
+    save_path : string, default=None
+        path of a npz file in which the table is stored. The table is not
+        stored if None.
+
+    Returns
+    -------
+    table : dict
+        "torques" : array-like, shape=(n_pos, n_vel), the sampled torques,
+        nan where the controller returns None
+        "position_range", "velocity_range" : array-like, shape=(2,)
+        "use_symmetry" : bool
+    """
+    n_pos, n_vel = np.broadcast_to(samples_per_dim, (2,))
+    if use_symmetry:
+        position_range = [0., np.pi]
+    positions = np.linspace(position_range[0], position_range[1], n_pos)
+    velocities = np.linspace(velocity_range[0], velocity_range[1], n_vel)
+
+    pos_grid, vel_grid = np.meshgrid(positions, velocities, indexing="ij")
+    _, _, u = controller.get_control_output_batch(meas_pos=pos_grid.ravel(),
+                                                  meas_vel=vel_grid.ravel(),
+                                                  meas_time=meas_time)
+
+    table = {"torques": np.asarray(u, dtype=float).reshape(pos_grid.shape),
+             "position_range": np.asarray(position_range, dtype=float),
+             "velocity_range": np.asarray(velocity_range, dtype=float),
+             "use_symmetry": bool(use_symmetry)}
+    if save_path is not None:
+        np.savez(save_path, **table)
+    return table
+
+
+def load_lookup_table(path):
+    """
+    Load a lookup table which has been stored with create_lookup_table.
+
+    Parameters
+    ----------
+    path : string
+        path to the npz file
+
+    Returns
+    -------
+    table : dict
+        see create_lookup_table
+    """
+    with np.load(path) as data:
+        return {"torques": np.array(data["torques"], dtype=float),
+                "position_range": np.array(data["position_range"]),
+                "velocity_range": np.array(data["velocity_range"]),
+                "use_symmetry": bool(data["use_symmetry"])}
+
+
+class LookupTableController(AbstractController):
+    """
+    Controller which interpolates the torques of a lookup table.
+    """
+    def __init__(self,
+                 table,
+                 interpolation="bilinear",
+                 torque_limit=np.inf):
+        """
+        Controller which interpolates the torques of a lookup table.
+
+        Parameters
+        ----------
+        table : dict or string
+            lookup table from create_lookup_table or the path to a
+            stored table
+        interpolation : string, default="bilinear"
+            "bilinear" or "bicubic" (Catmull-Rom spline)
+        torque_limit : float, default=np.inf
+            the interpolated torques are clipped to this limit [Nm]
+
+        States outside of the velocity range of the table get the torque
+        of the closest state in the table. If the interpolated torque is
+        nan (the sampled controller returned None close to the state),
+        get_control_output returns None as torque.
+        """
+        if not isinstance(table, dict):
+            table = load_lookup_table(table)
+        if interpolation not in ["bilinear", "bicubic"]:
+            raise NotImplementedError(
+                f"Sorry, interpolation {interpolation} is not implemented.")
+
+        self.torques = np.asarray(table["torques"], dtype=float)
+        self.use_symmetry = bool(table["use_symmetry"])
+        self.interpolation = interpolation
+        self.torque_limit = float(torque_limit)
+
+        n_pos, n_vel = self.torques.shape
+        p0, p1 = np.asarray(table["position_range"], dtype=float)
+        v0, v1 = np.asarray(table["velocity_range"], dtype=float)
+        self.pos_min, self.vel_min = float(p0), float(v0)
+        self.pos_max, self.vel_max = float(p1), float(v1)
+        # positions are wrapped to the interval around the table
+        self.pos_center = (0. if self.use_symmetry
+                           else 0.5*(self.pos_min + self.pos_max))
+        self.pos_scale = (n_pos - 1) / (self.pos_max - self.pos_min)
+        self.vel_scale = (n_vel - 1) / (self.vel_max - self.vel_min)
+        self.max_cell = (n_pos - 2, n_vel - 2)
+        self.periodic = (not self.use_symmetry and
+                         np.isclose(self.pos_max - self.pos_min, 2*np.pi))
+
+        if self.interpolation == "bicubic":
+            self.coefficients = self._bicubic_coefficients()
+
+        # python lists for the single state lookups in get_control_output,
+        # indexing them is much faster than indexing numpy arrays
+        if self.interpolation == "bilinear":
+            self._cells = self.torques.tolist()
+        else:
+            self._cells = self.coefficients.reshape(
+                self.coefficients.shape[:2] + (16,)).tolist()
+
+    def _bicubic_coefficients(self):
+        # one ring of ghost points around the table, wrapped in periodic
+        # position direction and linearly extrapolated otherwise
+        T = self.torques
+        if self.periodic:
+            # the first and last row belong to the same position
+            T = np.concatenate((T[-2:-1], T, T[1:2]), axis=0)
+        else:
+            T = np.concatenate((2*T[:1] - T[1:2], T, 2*T[-1:] - T[-2:-1]),
+                               axis=0)
+        T = np.concatenate((2*T[:, :1] - T[:, 1:2], T,
+                            2*T[:, -1:] - T[:, -2:-1]), axis=1)
+        # coefficients[i, j] @ [1, t_vel, ...] evaluated at [1, t_pos, ...]
+        # is the torque in the grid cell (i, j)
+        # windows[i, j] = T[i:i+4, j:j+4]
+        n, m = T.shape
+        rows = np.arange(n - 3)[:, np.newaxis] + np.arange(4)
+        cols = np.arange(m - 3)[:, np.newaxis] + np.arange(4)
+        windows = T[rows[:, np.newaxis, :, np.newaxis],
+                    cols[np.newaxis, :, np.newaxis, :]]
+        return np.einsum("ab,ijbc,dc->ijad", CR, windows, CR)
+
+    def _grid_coordinates(self, pos, vel):
+        """
+        cell indices and local coordinates in [0, 1] of arrays of states
+        """
+        pos = wrap_position(pos, self.pos_center)
+        sign = 1.0
+        if self.use_symmetry:
+            sign = np.where(pos < 0., -1., 1.)
+            pos = pos*sign
+            vel = vel*sign
+        x = np.clip((pos - self.pos_min)*self.pos_scale,
+                    0., self.max_cell[0] + 1)
+        y = np.clip((vel - self.vel_min)*self.vel_scale,
+                    0., self.max_cell[1] + 1)
+        i = np.minimum(np.floor(x).astype(int), self.max_cell[0])
+        j = np.minimum(np.floor(y).astype(int), self.max_cell[1])
+        return i, j, x - i, y - j, sign
+
+    def _interpolate(self, i, j, tx, ty):
+        if self.interpolation == "bilinear":
+            T = self.torques
+            return ((1. - tx)*((1. - ty)*T[i, j] + ty*T[i, j+1]) +
+                    tx*((1. - ty)*T[i+1, j] + ty*T[i+1, j+1]))
+        C = self.coefficients[i, j]
+        px = np.stack((np.ones_like(tx), tx, tx*tx, tx*tx*tx), axis=-1)
+        py = np.stack((np.ones_like(ty), ty, ty*ty, ty*ty*ty), axis=-1)
+        return np.einsum("...a,...ab,...b->...", px, C, py)
+
+    def get_control_output(self, meas_pos, meas_vel, meas_tau=0, meas_time=0):
+        """
+        The function to compute the control input for the pendulum actuator
+
+        Parameters
+        ----------
+        meas_pos : float
+            the position of the pendulum [rad]
+        meas_vel : float
+            the velocity of the pendulum [rad/s]
+        meas_tau : float
+            the meastured torque of the pendulum [Nm]
+            (not used)
+        meas_time : float
+            the collapsed time [s]
+            (not used)
+
+        Returns
+        -------
+        des_pos : float
+            the desired position of the pendulum [rad]
+            (not used, returns None)
+        des_vel : float
+            the desired velocity of the pendulum [rad/s]
+            (not used, returns None)
+        des_tau : float
+            the torque supposed to be applied by the actuator [Nm]
+        """
+        # np.squeeze takes longer than the whole interpolation
+        if type(meas_pos) is not float:
+            meas_pos = float(np.squeeze(meas_pos))
+        if type(meas_vel) is not float:
+            meas_vel = float(np.squeeze(meas_vel))
+        pos = meas_pos
+        vel = meas_vel
+
+        pos = ((pos - self.pos_center + math.pi) % (2*math.pi) +
+               self.pos_center - math.pi)
+        sign = 1.
+        if self.use_symmetry and pos < 0.:
+            pos, vel, sign = -pos, -vel, -1.
+        x = min(max((pos - self.pos_min)*self.pos_scale, 0.),
+                self.max_cell[0] + 1)
+        y = min(max((vel - self.vel_min)*self.vel_scale, 0.),
+                self.max_cell[1] + 1)
+        i = min(int(x), self.max_cell[0])
+        j = min(int(y), self.max_cell[1])
+        tx = x - i
+        ty = y - j
+
+        if self.interpolation == "bilinear":
+            row0 = self._cells[i]
+            row1 = self._cells[i+1]
+            des_tau = ((1. - tx)*((1. - ty)*row0[j] + ty*row0[j+1]) +
+                       tx*((1. - ty)*row1[j] + ty*row1[j+1]))
+        else:
+            c = self._cells[i][j]
+            # horner scheme in both directions
+            c0 = c[0] + ty*(c[1] + ty*(c[2] + ty*c[3]))
+            c1 = c[4] + ty*(c[5] + ty*(c[6] + ty*c[7]))
+            c2 = c[8] + ty*(c[9] + ty*(c[10] + ty*c[11]))
+            c3 = c[12] + ty*(c[13] + ty*(c[14] + ty*c[15]))
+            des_tau = c0 + tx*(c1 + tx*(c2 + tx*c3))
+        des_tau *= sign
+
+        if math.isnan(des_tau):
+            des_tau = None
+        else:
+            des_tau = min(max(des_tau, -self.torque_limit),
+                          self.torque_limit)
+
+        # since this is a pure torque controller,
+        # set pos_des and vel_des to None
+        des_pos = None
+        des_vel = None
+
+        return des_pos, des_vel, des_tau
+
+    def get_control_output_batch(self, meas_pos, meas_vel, meas_tau=None,
+                                 meas_time=0):
+        """
+        Vectorized version of get_control_output for many states,
+        see AbstractController.get_control_output_batch.
+
+        Parameters
+        ----------
+        meas_pos : array-like, shape=(M,)
+            the positions of the pendulums [rad]
+        meas_vel : array-like, shape=(M,)
+            the velocities of the pendulums [rad/s]
+        meas_tau : array-like, shape=(M,), default=None
+            the meastured torques of the pendulums [Nm]
+            (not used)
+        meas_time : float, default=0
+            the collapsed time [s]
+            (not used)
+
+        Returns
+        -------
+        des_pos : array-like, shape=(M,)
+            (not used, nan)
+        des_vel : array-like, shape=(M,)
+            (not used, nan)
+        des_tau : array-like, shape=(M,)
+            the torques supposed to be applied by the actuators [Nm]
+        """
+        pos = np.asarray(meas_pos, dtype=float).ravel()
+        vel = np.asarray(meas_vel, dtype=float).ravel()
+
+        i, j, tx, ty, sign = self._grid_coordinates(pos, vel)
+        des_tau = np.clip(sign*self._interpolate(i, j, tx, ty),
+                          -self.torque_limit, self.torque_limit)
+
+        nan = np.full_like(des_tau, np.nan)
+        return nan, nan, des_tau
@@ -0,0 +1,107 @@
+"""
+Unit Tests
+==========
+"""
+
+
+import os
+import tempfile
+import unittest
+import numpy as np
+
+from simple_pendulum.model.pendulum_plant import PendulumPlant
+from simple_pendulum.simulation.simulation import Simulator
+from simple_pendulum.controllers.abstract_controller import AbstractController
+from simple_pendulum.controllers.lqr.lqr_controller import LQRController
+from simple_pendulum.controllers.lookup_table.lookup_table_controller import \
+    LookupTableController, create_lookup_table
+
+
+class SmoothController(AbstractController):
+    """
+    controller with a smooth, periodic and odd symmetric torque
+    """
+    def get_control_output(self, meas_pos, meas_vel, meas_tau=0,
+                           meas_time=0):
+        return None, None, np.sin(meas_pos)*np.cos(meas_vel)
+
+
+class Test(unittest.TestCase):
+
+    epsilon = 0.01
+
+    def test_0_interpolation(self):
+        pos = np.random.rand(500)*20 - 10
+        vel = np.random.rand(500)*6 - 3
+        reference = np.sin(pos)*np.cos(vel)
+
+        for use_symmetry in [False, True]:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "table.npz")
+                create_lookup_table(SmoothController(),
+                                    velocity_range=[-4., 4.],
+                                    samples_per_dim=41,
+                                    use_symmetry=use_symmetry,
+                                    save_path=path)
+                for interpolation, tolerance in [("bilinear", 1e-2),
+                                                 ("bicubic", 1e-3)]:
+                    with self.subTest(use_symmetry=use_symmetry,
+                                      interpolation=interpolation):
+                        controller = LookupTableController(
+                            path, interpolation=interpolation)
+                        _, _, u = controller.get_control_output_batch(pos,
+                                                                      vel)
+                        self.assertLess(np.max(np.abs(u - reference)),
+                                        tolerance)
+                        for i in range(10):
+                            _, _, tau = controller.get_control_output(pos[i],
+                                                                      vel[i])
+                            self.assertAlmostEqual(tau, u[i])
+
+    def test_1_LQR_table_stabilization(self):
+        mass = 0.57288
+        length = 0.5
+        damping = 0.15
+        gravity = 9.81
+        coulomb_fric = 0.0
+        torque_limit = 2.0
+        inertia = mass*length*length
+
+        pendulum = PendulumPlant(mass=mass,
+                                 length=length,
+                                 damping=damping,
+                                 gravity=gravity,
+                                 coulomb_fric=coulomb_fric,
+                                 inertia=inertia,
+                                 torque_limit=torque_limit)
+
+        lqr = LQRController(mass=mass,
+                            length=length,
+                            damping=damping,
+                            gravity=gravity,
+                            torque_limit=torque_limit)
+        table = create_lookup_table(lqr, samples_per_dim=201)
+        controller = LookupTableController(table,
+                                           interpolation="bicubic",
+                                           torque_limit=torque_limit)
+
+        # no torque where the lqr controller returns None
+        _, _, tau = controller.get_control_output(0.0, 0.0)
+        self.assertIsNone(tau)
+
+        sim = Simulator(plant=pendulum)
+        T, X, U = sim.simulate(t0=0.0,
+                               x0=[3.1, 0.0],
+                               tf=10.0,
+                               dt=0.01,
+                               controller=controller,
+                               integrator="runge_kutta")
+
+        stabilization_success = True
+        if np.abs((X[-1][0] % (2*np.pi)) - np.pi) > self.epsilon:
+            if np.abs(X[-1][1]) > self.epsilon:
+                stabilization_success = False
+                print("lookup table Controller did not stabilize",
+                      "final state: ", X[-1])
+
+        self.assertTrue(stabilization_success)
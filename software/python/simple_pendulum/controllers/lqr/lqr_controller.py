@@ -100,3 +100,46 @@ class LQRController(AbstractController):
         des_vel = None
 
         return des_pos, des_vel, u
+
+    def get_control_output_batch(self, meas_pos, meas_vel, meas_tau=None,
+                                 meas_time=0):
+        """
+        Vectorized version of get_control_output for many states,
+        see AbstractController.get_control_output_batch.
+
+        Parameters
+        ----------
+        meas_pos : array-like, shape=(M,)
+            the positions of the pendulums [rad]
+        meas_vel : array-like, shape=(M,)
+            the velocities of the pendulums [rad/s]
+        meas_tau : array-like, shape=(M,), default=None
+            the meastured torques of the pendulums [Nm]
+            (not used)
+        meas_time : float, default=0
+            the collapsed time [s]
+            (not used)
+
+        Returns
+        -------
+        des_pos : array-like, shape=(M,)
+            (not used, nan)
+        des_vel : array-like, shape=(M,)
+            (not used, nan)
+        des_tau : array-like, shape=(M,)
+            the torques supposed to be applied by the actuators [Nm]
+            nan where the torque limit is exceeded (None in
+            get_control_output)
+        """
+
+        pos = np.asarray(meas_pos, dtype=float).ravel()
+        vel = np.asarray(meas_vel, dtype=float).ravel()
+
+        th = pos + np.pi
+        th = (th + np.pi) % (2*np.pi) - np.pi
+
+        u = -(self.K[0, 0]*th + self.K[0, 1]*vel)
+        u[np.abs(u) > self.torque_limit] = np.nan
+
+        nan = np.full_like(u, np.nan)
+        return nan, nan, u
@@ -65,3 +65,16 @@ class Test(unittest.TestCase):
                       "final state: ", X[-1])
 
         self.assertTrue(stabilization_success)
+
+    def test_1_LQR_batch_output(self):
+        controller = LQRController(mass=0.57288, length=0.5, damping=0.15,
+                                   gravity=9.81, torque_limit=2.0)
+        pos = np.random.rand(200)*4*np.pi - 2*np.pi
+        vel = np.random.rand(200)*8 - 4
+        _, _, u_batch = controller.get_control_output_batch(pos, vel)
+        for i in range(len(pos)):
+            _, _, u = controller.get_control_output(pos[i], vel[i])
+            if u is None:
+                self.assertTrue(np.isnan(u_batch[i]))
+            else:
+                self.assertAlmostEqual(u, u_batch[i])
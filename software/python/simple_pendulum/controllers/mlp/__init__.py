@@ -0,0 +1,4 @@
+"""
+MLP Controller
+==============
+"""
@@ -0,0 +1,275 @@
+"""
+MLP Controller
+==============
+
+Controller which evaluates an exported policy network (multilayer
+perceptron) with numpy only. The weights are exported from a trained
+SAC or DDPG model with the functions in policy_export.py.
+"""
+
+
+# Other imports
+import math
+import numpy as np
+
+# Local imports
+from simple_pendulum.controllers.abstract_controller import AbstractController
+
+
+supported_activations = ["linear", "relu", "tanh"]
+
+
+def save_mlp_policy(save_path, weights, biases, activations,
+                    output_scale=1.0, output_offset=0.0,
+                    state_representation=2, wrap_position=True):
+    """
+    Store the layers of a policy network in a npz file.
+
+    Parameters
+    ----------
+    save_path : string
+        path of the npz file
+    weights : list of array-like, shape=(n_in, n_out)
+        weight matrices of the dense layers,
+        the output of a layer is activation(input @ weight + bias)
+    biases : list of array-like, shape=(n_out,)
+        bias vectors of the dense layers
+    activations : list of strings
+        activation functions of the layers, "linear", "relu" or "tanh"
+    output_scale : float, default=1.0
+    output_offset : float, default=0.0
+        the action is output_offset + output_scale * network output
+    state_representation : int, default=2
+        observation of the network, 2: [pos, vel],
+        3: [cos(pos), sin(pos), vel]
+    wrap_position : bool, default=True
+        whether the position is mapped to [-pi, pi] before it is passed
+        to the network
+    """
+    if not len(weights) == len(biases) == len(activations):
+        raise ValueError("weights, biases and activations must have the "
+                         "same length")
+    for activation in activations:
+        if activation not in supported_activations:
+            raise NotImplementedError(
+                f"Sorry, activation {activation} is not implemented.")
+
+    layers = {}
+    for i, (W, b) in enumerate(zip(weights, biases)):
+        layers[f"weight_{i}"] = np.asarray(W, dtype=np.float32)
+        layers[f"bias_{i}"] = np.asarray(b, dtype=np.float32).ravel()
+    np.savez(save_path,
+             activations=np.array(activations),
+             output_scale=float(output_scale),
+             output_offset=float(output_offset),
+             state_representation=int(state_representation),
+             wrap_position=bool(wrap_position),
+             **layers)
+
+
+class MLPController(AbstractController):
+    """
+    Controller which evaluates an exported policy network with numpy.
+    """
+    def __init__(self,
+                 model_path,
+                 torque_limit,
+                 use_symmetry=False):
+        """
+        Controller which evaluates an exported policy network with numpy.
+
+        Parameters
+        ----------
+        model_path : string
+            path to the npz file of the network, see save_mlp_policy
+        torque_limit : float
+            torque limit of the pendulum. The output of the model will be
+            scaled with this number
+        use_symmetry : bool, default=False
+            whether to use the left/right symmetry of the pendulum in the
+            same way as the SacController
+        """
+        with np.load(model_path) as data:
+            self.activations = [str(a) for a in data["activations"]]
+            self.weights = [data[f"weight_{i}"]
+                            for i in range(len(self.activations))]
+            self.biases = [data[f"bias_{i}"]
+                           for i in range(len(self.activations))]
+            self.output_scale = float(data["output_scale"])
+            self.output_offset = float(data["output_offset"])
+            self.state_representation = int(data["state_representation"])
+            self.wrap_position = bool(data["wrap_position"])
+        self.torque_limit = float(torque_limit)
+        self.use_symmetry = bool(use_symmetry)
+
+        if self.state_representation == 2:
+            # state is [th, vel]
+            self.low = np.array([-6*2*np.pi, -20])
+            self.high = np.array([6*2*np.pi, 20])
+        elif self.state_representation == 3:
+            # state is [cos(th), sin(th), vel]
+            self.low = np.array([-1., -1., -8.])
+            self.high = np.array([1., 1., 8.])
+        else:
+            raise NotImplementedError(
+                f"Sorry, state representation {self.state_representation} "
+                "is not implemented.")
+
+        # preallocated buffers for the single state evaluation, the
+        # network is evaluated in float32 like in the training frameworks
+        self.observation = np.zeros(self.weights[0].shape[0],
+                                    dtype=np.float32)
+        self.buffers = [np.zeros(b.shape, dtype=np.float32)
+                        for b in self.biases]
+
+    def forward(self, observations):
+        """
+        Evaluate the network for several observations.
+
+        Parameters
+        ----------
+        observations : array-like, shape=(M, n_in)
+
+        Returns
+        -------
+        actions : array-like, shape=(M, n_out)
+            scaled network outputs
+        """
+        out = np.asarray(observations, dtype=np.float32)
+        for W, b, activation in zip(self.weights, self.biases,
+                                    self.activations):
+            out = out @ W + b
+            if activation == "relu":
+                np.maximum(out, 0., out=out)
+            elif activation == "tanh":
+                np.tanh(out, out=out)
+        return self.output_offset + self.output_scale*out.astype(float)
+
+    def _forward_single(self):
+        # network output for self.observation without allocations
+        out = self.observation
+        for W, b, buffer, activation in zip(self.weights, self.biases,
+                                            self.buffers, self.activations):
+            np.dot(out, W, out=buffer)
+            np.add(buffer, b, out=buffer)
+            if activation == "relu":
+                np.maximum(buffer, 0., out=buffer)
+            elif activation == "tanh":
+                np.tanh(buffer, out=buffer)
+            out = buffer
+        return self.output_offset + self.output_scale*float(out[0])
+
+    def get_control_output(self, meas_pos, meas_vel, meas_tau=0, meas_time=0):
+        """
+        The function to compute the control input for the pendulum actuator
+
+        Parameters
+        ----------
+        meas_pos : float
+            the position of the pendulum [rad]
+        meas_vel : float
+            the velocity of the pendulum [rad/s]
+        meas_tau : float
+            the meastured torque of the pendulum [Nm]
+            (not used)
+        meas_time : float
+            the collapsed time [s]
+            (not used)
+
+        Returns
+        -------
+        des_pos : float
+            the desired position of the pendulum [rad]
+            (not used, returns None)
+        des_vel : float
+            the desired velocity of the pendulum [rad/s]
+            (not used, returns None)
+        des_tau : float
+            the torque supposed to be applied by the actuator [Nm]
+        """
+        if type(meas_pos) is not float:
+            meas_pos = float(np.squeeze(meas_pos))
+        if type(meas_vel) is not float:
+            meas_vel = float(np.squeeze(meas_vel))
+
+        pos = meas_pos
+        if self.wrap_position:
+            # map meas pos to [-np.pi, np.pi]
+            pos = (pos + math.pi) % (2*math.pi) - math.pi
+        vel = min(max(meas_vel, self.low[-1]), self.high[-1])
+
+        obs = self.observation
+        if self.state_representation == 2:
+            obs[0] = pos
+            obs[1] = vel
+        else:
+            obs[0] = math.cos(pos)
+            obs[1] = math.sin(pos)
+            obs[2] = vel
+
+        sign = 1.
+        if self.use_symmetry:
+            sign = float((pos > 0.) - (pos < 0.))
+            obs[0] *= sign
+            obs[1] *= sign
+        des_tau = sign*self._forward_single()*self.torque_limit
+        des_tau = min(max(des_tau, -self.torque_limit), self.torque_limit)
+
+        # since this is a pure torque controller,
+        # set pos_des and vel_des to None
+        des_pos = None
+        des_vel = None
+
+        return des_pos, des_vel, des_tau
+
+    def get_control_output_batch(self, meas_pos, meas_vel, meas_tau=None,
+                                 meas_time=0):
+        """
+        Vectorized version of get_control_output for many states,
+        see AbstractController.get_control_output_batch.
+        The network is evaluated for all states in one forward pass.
+
+        Parameters
+        ----------
+        meas_pos : array-like, shape=(M,)
+            the positions of the pendulums [rad]
+        meas_vel : array-like, shape=(M,)
+            the velocities of the pendulums [rad/s]
+        meas_tau : array-like, shape=(M,), default=None
+            the meastured torques of the pendulums [Nm]
+            (not used)
+        meas_time : float, default=0
+            the collapsed time [s]
+            (not used)
+
+        Returns
+        -------
+        des_pos : array-like, shape=(M,)
+            (not used, nan)
+        des_vel : array-like, shape=(M,)
+            (not used, nan)
+        des_tau : array-like, shape=(M,)
+            the torques supposed to be applied by the actuators [Nm]
+        """
+        pos = np.asarray(meas_pos, dtype=float).ravel()
+        vel = np.asarray(meas_vel, dtype=float).ravel()
+
+        if self.wrap_position:
+            # map meas pos to [-np.pi, np.pi]
+            pos = np.mod(pos + np.pi, 2*np.pi) - np.pi
+        vel = np.clip(vel, self.low[-1], self.high[-1])
+        if self.state_representation == 2:
+            observations = np.stack((pos, vel), axis=1)
+        else:
+            observations = np.stack((np.cos(pos), np.sin(pos), vel), axis=1)
+        observations = observations.astype(np.float32)
+
+        sign = np.ones_like(pos)
+        if self.use_symmetry:
+            sign = np.sign(pos)
+            observations[:, :2] *= sign[:, np.newaxis].astype(np.float32)
+        des_tau = sign*self.forward(observations)[:, 0]*self.torque_limit
+        des_tau = np.clip(des_tau, -self.torque_limit, self.torque_limit)
+
+        nan = np.full_like(des_tau, np.nan)
+        return nan, nan, des_tau
@@ -0,0 +1,177 @@
+"""
+Policy Export
+=============
+
+Export the actor networks of trained SAC (stable-baselines3) and DDPG
+(tensorflow/keras) models to npz files which can be evaluated with the
+numpy only MLPController. The learning frameworks are only imported
+when a model is exported.
+"""
+
+
+# Other imports
+import numpy as np
+
+# Local imports
+from simple_pendulum.controllers.mlp.mlp_controller import save_mlp_policy, \
+                                                           MLPController
+
+
+def check_export(save_path, reference, state_representation, n_samples=100,
+                 tolerance=1e-4):
+    """
+    Compare the exported network with the original model on random
+    observations.
+
+    Parameters
+    ----------
+    save_path : string
+        path of the exported npz file
+    reference : function
+        the original model, maps observations of shape (M, n_in) to
+        actions of shape (M, 1)
+    state_representation : int
+        2 or 3, see save_mlp_policy
+    n_samples : int, default=100
+        number of random observations
+    tolerance : float, default=1e-4
+        allowed absolute deviation of the actions
+
+    Returns
+    -------
+    error : float
+        largest absolute deviation of the actions
+
+    Raises
+    ------
+    ValueError
+        if the deviation is larger than the tolerance
+    """
+    controller = MLPController(save_path, torque_limit=1.)
+    pos = np.random.uniform(-np.pi, np.pi, n_samples)
+    vel = np.random.uniform(controller.low[-1], controller.high[-1],
+                            n_samples)
+    if state_representation == 2:
+        observations = np.stack((pos, vel), axis=1)
+    else:
+        observations = np.stack((np.cos(pos), np.sin(pos), vel), axis=1)
+    observations = observations.astype(np.float32)
+
+    actions = controller.forward(observations)[:, 0]
+    reference_actions = np.reshape(reference(observations), (n_samples, -1))
+    error = np.max(np.abs(actions - reference_actions[:, 0]))
+    if error > tolerance:
+        raise ValueError(f"the exported network deviates by {error} from "
+                         "the original model")
+    return error
+
+
+def export_sac_policy(model_path, save_path, state_representation=2):
+    """
+    Export the deterministic actor of a stable-baselines3 SAC model,
+    i.e. the latent policy network and the mean action layer followed by
+    the tanh squashing and the rescaling to the action space.
+
+    Parameters
+    ----------
+    model_path : string
+        path to the trained model in zip format
+    save_path : string
+        path of the npz file
+    state_representation : int, default=2
+        observation of the model, see SacController
+    """
+    import torch
+    from stable_baselines3 import SAC
+
+    model = SAC.load(model_path, device="cpu")
+    actor = model.policy.actor
+    if actor.use_sde:
+        raise NotImplementedError(
+            "Sorry, exporting sac policies with gSDE is not implemented.")
+
+    modules = list(actor.latent_pi) + [actor.mu, torch.nn.Tanh()]
+    weights, biases, activations = [], [], []
+    for module in modules:
+        if isinstance(module, torch.nn.Linear):
+            # torch stores the transposed weight matrix
+            weights.append(module.weight.detach().cpu().numpy().T)
+            biases.append(module.bias.detach().cpu().numpy())
+            activations.append("linear")
+        elif isinstance(module, torch.nn.ReLU):
+            activations[-1] = "relu"
+        elif isinstance(module, torch.nn.Tanh):
+            activations[-1] = "tanh"
+        else:
+            raise NotImplementedError(
+                f"Sorry, layer {type(module).__name__} is not implemented.")
+
+    # actions in [-1, 1] are rescaled to the action space by sb3
+    low = float(np.squeeze(model.action_space.low))
+    high = float(np.squeeze(model.action_space.high))
+    save_mlp_policy(save_path, weights, biases, activations,
+                    output_scale=0.5*(high - low),
+                    output_offset=0.5*(high + low),
+                    state_representation=state_representation,
+                    wrap_position=True)
+
+    check_export(save_path,
+                 lambda obs: model.predict(obs, deterministic=True)[0],
+                 state_representation)
+
+
+def export_ddpg_policy(model_path, save_path, state_representation=3,
+                       output_scale=None):
+    """
+    Export the actor of a DDPG model saved with tensorflow/keras, i.e. the
+    dense layers created by get_actor in
+    simple_pendulum.reinforcement_learning.ddpg.models.
+
+    Parameters
+    ----------
+    model_path : string
+        path to the saved actor model
+    save_path : string
+        path of the npz file
+    state_representation : int, default=3
+        observation of the model, see ddpg_controller
+    output_scale : float, default=None
+        factor with which the output of the last dense layer is multiplied
+        (upper_bound in get_actor). The factor is not stored as a weight
+        in the model and is fitted to the outputs of the model if None.
+    """
+    import tensorflow as tf
+    from tensorflow.keras.models import load_model
+
+    model = load_model(model_path, compile=False)
+
+    weights, biases, activations = [], [], []
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.layers.Dense):
+            kernel, bias = layer.get_weights()
+            weights.append(kernel)
+            biases.append(bias)
+            activations.append(layer.get_config()["activation"])
+
+    def reference(obs):
+        return model(obs, training=False).numpy()
+
+    if output_scale is None:
+        save_mlp_policy(save_path, weights, biases, activations,
+                        state_representation=state_representation,
+                        wrap_position=False)
+        # least squares fit of the factor on random observations
+        controller = MLPController(save_path, torque_limit=1.)
+        obs = np.random.uniform(controller.low, controller.high,
+                                (100, len(controller.low)))
+        obs = obs.astype(np.float32)
+        network = controller.forward(obs)[:, 0]
+        actions = np.reshape(reference(obs), (100, -1))[:, 0]
+        output_scale = network.dot(actions) / network.dot(network)
+
+    save_mlp_policy(save_path, weights, biases, activations,
+                    output_scale=output_scale,
+                    state_representation=state_representation,
+                    wrap_position=False)
+
+    check_export(save_path, reference, state_representation)
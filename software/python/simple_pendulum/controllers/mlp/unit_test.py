@@ -0,0 +1,87 @@
+"""
+Unit Tests
+==========
+"""
+
+
+import os
+import tempfile
+import unittest
+import numpy as np
+
+from simple_pendulum.controllers.mlp.mlp_controller import MLPController, \
+                                                           save_mlp_policy
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.rng = np.random.default_rng(0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def random_policy(self, state_representation, wrap_position=True):
+        """
+        store a random 256-256 actor network, returns the path and the
+        network as function of the observations
+        """
+        sizes = [state_representation, 256, 256, 1]
+        weights = [self.rng.normal(0, 1/np.sqrt(n), (n, m))
+                   for n, m in zip(sizes[:-1], sizes[1:])]
+        biases = [self.rng.normal(0, 0.1, m) for m in sizes[1:]]
+        activations = ["relu", "relu", "tanh"]
+        path = os.path.join(self.tmp.name,
+                            f"policy_{state_representation}.npz")
+        save_mlp_policy(path, weights, biases, activations,
+                        output_scale=2.0, output_offset=0.0,
+                        state_representation=state_representation,
+                        wrap_position=wrap_position)
+
+        def network(obs):
+            out = np.asarray(obs, dtype=float)
+            for W, b in zip(weights[:-1], biases[:-1]):
+                out = np.maximum(out.dot(W) + b, 0.)
+            return 2.0*np.tanh(out.dot(weights[-1]) + biases[-1])[..., 0]
+        return path, network
+
+    def test_0_mlp_output(self):
+        pos = self.rng.uniform(-10, 10, 200)
+        vel = self.rng.uniform(-25, 25, 200)
+        torque_limit = 1.5
+
+        for state_representation in [2, 3]:
+            with self.subTest(state_representation=state_representation):
+                path, network = self.random_policy(state_representation)
+                controller = MLPController(path, torque_limit=torque_limit)
+
+                pos_mod = np.mod(pos + np.pi, 2*np.pi) - np.pi
+                vel_clip = np.clip(vel, controller.low[-1],
+                                   controller.high[-1])
+                if state_representation == 2:
+                    obs = np.stack((pos_mod, vel_clip), axis=1)
+                else:
+                    obs = np.stack((np.cos(pos_mod), np.sin(pos_mod),
+                                    vel_clip), axis=1)
+                reference = np.clip(network(obs)*torque_limit,
+                                    -torque_limit, torque_limit)
+
+                _, _, u = controller.get_control_output_batch(pos, vel)
+                np.testing.assert_allclose(u, reference, atol=1e-4)
+                for i in range(20):
+                    _, _, tau = controller.get_control_output(pos[i], vel[i])
+                    self.assertAlmostEqual(tau, u[i], places=5)
+
+    def test_1_mlp_symmetry(self):
+        path, network = self.random_policy(2)
+        controller = MLPController(path, torque_limit=1.0, use_symmetry=True)
+        pos = self.rng.uniform(-np.pi, np.pi, 50)
+        vel = self.rng.uniform(-5, 5, 50)
+
+        _, _, u = controller.get_control_output_batch(pos, vel)
+        _, _, u_mirrored = controller.get_control_output_batch(-pos, -vel)
+        np.testing.assert_allclose(u, -u_mirrored, atol=1e-6)
+        for i in range(10):
+            _, _, tau = controller.get_control_output(pos[i], vel[i])
+            self.assertAlmostEqual(tau, u[i], places=5)
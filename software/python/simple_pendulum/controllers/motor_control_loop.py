@@ -29,6 +29,14 @@ the motor driver. It furthermore requires the following arguments:
 
 The return values start, end and meas_dt are required to monitor if 
 desired and measured time steps match.
+
+The loop runs on an absolute schedule: the i-th iteration is started at
+``start + i*dt``. A slow iteration therefore does not shift the timing of
+all following iterations. If the loop falls behind by more than one time
+step, the schedule is restarted from the current time instead of
+executing the missed iterations in a burst. The number of iterations
+which took longer than ``dt`` is stored in ``data_dict["n_overruns"]``
+and printed at the end of the run.
 """
 
 
@@ -102,10 +110,20 @@ def ak80_6(control_method, name, attribute, params, data_dict,
     meas_dt = 0.0
     meas_time = 0.0
     vel_filtered = 0
+    n_overruns = 0
+    max_exec_time = 0.0
     start = time.time()
+    next_loop = start
+    start_loop = start
 
     while i < n:
-        start_loop = time.time()
+        # wait for the next slot of the absolute schedule
+        while time.time() < next_loop:
+            pass
+        now = time.time()
+        if i > 0:
+            meas_dt = now - start_loop
+        start_loop = now
         meas_time += meas_dt
 
 #        if attribute == "open_loop":
@@ -172,15 +190,22 @@ def ak80_6(control_method, name, attribute, params, data_dict,
 
         i += 1
         exec_time = time.time() - start_loop
+        max_exec_time = max(max_exec_time, exec_time)
         if exec_time > dt:
-            print("Control loop is too slow!")
-            print("Control frequency:", 1/exec_time, "Hz")
-            print("Desired frequency:", 1/dt, "Hz")
-            print()
-        while time.time() - start_loop < dt:
-            pass
-        meas_dt = time.time() - start_loop
+            n_overruns += 1
+        next_loop += dt
+        if time.time() - next_loop > dt:
+            # more than one time step behind, restart the schedule
+            next_loop = time.time()
     end = time.time()
+    data_dict["n_overruns"] = n_overruns
+
+    if n_overruns > 0:
+        print("Control loop was too slow in", n_overruns, "of", n,
+              "iterations!")
+        print("Slowest control frequency:", 1/max_exec_time, "Hz")
+        print("Desired frequency:", 1/dt, "Hz")
+        print()
 
     print("Disabling Motors...")
     motor_01.send_rad_command(0, 0, 0, 0, 0)
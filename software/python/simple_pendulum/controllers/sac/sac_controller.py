@@ -101,6 +101,64 @@ class SacController(AbstractController):
 
         return des_pos, des_vel, des_tau
 
+    def get_control_output_batch(self, meas_pos, meas_vel, meas_tau=None,
+                                 meas_time=0):
+        """
+        Vectorized version of get_control_output for many states,
+        see AbstractController.get_control_output_batch.
+        The policy is evaluated for all states in one forward pass.
+
+        Parameters
+        ----------
+        meas_pos : array-like, shape=(M,)
+            the positions of the pendulums [rad]
+        meas_vel : array-like, shape=(M,)
+            the velocities of the pendulums [rad/s]
+        meas_tau : array-like, shape=(M,), default=None
+            the meastured torques of the pendulums [Nm]
+            (not used)
+        meas_time : float, default=0
+            the collapsed time [s]
+            (not used)
+
+        Returns
+        -------
+        des_pos : array-like, shape=(M,)
+            (not used, nan)
+        des_vel : array-like, shape=(M,)
+            (not used, nan)
+        des_tau : array-like, shape=(M,)
+            the torques supposed to be applied by the actuators [Nm]
+        """
+
+        pos = np.asarray(meas_pos, dtype=float).ravel()
+        vel = np.asarray(meas_vel, dtype=float).ravel()
+
+        # map meas pos to [-np.pi, np.pi]
+        meas_pos_mod = np.mod(pos + np.pi, 2 * np.pi) - np.pi
+        observations = self.get_observation_batch(meas_pos_mod, vel)
+
+        if self.use_symmetry:
+            sign = np.sign(meas_pos_mod).astype(np.float32)
+            observations[:, :2] *= sign[:, np.newaxis]
+            actions, _states = self.model.predict(observations)
+            des_tau = np.reshape(actions, (len(pos), -1))[:, 0] * sign
+        else:
+            actions, _states = self.model.predict(observations)
+            des_tau = np.reshape(actions, (len(pos), -1))[:, 0]
+        des_tau = des_tau.astype(float) * self.torque_limit
+
+        nan = np.full_like(des_tau, np.nan)
+        return nan, nan, des_tau
+
+    def get_observation_batch(self, pos, vel):
+        vel = np.clip(vel, self.low[-1], self.high[-1])
+        if self.state_representation == 2:
+            observations = np.stack((pos, vel), axis=1)
+        elif self.state_representation == 3:
+            observations = np.stack((np.cos(pos), np.sin(pos), vel), axis=1)
+        return observations.astype(np.float32)
+
     def get_observation(self, state):
         st = np.copy(state)
         st[1] = np.clip(st[1], self.low[-1], self.high[-1])
@@ -71,7 +71,29 @@ class Agent:
         return a
 
     def train_on(self, batch):
-        states, actions, next_states, rewards, done = batch
+        """
+        One training step of the critic and the actor.
+
+        Parameters
+        ----------
+        batch: tuple
+            (s_batch,a_batch,s'_batch,r_batch,d_batch) from
+            ReplayBuffer.sample_batch or
+            (s_batch,a_batch,s'_batch,r_batch,d_batch,w_batch,indices) from
+            PrioritizedReplayBuffer.sample_batch. The squared td errors
+            of the critic loss are weighted with the importance sampling
+            weights w_batch.
+
+        Returns
+        -------
+        actor_loss: tensor
+        critic_loss: tensor
+
+        The td errors of the batch are stored in self.td_errors, e.g. to
+        update the priorities of a PrioritizedReplayBuffer.
+        """
+        states, actions, next_states, rewards, done = batch[:5]
+        weights = batch[5] if len(batch) > 5 else 1.0
 
         with tf.GradientTape() as tape:
             target_actions = self.target_actor(self.prep_state(next_states),
@@ -84,7 +106,10 @@ class Agent:
             critic_value = self.critic([np.atleast_2d(states),
                                         np.atleast_2d(actions)],
                                        training=True)
-            critic_loss = tf.math.reduce_mean(tf.math.square(y - critic_value))
+            td_errors = y - critic_value
+            critic_loss = tf.math.reduce_mean(
+                                weights*tf.math.square(td_errors))
+        self.td_errors = td_errors.numpy()[:, 0]
 
         critic_grad = tape.gradient(critic_loss,
                                     self.critic.trainable_variables)
@@ -11,7 +11,8 @@ from simple_pendulum.model.pendulum_plant import PendulumPlant
 from simple_pendulum.simulation.simulation import Simulator
 from simple_pendulum.simulation.gym_environment import SimplePendulumEnv
 
-from simple_pendulum.reinforcement_learning.ddpg.replay_buffer import ReplayBuffer
+from simple_pendulum.reinforcement_learning.ddpg.replay_buffer import \
+    ReplayBuffer, PrioritizedReplayBuffer
 from simple_pendulum.reinforcement_learning.ddpg.models import get_actor, \
                                                                get_critic
 from simple_pendulum.reinforcement_learning.ddpg.agent import Agent
@@ -79,7 +80,7 @@ class ddpg_trainer:
                                       inertia=self.pen_inertia,
                                       torque_limit=self.pen_torque_limit)
 
-        self.simulator = Simulator(plant=self.pendulum)
+        self.simulator = Simulator(plant=self.pendulum, recorder=None)
 
     def init_environment(self,
                          dt=0.01,
@@ -150,11 +151,25 @@ class ddpg_trainer:
                    discount=0.99,
                    actor_lr=0.0005,
                    critic_lr=0.001,
-                   tau=0.005):
-
-        self.replay_buffer = ReplayBuffer(max_size=replay_buffer_size,
-                                          num_states=self.env.n_states,
-                                          num_actions=self.env.n_actions)
+                   tau=0.005,
+                   prioritized_replay=False,
+                   alpha=0.6,
+                   beta=0.4,
+                   beta_increment=1e-4):
+
+        self.prioritized_replay = prioritized_replay
+        if prioritized_replay:
+            self.replay_buffer = PrioritizedReplayBuffer(
+                                        max_size=replay_buffer_size,
+                                        num_states=self.env.n_states,
+                                        num_actions=self.env.n_actions,
+                                        alpha=alpha,
+                                        beta=beta,
+                                        beta_increment=beta_increment)
+        else:
+            self.replay_buffer = ReplayBuffer(max_size=replay_buffer_size,
+                                              num_states=self.env.n_states,
+                                              num_actions=self.env.n_actions)
 
         if actor is None:
             actor = get_actor(self.env.state_shape,
@@ -259,6 +274,9 @@ class ddpg_trainer:
                           end="\r")
                     batch = self.replay_buffer.sample_batch(self.batch_size)
                     actor_loss, critic_loss = self.agent.train_on(batch)
+                    if self.prioritized_replay:
+                        self.replay_buffer.update_priorities(
+                                batch[6], self.agent.td_errors)
                     actor_loss_list.append(actor_loss)
                     critic_loss_list.append(critic_loss)
                     self.agent.update_target_weights()
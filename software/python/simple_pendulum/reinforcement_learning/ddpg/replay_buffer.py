@@ -7,6 +7,8 @@ Replay Buffer
 import numpy as np
 import tensorflow as tf
 
+from simple_pendulum.reinforcement_learning.ddpg.sum_tree import SumTree
+
 
 class ReplayBuffer:
     """
@@ -97,3 +99,136 @@ class ReplayBuffer:
         self.reward_buffer = np.zeros((self.buffer_capacity, 1))
         self.done_buffer = np.zeros((self.buffer_capacity, 1))
         self.size = 0
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer which samples experiences proportional to their
+    priority (prioritized experience replay, Schaul et al. 2016).
+    """
+    def __init__(self, max_size, num_states, num_actions,
+                 alpha=0.6, beta=0.4, beta_increment=0.0, epsilon=1e-6):
+        """
+        Replay buffer which samples experiences proportional to their
+        priority. The priorities are stored in a sum tree, so that
+        updating a priority and sampling an experience take O(log n).
+        New experiences get the highest priority seen so far.
+
+        Parameters
+        ----------
+        max_size: int
+            maximum number of experiences to store in the repleay buffer.
+            When adding experiences beyond this limit, the first entry
+            is deleted.
+        num_state: int
+            the dimension of the state space
+        num_actions: int
+            the dimension of the action space
+        alpha: float, default=0.6
+            priority exponent, the priority of an experience is
+            (|td_error| + epsilon)^alpha. alpha=0 is uniform sampling.
+        beta: float, default=0.4
+            exponent of the importance sampling weights, beta=1 fully
+            compensates the non-uniform sampling
+        beta_increment: float, default=0.0
+            beta is increased by this value (up to 1) with every sampled
+            batch
+        epsilon: float, default=1e-6
+            offset which keeps the priorities of experiences with zero
+            td error positive
+        """
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+
+        super().__init__(max_size, num_states, num_actions)
+
+    def append(self, obs_tuple):
+        """
+        Add an experience to the replay buffer with the highest priority.
+        When adding experiences beyond the max_size limit,
+        the first entry is deleted.
+        An observation consists of (state, action, next_state, reward, done)
+
+        Parameters
+        ----------
+        obs_tuple: array-like
+            an observation (s,a,s',r,d) to store in the buffer
+        """
+        index = self.size % self.buffer_capacity
+        super().append(obs_tuple)
+        self.tree.update(index, self.max_priority)
+
+    def sample_batch(self, batch_size):
+        """
+        Sample a batch from the replay buffer proportional to the
+        priorities. The range of the priorities is split into batch_size
+        segments of equal mass and one experience is sampled from every
+        segment (stratified sampling).
+
+        Parameters
+        ----------
+        batch_size: int
+            number of samples in the returned batch
+
+        Returns
+        -------
+        tuple
+            (s_batch,a_batch,s'_batch,r_batch,d_batch,w_batch,indices)
+            a tuple of batches of state, action, reward, next_state, done,
+            the importance sampling weights (divided by the weight of the
+            experience with the lowest priority, so that all weights are
+            <= 1) and the indices of the experiences for update_priorities
+        """
+        record_range = min(self.size, self.buffer_capacity)
+        total = self.tree.total()
+        segment = total / batch_size
+        values = (np.arange(batch_size) +
+                  np.random.uniform(size=batch_size))*segment
+        batch_indices = self.tree.find(np.minimum(values, total))
+        batch_indices = np.minimum(batch_indices, record_range - 1)
+
+        # importance sampling weights w = (N P(i))^-beta / max w
+        probabilities = self.tree.get(batch_indices) / total
+        min_probability = self.tree.min() / total
+        weights = (probabilities / min_probability)**(-self.beta)
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        # Convert to tensors
+        state_batch = tf.convert_to_tensor(self.state_buffer[batch_indices])
+        action_batch = tf.convert_to_tensor(self.action_buffer[batch_indices])
+        reward_batch = tf.convert_to_tensor(self.reward_buffer[batch_indices])
+        reward_batch = tf.cast(reward_batch, dtype=tf.float32)
+        next_state_batch = tf.convert_to_tensor(
+                    self.next_state_buffer[batch_indices])
+        done_batch = self.done_buffer[batch_indices]
+        weight_batch = tf.convert_to_tensor(weights[:, np.newaxis],
+                                            dtype=tf.float32)
+        return (state_batch, action_batch, next_state_batch,
+                reward_batch, done_batch, weight_batch, batch_indices)
+
+    def update_priorities(self, indices, td_errors):
+        """
+        Update the priorities of sampled experiences with the td errors
+        of the critic.
+
+        Parameters
+        ----------
+        indices: array-like
+            indices of the experiences as returned by sample_batch
+        td_errors: array-like
+            td errors of the experiences
+        """
+        priorities = (np.abs(np.ravel(td_errors)) +
+                      self.epsilon)**self.alpha
+        self.tree.update(indices, priorities)
+        self.max_priority = max(self.max_priority, np.max(priorities))
+
+    def clear(self):
+        """
+        Clear the Replay Buffer.
+        """
+        super().clear()
+        self.tree = SumTree(self.buffer_capacity)
+        self.max_priority = 1.0
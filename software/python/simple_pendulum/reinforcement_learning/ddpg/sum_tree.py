@@ -0,0 +1,126 @@
+"""
+Sum Tree
+========
+"""
+
+
+import numpy as np
+
+
+class SumTree:
+    """
+    Binary tree stored in an array in which every node holds the sum of
+    its two children. The leaves hold the priorities of the entries of a
+    buffer. Priorities can be updated and entries can be sampled
+    proportional to their priority in O(log n). A second tree of the same
+    layout holds the minima of the children, so that the lowest priority
+    is available in O(1).
+    """
+    def __init__(self, capacity):
+        """
+        Binary tree stored in an array in which every node holds the sum of
+        its two children.
+
+        Parameters
+        ----------
+        capacity: int
+            number of leaves (entries of the buffer)
+        """
+        self.capacity = int(capacity)
+        # number of levels below the root, the leaves are the nodes
+        # [n_leaves, 2*n_leaves) and node i has the children 2i and 2i+1
+        self.depth = max(int(np.ceil(np.log2(self.capacity))), 0)
+        self.n_leaves = 2**self.depth
+        self.tree = np.zeros(2*self.n_leaves)
+        # leaves without an entry are never the minimum
+        self.min_tree = np.full(2*self.n_leaves, np.inf)
+
+    def total(self):
+        """
+        Sum of all priorities.
+
+        Returns
+        -------
+        float
+        """
+        return self.tree[1]
+
+    def min(self):
+        """
+        Lowest priority of the entries which have been set
+        (inf if no priority has been set).
+
+        Returns
+        -------
+        float
+        """
+        return self.min_tree[1]
+
+    def get(self, indices):
+        """
+        Priorities of entries.
+
+        Parameters
+        ----------
+        indices: int or array-like
+            indices of the entries
+
+        Returns
+        -------
+        float or array-like
+        """
+        return self.tree[np.asarray(indices) + self.n_leaves]
+
+    def update(self, indices, priorities):
+        """
+        Set the priorities of entries. The sums and minima of the affected
+        nodes are recomputed level by level, i.e. O(log n) per entry.
+
+        Parameters
+        ----------
+        indices: int or array-like
+            indices of the entries
+        priorities: float or array-like
+            new priorities (non-negative)
+        """
+        nodes = np.atleast_1d(np.asarray(indices, dtype=int)) + self.n_leaves
+        self.tree[nodes] = priorities
+        self.min_tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2*nodes] + self.tree[2*nodes + 1]
+            self.min_tree[nodes] = np.minimum(self.min_tree[2*nodes],
+                                              self.min_tree[2*nodes + 1])
+
+    def find(self, values):
+        """
+        Entries at which the cumulative sum of the priorities reaches the
+        given values, i.e. for values uniform in [0, total()) the entries
+        are sampled proportional to their priorities.
+
+        Parameters
+        ----------
+        values: float or array-like
+            values in [0, total())
+
+        Returns
+        -------
+        array-like
+            indices of the entries
+        """
+        values = np.array(values, dtype=float, ndmin=1)
+        nodes = np.ones(len(values), dtype=int)
+        for _ in range(self.depth):
+            left = 2*nodes
+            right = values >= self.tree[left]
+            values -= self.tree[left]*right
+            nodes = left + right
+        # values equal to the total can end in empty leaves due to
+        # rounding, they are moved to the last entry with a priority
+        indices = nodes - self.n_leaves
+        empty = self.tree[nodes] <= 0.0
+        if np.any(empty):
+            filled = np.flatnonzero(self.tree[self.n_leaves:] > 0.0)
+            indices[empty] = filled[np.searchsorted(filled, indices[empty],
+                                                    side="right") - 1]
+        return indices
@@ -0,0 +1,97 @@
+"""
+Unit Tests
+==========
+"""
+
+
+import importlib.util
+import unittest
+from unittest import mock
+import numpy as np
+
+from simple_pendulum.reinforcement_learning.ddpg.sum_tree import SumTree
+
+
+class Test(unittest.TestCase):
+
+    def test_0_sum_tree(self):
+        """
+        Unit test checking the sums of the tree after updates and the
+        sampling proportional to the priorities
+        """
+        capacity = 1000
+        tree = SumTree(capacity)
+        priorities = np.random.rand(capacity)
+        tree.update(np.arange(capacity), priorities)
+        self.assertAlmostEqual(tree.total(), np.sum(priorities))
+
+        indices = np.random.randint(0, capacity, 50)
+        priorities[indices] = np.random.rand(50)*10
+        tree.update(indices, priorities[indices])
+        self.assertAlmostEqual(tree.total(), np.sum(priorities))
+        self.assertEqual(tree.min(), np.min(priorities))
+        np.testing.assert_allclose(tree.get(indices), priorities[indices])
+
+        # the entry at which the cumulative sum reaches a value
+        values = np.random.rand(200)*tree.total()
+        cumulative = np.cumsum(priorities)
+        expected = np.searchsorted(cumulative, values, side="right")
+        np.testing.assert_array_equal(tree.find(values), expected)
+
+        # entries without priority are never sampled
+        tree.update(np.arange(0, capacity, 2), 0.0)
+        samples = tree.find(np.random.rand(1000)*tree.total())
+        self.assertTrue(np.all(samples % 2 == 1))
+        self.assertTrue(np.all(samples < capacity))
+
+    @unittest.skipUnless(importlib.util.find_spec("tensorflow"),
+                         "tensorflow is not installed")
+    def test_1_prioritized_replay_buffer(self):
+        """
+        Unit test checking the sampled indices, the importance sampling
+        weights and the priority updates of the prioritized replay buffer
+        """
+        from simple_pendulum.reinforcement_learning.ddpg import replay_buffer
+
+        # the batches are returned as numpy arrays instead of tensors
+        with mock.patch.object(replay_buffer.tf, "convert_to_tensor",
+                               lambda x, dtype=None: np.asarray(x)), \
+             mock.patch.object(replay_buffer.tf, "cast",
+                               lambda x, dtype=None: np.asarray(x)):
+            buffer = replay_buffer.PrioritizedReplayBuffer(
+                        max_size=8, num_states=2, num_actions=1,
+                        alpha=1.0, beta=1.0, epsilon=0.0)
+            for i in range(5):
+                buffer.append(([i, -i], [0.1*i], [i+1, -i-1], i, False))
+
+            # equal priorities, stratified sampling draws every
+            # experience once
+            batch = buffer.sample_batch(5)
+            states, weights, indices = batch[0], batch[5], batch[6]
+            self.assertEqual(sorted(indices), list(range(5)))
+            np.testing.assert_array_equal(states[:, 0], indices)
+            np.testing.assert_allclose(weights, np.ones((5, 1)))
+
+            # priorities |td error|^alpha, the experience with the
+            # largest td error fills the last 6 of 10 segments
+            buffer.update_priorities(np.arange(5), [1.0, -1.0, 1.0, 1.0, 6.0])
+            self.assertEqual(buffer.max_priority, 6.0)
+            batch = buffer.sample_batch(10)
+            weights, indices = batch[5], batch[6]
+            np.testing.assert_array_equal(indices, [0, 1, 2, 3] + 6*[4])
+            # weights (N P(i))^-beta normalized by the lowest priority
+            np.testing.assert_allclose(weights[:, 0],
+                                       [1.0, 1.0, 1.0, 1.0] + 6*[1/6])
+
+            # new experiences get the highest priority, also when they
+            # replace the oldest ones
+            for i in range(5, 9):
+                buffer.append(([i, -i], [0.1*i], [i+1, -i-1], i, False))
+            np.testing.assert_allclose(buffer.tree.get(np.arange(8)),
+                                       [6.0, 1.0, 1.0, 1.0, 6.0,
+                                        6.0, 6.0, 6.0])
+            self.assertEqual(buffer.tree.min(), 1.0)
+
+            buffer.clear()
+            self.assertEqual(buffer.size, 0)
+            self.assertEqual(buffer.tree.total(), 0.0)
@@ -14,6 +14,9 @@ from stable_baselines3.common.callbacks import EvalCallback, \
 from simple_pendulum.model.pendulum_plant import PendulumPlant
 from simple_pendulum.simulation.simulation import Simulator
 from simple_pendulum.simulation.gym_environment import SimplePendulumEnv
+from simple_pendulum.simulation.batch_simulation import BatchSimulator
+from simple_pendulum.simulation.vec_gym_environment import \
+                                                    SimplePendulumVecEnv
 
 
 class sac_trainer():
@@ -78,7 +81,7 @@ class sac_trainer():
                                       inertia=self.pen_inertia,
                                       torque_limit=self.pen_torque_limit)
 
-        self.simulator = Simulator(plant=self.pendulum)
+        self.simulator = Simulator(plant=self.pendulum, recorder=None)
 
     def init_environment(self,
                          dt=0.01,
@@ -89,7 +92,8 @@ class sac_trainer():
                          validation_limit=-150,
                          target=[np.pi, 0.0],
                          state_target_epsilon=[1e-2, 1e-2],
-                         random_init="everywhere"):
+                         random_init="everywhere",
+                         n_envs=1):
         """
         Initialize the training environment.
         This includes the simulation parameters of the pendulum.
@@ -119,17 +123,50 @@ class sac_trainer():
             The target state of the pendulum
         state_target_epsilon : array-like, default=[1e-2, 1e-2]
             In this vicinity the target counts as reached.
+        random_init : string, default="everywhere"
+            random initialization of the training episodes
+            "False", "start_vicinity" or "everywhere"
+        n_envs : int, default=1
+            number of parallel training environments. For n_envs > 1 the
+            pendulums are simulated together in a SimplePendulumVecEnv.
         """
 
-        self.env = SimplePendulumEnv(simulator=self.simulator,
-                                     max_steps=max_steps,
-                                     reward_type=reward_type,
-                                     dt=dt,
-                                     integrator=integrator,
-                                     state_representation=state_representation,
-                                     validation_limit=validation_limit,
-                                     scale_action=True,
-                                     random_init=random_init)
+        if n_envs > 1:
+            batch_simulator = BatchSimulator(
+                                    n=n_envs,
+                                    mass=self.pen_mass,
+                                    length=self.pen_length,
+                                    damping=self.pen_damping,
+                                    gravity=self.pen_gravity,
+                                    coulomb_fric=self.pen_cfric,
+                                    inertia=self.pen_inertia,
+                                    torque_limit=self.pen_torque_limit)
+            self.env = SimplePendulumVecEnv(
+                                  simulator=batch_simulator,
+                                  max_steps=max_steps,
+                                  target=list(target),
+                                  state_target_epsilon=state_target_epsilon,
+                                  reward_type=reward_type,
+                                  dt=dt,
+                                  integrator=integrator,
+                                  state_representation=state_representation,
+                                  validation_limit=validation_limit,
+                                  scale_action=True,
+                                  random_init=random_init)
+        else:
+            # stable-baselines3 copies the observations, so the
+            # observation buffer of the fast step mode can be reused
+            self.env = SimplePendulumEnv(
+                                  simulator=self.simulator,
+                                  max_steps=max_steps,
+                                  reward_type=reward_type,
+                                  dt=dt,
+                                  integrator=integrator,
+                                  state_representation=state_representation,
+                                  validation_limit=validation_limit,
+                                  scale_action=True,
+                                  random_init=random_init,
+                                  fast_step=True)
 
         # setup evaluation environment
         self.eval_env = SimplePendulumEnv(
@@ -0,0 +1,332 @@
+"""
+Batch Simulator
+===============
+"""
+
+
+import numpy as np
+
+
+class BatchSimulator:
+    def __init__(self, n=1, mass=1.0, length=0.5, damping=0.1, gravity=9.81,
+                 coulomb_fric=0.0, inertia=None, torque_limit=np.inf):
+        """
+        Simulator class which integrates a batch of n simple pendulums
+        at once. The states of all pendulums are stored in one (n, 2)
+        array and every integration step is a single vectorized update
+        of the whole batch.
+
+        The state of pendulum i is
+            x[i] = [angle, angular velocity]
+            in units: rad and rad/s
+        The dynamics are the same as in the PendulumPlant class.
+        Every parameter can either be a float (shared by all pendulums)
+        or an array-like of length n (one value per pendulum).
+
+        Parameters
+        ----------
+        n : int, default=1
+            number of pendulums in the batch
+        mass : float or array-like, default=1.0
+            pendulum mass, unit: kg
+        length : float or array-like, default=0.5
+            pendulum length, unit: m
+        damping : float or array-like, default=0.1
+            damping factor (proportional to velocity), unit: kg*m/s
+        gravity : float or array-like, default=9.81
+            gravity (positive direction points down), unit: m/s^2
+        coulomb_fric : float or array-like, default=0.0
+            friction term, (independent of magnitude of velocity), unit: Nm
+        inertia : float or array-like, default=None
+            inertia of the pendulum (defaults to point mass inertia)
+            unit: kg*m^2
+        torque_limit: float or array-like, default=np.inf
+            maximum torque that the motor can apply, unit: Nm
+        """
+
+        self.n = int(n)
+
+        self.m = self._batch_parameter(mass)
+        self.l = self._batch_parameter(length)
+        self.b = self._batch_parameter(damping)
+        self.g = self._batch_parameter(gravity)
+        self.coulomb_fric = self._batch_parameter(coulomb_fric)
+        if inertia is None:
+            self.inertia = self.m*self.l*self.l
+        else:
+            self.inertia = self._batch_parameter(inertia)
+        self.torque_limit = self._batch_parameter(torque_limit)
+
+        self.dof = 1
+        self.n_actuators = 1
+
+        # constants of the equation of motion, see update_parameters
+        self._mgl = None
+        self._inv_inertia = None
+        self.update_parameters()
+
+        self.x = np.zeros((self.n, 2*self.dof))  # positions, velocities
+        self.t = 0.0  # time
+
+        # work arrays for the integrators
+        self._k = np.zeros((4, self.n, 2*self.dof))
+        self._y = np.zeros((self.n, 2*self.dof))
+        self._torque = np.zeros(self.n)
+
+        self.reset_data_recorder()
+
+    @classmethod
+    def from_plants(cls, plants):
+        """
+        Create a batch simulator from a list of plants.
+
+        Parameters
+        ----------
+        plants : list
+            list of PendulumPlant objects
+            (e.g. PendulumPlant from simple_pendulum.models.pendulum_plant.py)
+
+        Returns
+        -------
+        BatchSimulator : simulator with one row per plant
+        """
+
+        return cls(n=len(plants),
+                   mass=[p.m for p in plants],
+                   length=[p.l for p in plants],
+                   damping=[p.b for p in plants],
+                   gravity=[p.g for p in plants],
+                   coulomb_fric=[p.coulomb_fric for p in plants],
+                   inertia=[p.inertia for p in plants],
+                   torque_limit=[p.torque_limit for p in plants])
+
+    def _batch_parameter(self, par):
+        par = np.asarray(par, dtype=float)
+        if par.ndim == 0:
+            return np.full(self.n, float(par))
+        par = par.reshape(-1)
+        if par.shape[0] != self.n:
+            raise ValueError(
+                f'Expected {self.n} parameter values, got {par.shape[0]}.')
+        return par.copy()
+
+    def update_parameters(self):
+        """
+        Recompute the constants of the equations of motion.
+        Has to be called after modifying the parameter arrays
+        (m, l, g, inertia) of the simulator in place.
+        """
+
+        self._mgl = self.m*self.g*self.l
+        self._inv_inertia = 1.0 / self.inertia
+
+    def set_state(self, time, x):
+        """
+        set the state of all pendulums in the batch
+
+        Parameters
+        ----------
+        time: float
+            time, unit: s
+        x: array-like
+            shape=(2,) (same state for all pendulums) or shape=(n, 2)
+            states of the pendulums
+        """
+
+        self.x[:] = np.asarray(x, dtype=float)
+        self.t = float(time)
+
+    def get_state(self):
+        """
+        Get current state of the batch
+
+        Returns
+        -------
+        self.t : float,
+            time, unit: s
+        self.x : array-like, shape=(n, 2)
+            states of the pendulums
+        """
+
+        return self.t, self.x
+
+    def reset_data_recorder(self):
+        """
+        Reset the internal data recorder of the simulator
+        """
+
+        self.t_values = np.zeros(0)
+        self.x_values = np.zeros((0, self.n, 2*self.dof))
+        self.tau_values = np.zeros((0, self.n))
+
+    def _batch_torque(self, tau):
+        """
+        Broadcast tau to one clipped torque per pendulum
+        (written into the work array self._torque).
+        """
+
+        tau = np.asarray(tau, dtype=float)
+        if tau.ndim == 2:
+            tau = tau[:, 0]
+        self._torque[:] = tau
+        np.clip(self._torque, -self.torque_limit, self.torque_limit,
+                out=self._torque)
+        return self._torque
+
+    def _rhs(self, x, torque, out):
+        out[:, 0] = x[:, 1]
+        out[:, 1] = (torque -
+                     self._mgl * np.sin(x[:, 0]) -
+                     self.b * x[:, 1] -
+                     np.sign(x[:, 1]) * self.coulomb_fric) * self._inv_inertia
+        return out
+
+    def rhs(self, t, x, tau):
+        """
+        Computes the integrand of the equations of motion of all pendulums.
+
+        Parameters
+        ----------
+        t : float
+            time, not used (the dynamics of the pendulum are time independent)
+        x : array-like, shape=(n, 2)
+            The states of the pendulums [angle, angular velocity]
+            floats, units: rad, rad/s
+        tau : float or array-like
+            motor torques, shape=(n,) or shape=(n, 1), unit: Nm
+
+        Returns
+        -------
+        res : array-like, shape=(n, 2)
+              the integrand, contains [angular velocity, angular acceleration]
+              for every pendulum
+        """
+
+        torque = self._batch_torque(tau)
+        return self._rhs(np.asarray(x), torque, np.zeros((self.n, 2*self.dof)))
+
+    def step(self, tau, dt, integrator="runge_kutta"):
+        """
+        Performs a single step of all pendulums.
+
+        Parameters
+        ----------
+        tau: float or array-like
+            torque input, shape=(n,) or shape=(n, 1) for one torque per
+            pendulum or a float for all pendulums
+        dt: float
+            time step, unit: s
+        integrator: string
+            "euler" for euler integrator
+            "runge_kutta" for Runge-Kutta integrator
+        """
+
+        torque = self._batch_torque(tau)
+        k1, k2, k3, k4 = self._k
+        y = self._y
+
+        if integrator == "runge_kutta":
+            self._rhs(self.x, torque, k1)
+            np.multiply(k1, 0.5*dt, out=y)
+            y += self.x
+            self._rhs(y, torque, k2)
+            np.multiply(k2, 0.5*dt, out=y)
+            y += self.x
+            self._rhs(y, torque, k3)
+            np.multiply(k3, dt, out=y)
+            y += self.x
+            self._rhs(y, torque, k4)
+            k2 += k3
+            k2 *= 2.0
+            k1 += k2
+            k1 += k4
+            k1 *= dt / 6.0
+            self.x += k1
+        elif integrator == "euler":
+            self._rhs(self.x, torque, k1)
+            k1 *= dt
+            self.x += k1
+        else:
+            raise NotImplementedError(
+                   f'Sorry, the integrator {integrator} is not implemented.')
+        self.t += dt
+
+    def simulate(self, t0, x0, tf, dt, controller=None,
+                 integrator="runge_kutta", record=True):
+        """
+        Simulates all pendulums over a period of time.
+
+        Parameters
+        ----------
+        t0: float
+            start time, unit s
+        x0: array-like
+            shape=(2,) or shape=(n, 2)
+            start state(s)
+        tf: float
+            final time, unit: s
+        dt: float
+            time step, unit: s
+        controller: A controller object of the type of the
+                    AbstractController in
+                    simple_pendulum.controllers.abstract_controller.py
+                    The controller is evaluated for all pendulums at once
+                    with get_control_output_batch.
+                    If None, free pendulums are simulated.
+        integrator: string
+            "euler" for euler integrator,
+            "runge_kutta" for Runge-Kutta integrator
+        record: bool, default=True
+            whether to record the trajectories. If False, the returned
+            arrays are empty and the final states can be obtained with
+            get_state.
+
+        Returns
+        -------
+        self.t_values : array-like, shape=(T,)
+            time values
+        self.x_values : array-like, shape=(T, n, 2)
+            states of all pendulums
+        self.tau_values : array-like, shape=(T, n)
+            torques of all pendulums
+        """
+
+        self.set_state(t0, x0)
+        self.reset_data_recorder()
+
+        if record:
+            n_steps = int((tf - t0) / dt) + 2
+            t_values = np.zeros(n_steps)
+            x_values = np.zeros((n_steps, self.n, 2*self.dof))
+            tau_values = np.zeros((n_steps, self.n))
+
+        tau = np.zeros(self.n)
+        i = 0
+        while (self.t <= tf):
+            if controller is not None:
+                _, _, u = controller.get_control_output_batch(
+                                        meas_pos=self.x[:, 0],
+                                        meas_vel=self.x[:, self.dof],
+                                        meas_tau=np.zeros(self.n),
+                                        meas_time=self.t)
+                # no control output (None) means no torque
+                tau[:] = np.nan_to_num(u, nan=0.0)
+            self.step(tau, dt, integrator=integrator)
+            if record:
+                if i >= n_steps:
+                    n_steps *= 2
+                    t_values = np.resize(t_values, n_steps)
+                    x_values = np.resize(x_values,
+                                         (n_steps, self.n, 2*self.dof))
+                    tau_values = np.resize(tau_values, (n_steps, self.n))
+                t_values[i] = self.t
+                x_values[i] = self.x
+                tau_values[i] = tau
+            i += 1
+
+        if record:
+            self.t_values = t_values[:i]
+            self.x_values = x_values[:i]
+            self.tau_values = tau_values[:i]
+
+        return self.t_values, self.x_values, self.tau_values
@@ -5,6 +5,8 @@ Gym Environment
 
 
 # Other imports
+import math
+import time
 import gym
 import numpy as np
 
@@ -24,7 +26,8 @@ class SimplePendulumEnv(gym.Env):
                  state_representation=2,
                  validation_limit=-150,
                  scale_action=True,
-                 random_init="False"):
+                 random_init="False",
+                 fast_step=False):
         """
         An environment for reinforcement learning.
 
@@ -66,6 +69,13 @@ class SimplePendulumEnv(gym.Env):
                                are set in the range [-0.31, -0.31],
             "everywhere" : The pendulum is set to a random state in the whole
                            possible state space
+        fast_step : bool, default=False
+            whether to use the fast step mode. The steps are not recorded
+            by the simulator, the runge_kutta integrator is replaced by
+            the fast_runge_kutta integrator if the plant supports it and
+            the observation is written into a float32 buffer which is
+            reused in every step. The returned observation is overwritten
+            by the next step and has to be copied if it is stored.
         """
         self.simulator = simulator
         self.max_steps = max_steps
@@ -107,6 +117,27 @@ class SimplePendulumEnv(gym.Env):
         self.n_states = self.observation_space.shape[0]
         self.action_limits = [-self.torque_limit, self.torque_limit]
 
+        # the reward function is selected once, swingup_reward raises
+        # the NotImplementedError for unknown reward types
+        self.reward_function = {
+            "continuous": self.continuous_reward,
+            "discrete": self.discrete_reward,
+            "soft_binary": self.soft_binary_reward,
+            "soft_binary_with_repellor": self.soft_binary_repellor_reward,
+            "open_ai_gym": self.open_ai_gym_reward,
+            "open_ai_gym_red_torque": self.open_ai_gym_red_torque_reward
+            }.get(reward_type)
+
+        self.fast_step = fast_step
+        if fast_step:
+            self.observation = np.zeros(self.n_states, dtype=np.float32)
+            if integrator == "runge_kutta":
+                try:
+                    self.simulator._update_fast_constants()
+                    self.integrator = "fast_runge_kutta"
+                except NotImplementedError:
+                    pass
+
         self.simulator.set_state(0, [0.0, 0.0])
         self.step_count = 0
 
@@ -131,6 +162,11 @@ class SimplePendulumEnv(gym.Env):
             may contain additional information
             (empty at the moment)
         """
+        if isinstance(action, np.ndarray):
+            # float() only accepts 0-dimensional arrays
+            action = action.flat[0]
+        if self.fast_step:
+            return self._fast_step(action)
         if self.scale_action:
             a = float(self.torque_limit * action)  # rescaling the action
         else:
@@ -146,6 +182,68 @@ class SimplePendulumEnv(gym.Env):
 
         return observation, reward, done, info
 
+    def _fast_step(self, action):
+        """
+        step without recording, temporary arrays and numpy functions
+        on scalars
+        """
+        if self.scale_action:
+            a = self.torque_limit * float(action)  # rescaling the action
+        else:
+            a = float(action)
+        self.simulator.step(a, self.dt, self.integrator, record=False)
+        pos = float(self.simulator.x[0])
+        vel = min(max(float(self.simulator.x[1]), self.low[-1]),
+                  self.high[-1])
+
+        if self.reward_function is None:
+            self.swingup_reward([pos, vel], a)
+        reward = self.reward_function(pos, vel, a)
+
+        observation = self.observation
+        if self.state_representation == 2:
+            observation[0] = (pos + 6*math.pi) % (math.pi*6*2) - 6*math.pi
+            observation[1] = vel
+        elif self.state_representation == 3:
+            observation[0] = math.cos(pos)
+            observation[1] = math.sin(pos)
+            observation[2] = vel
+
+        done = self.step_count > self.max_steps
+        self.step_count += 1
+
+        return observation, reward, done, {}
+
+    def benchmark(self, n_steps=10000):
+        """
+        Measure the speed of the environment with random actions.
+        The environment is reset before and after the measurement.
+
+        Parameters
+        ----------
+        n_steps : int, default=10000
+            number of steps
+
+        Returns
+        -------
+        steps_per_second : float
+            number of environment steps per second
+        """
+        low = self.action_space.low[0]
+        high = self.action_space.high[0]
+        actions = np.random.uniform(low, high, (n_steps, 1))
+        actions = actions.astype(np.float32)
+
+        self.reset()
+        start = time.perf_counter()
+        for action in actions:
+            _, _, done, _ = self.step(action)
+            if done:
+                self.reset()
+        duration = time.perf_counter() - start
+        self.reset()
+        return n_steps / duration
+
     def reset(self, state=None, random_init="start_vicinity"):
         """
         Reset the environment. The pendulum is initialized with a random state
@@ -290,39 +388,66 @@ class SimplePendulumEnv(gym.Env):
             when the requested reward_type is not implemented
 
         """
-        reward = None
-        pos = observation[0] % (2*np.pi)
-        pos_diff = self.target[0] - pos
-        pos_diff = np.abs((pos_diff + np.pi) % (np.pi * 2) - np.pi)
-        vel = np.clip(observation[1], self.low[-1], self.high[-1])
-
-        if self.reward_type == 'continuous':
-            reward = - np.linalg.norm(pos_diff)
-        elif self.reward_type == 'discrete':
-            reward = np.float(np.linalg.norm(pos_diff) <
-                              self.state_target_epsilon[0])
-        elif self.reward_type == 'soft_binary':
-            reward = np.exp(-pos_diff**2/(2*0.25**2))
-        elif self.reward_type == 'soft_binary_with_repellor':
-            reward = np.exp(-pos_diff ** 2 / (2 * 0.25 ** 2))
-            pos_diff_repellor = pos - 0
-            reward -= np.exp(-pos_diff_repellor ** 2 / (2 * 0.25 ** 2))
-        elif self.reward_type == "open_ai_gym":
-            vel_diff = self.target[1] - vel
-            reward = (-(pos_diff)**2.0 -
-                      0.1*(vel_diff)**2.0 -
-                      0.001*action**2.0)
-        elif self.reward_type == "open_ai_gym_red_torque":
-            vel_diff = self.target[1] - vel
-            reward = (-(pos_diff)**2.0 -
-                      0.1*(vel_diff)**2.0 -
-                      0.01*action**2.0)
-        else:
+        if self.reward_function is None:
             raise NotImplementedError(
                 f'Sorry, reward type {self.reward_type} is not implemented.')
 
+        vel = np.clip(observation[1], self.low[-1], self.high[-1])
+        reward = self.reward_function(observation[0], vel, action)
+
+        return reward
+
+    def position_difference(self, pos):
+        """
+        Absolute angle between a position and the target position.
+
+        Parameters
+        ----------
+        pos : float
+            position of the pendulum [rad]
+
+        Returns
+        -------
+        pos_diff : float
+            absolute wrapped position difference in [0, pi] [rad]
+        """
+        pos_diff = self.target[0] - pos % (2*math.pi)
+        return abs((pos_diff + math.pi) % (math.pi * 2) - math.pi)
+
+    # reward functions with the position, the clipped velocity and the
+    # applied torque as inputs
+    def continuous_reward(self, pos, vel, action):
+        return - self.position_difference(pos)
+
+    def discrete_reward(self, pos, vel, action):
+        pos_diff = self.position_difference(pos)
+        return float(pos_diff < self.state_target_epsilon[0])
+
+    def soft_binary_reward(self, pos, vel, action):
+        pos_diff = self.position_difference(pos)
+        return math.exp(-pos_diff**2/(2*0.25**2))
+
+    def soft_binary_repellor_reward(self, pos, vel, action):
+        pos_diff = self.position_difference(pos)
+        reward = math.exp(-pos_diff ** 2 / (2 * 0.25 ** 2))
+        pos_diff_repellor = pos % (2*math.pi) - 0
+        reward -= math.exp(-pos_diff_repellor ** 2 / (2 * 0.25 ** 2))
         return reward
 
+    def open_ai_gym_reward(self, pos, vel, action):
+        pos_diff = self.position_difference(pos)
+        vel_diff = self.target[1] - vel
+        return (-(pos_diff)**2.0 -
+                0.1*(vel_diff)**2.0 -
+                0.001*action**2.0)
+
+    def open_ai_gym_red_torque_reward(self, pos, vel, action):
+        pos_diff = self.position_difference(pos)
+        vel_diff = self.target[1] - vel
+        return (-(pos_diff)**2.0 -
+                0.1*(vel_diff)**2.0 -
+                0.01*action**2.0)
+
     def check_final_condition(self):
         """
         Checks whether a terminating condition has been met.
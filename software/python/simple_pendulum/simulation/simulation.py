@@ -5,16 +5,44 @@ Simulator
 
 
 import time
+import math
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
-import matplotlib.animation as mplanimation
-from matplotlib.patches import Arc, RegularPolygon
 from numpy import radians as rad
 
+# matplotlib is imported in the animation functions, so that headless
+# simulations do not pay for its import
+
+# Butcher tableau of the Dormand-Prince method (RK5(4)7M)
+DP_C = np.array([0.0, 1/5, 3/10, 4/5, 8/9, 1.0])
+DP_A = [np.array([]),
+        np.array([1/5]),
+        np.array([3/40, 9/40]),
+        np.array([44/45, -56/15, 32/9]),
+        np.array([19372/6561, -25360/2187, 64448/6561, -212/729]),
+        np.array([9017/3168, -355/33, 46732/5247, 49/176, -5103/18656])]
+DP_B = np.array([35/384, 0.0, 500/1113, 125/192, -2187/6784, 11/84])
+# difference of the 5th and the embedded 4th order solution
+DP_E = np.array([71/57600, 0.0, -71/16695, 71/1920, -17253/339200, 22/525,
+                 -1/40])
+# coefficients of the continuous extension (dense output) of order 4,
+# y(t + theta h) = y + h sum_i k_i (P_i1 theta + ... + P_i4 theta^4)
+DP_P = np.array([
+    [1.0, -8048581381/2820520608, 8663915743/2820520608,
+     -12715105075/11282082432],
+    [0.0, 0.0, 0.0, 0.0],
+    [0.0, 131558114200/32700410799, -68118460800/10900136933,
+     87487479700/32700410799],
+    [0.0, -1754552775/470086768, 14199869525/1410260304,
+     -10690763975/1880347072],
+    [0.0, 127303824393/49829197408, -318862633887/49829197408,
+     701980252875/199316789632],
+    [0.0, -282668133/205662961, 2019193451/616988883,
+     -1453857185/822651844],
+    [0.0, 40617522/29380423, -110615467/29380423, 69997945/29380423]])
+
 
 class Simulator:
-    def __init__(self, plant):
+    def __init__(self, plant, recorder="list", rtol=1e-6, atol=1e-8):
         """
         Simulator class, can simulate and animate the pendulum
 
@@ -22,13 +50,34 @@ class Simulator:
         ----------
         plant: plant object
             (e.g. PendulumPlant from simple_pendulum.models.pendulum_plant.py)
+        recorder: string, default="list"
+            selects how the simulated data is recorded
+            "list" records the data in python lists of arrays,
+            "array" records the data in preallocated numpy arrays,
+            None disables the recording
+        rtol: float, default=1e-6
+            relative error tolerance of the "dormand_prince" integrator
+        atol: float, default=1e-8
+            absolute error tolerance of the "dormand_prince" integrator
         """
 
         self.plant = plant
+        if recorder not in ["list", "array", None]:
+            raise NotImplementedError(
+                   f'Sorry, the recorder {recorder} is not implemented.')
+        self.recorder = recorder
+        self.rtol = rtol
+        self.atol = atol
 
         self.x = np.zeros(2*self.plant.dof)  # position, velocity
         self.t = 0.0  # time
 
+        # internal step size and steps of the "dormand_prince" integrator
+        self._dp_step = None
+        self._dense_segments = []
+        # constants of the "fast_runge_kutta" integrator
+        self._fast_constants = None
+
         self.reset_data_recorder()
 
     def set_state(self, time, x):
@@ -43,8 +92,11 @@ class Simulator:
             state of the pendulum plant
         """
 
-        self.x = np.copy(x)
-        self.t = np.copy(float(time))
+        self.x = np.array(x, dtype=float)
+        self.t = float(time)
+        self._dp_step = None
+        self._dense_segments = []
+        self._fast_constants = None
 
     def get_state(self):
         """
@@ -60,14 +112,77 @@ class Simulator:
 
         return self.t, self.x
 
-    def reset_data_recorder(self):
+    def reset_data_recorder(self, n=None):
         """
         Reset the internal data recorder of the simulator
+
+        Parameters
+        ----------
+        n : int, default=None
+            expected number of records. Only used by the "array" recorder
+            to preallocate its buffers (which are grown if necessary).
+        """
+
+        if self.recorder == "array":
+            if n is None:
+                n = 1000
+            n = max(int(n), 1)
+            self._t_buffer = np.zeros(n)
+            self._x_buffer = np.zeros((n, 2*self.plant.dof))
+            self._tau_buffer = np.zeros((n, self.plant.n_actuators))
+            self._n_records = 0
+        else:
+            self._t_values = []
+            self._x_values = []
+            self._tau_values = []
+
+    def _grow_data_recorder(self):
+        """
+        Double the size of the buffers of the "array" recorder
+        """
+
+        n = 2*self._t_buffer.shape[0]
+        for name in ["_t_buffer", "_x_buffer", "_tau_buffer"]:
+            old = getattr(self, name)
+            new = np.zeros((n,) + old.shape[1:])
+            new[:self._n_records] = old[:self._n_records]
+            setattr(self, name, new)
+
+    @property
+    def t_values(self):
+        """
+        Recorded time values
+        (list for the "list" recorder, array of shape (T,) for the
+        "array" recorder)
+        """
+
+        if self.recorder == "array":
+            return self._t_buffer[:self._n_records]
+        return self._t_values
+
+    @property
+    def x_values(self):
+        """
+        Recorded states
+        (list for the "list" recorder, array of shape (T, 2*dof) for the
+        "array" recorder)
+        """
+
+        if self.recorder == "array":
+            return self._x_buffer[:self._n_records]
+        return self._x_values
+
+    @property
+    def tau_values(self):
+        """
+        Recorded torques
+        (list for the "list" recorder, array of shape (T, n_actuators)
+        for the "array" recorder)
         """
 
-        self.t_values = []
-        self.x_values = []
-        self.tau_values = []
+        if self.recorder == "array":
+            return self._tau_buffer[:self._n_records]
+        return self._tau_values
 
     def record_data(self, time, x, tau):
         """
@@ -83,9 +198,18 @@ class Simulator:
             torque to be recorded, unit: Nm
         """
 
-        self.t_values.append(np.copy(time))
-        self.x_values.append(np.copy(x))
-        self.tau_values.append(np.copy(tau))
+        if self.recorder == "list":
+            self._t_values.append(np.copy(time))
+            self._x_values.append(np.copy(x))
+            self._tau_values.append(np.copy(tau))
+        elif self.recorder == "array":
+            i = self._n_records
+            if i >= self._t_buffer.shape[0]:
+                self._grow_data_recorder()
+            self._t_buffer[i] = time
+            self._x_buffer[i] = x
+            self._tau_buffer[i] = tau
+            self._n_records += 1
 
     def euler_integrator(self, t, y, tau):
         """
@@ -133,7 +257,261 @@ class Simulator:
         k4 = self.plant.rhs(t + dt, y + dt * k3, tau)
         return (k1 + 2 * (k2 + k3) + k4) / 6.0
 
-    def step(self, tau, dt, integrator="runge_kutta"):
+    def _update_fast_constants(self):
+        """
+        Precompute the constants of the fast_runge_kutta integrator from
+        the plant parameters
+        """
+
+        for name in ["m", "l", "g", "b", "coulomb_fric", "inertia",
+                     "torque_limit"]:
+            if not hasattr(self.plant, name) or self.plant.dof != 1:
+                raise NotImplementedError(
+                    "Sorry, the fast_runge_kutta integrator is only "
+                    "implemented for the PendulumPlant.")
+        inv_inertia = 1.0 / self.plant.inertia
+        self._fast_constants = (
+            float(self.plant.m*self.plant.g*self.plant.l*inv_inertia),
+            float(self.plant.b*inv_inertia),
+            float(self.plant.coulomb_fric*inv_inertia),
+            float(inv_inertia),
+            float(self.plant.torque_limit))
+
+    def fast_runge_kutta_integrator(self, tau, dt):
+        """
+        Runge-Kutta step of a single pendulum on plain python floats.
+        Same result as the runge_kutta integrator with the PendulumPlant,
+        but without numpy overhead (no temporary arrays, no numpy
+        functions on scalars). The state self.x is updated in place.
+        The constants are computed from the plant parameters in set_state,
+        call set_state after changing the plant parameters.
+
+        Parameters
+        ----------
+        tau: float or array-like
+            torque input, unit: Nm
+        dt: float
+            time step, unit: s
+        """
+
+        if self._fast_constants is None:
+            self._update_fast_constants()
+        c_g, c_b, c_c, inv_inertia, limit = self._fast_constants
+
+        if isinstance(tau, (list, tuple, np.ndarray)):
+            tau = tau[0]
+        u = min(max(float(tau), -limit), limit)*inv_inertia
+        sin = math.sin
+        x = self.x
+        p = float(x[0])
+        v = float(x[1])
+        h = 0.5*dt
+
+        a1 = u - c_g*sin(p) - c_b*v - c_c*((v > 0.0) - (v < 0.0))
+        v2 = v + h*a1
+        a2 = u - c_g*sin(p + h*v) - c_b*v2 - c_c*((v2 > 0.0) - (v2 < 0.0))
+        v3 = v + h*a2
+        a3 = u - c_g*sin(p + h*v2) - c_b*v3 - c_c*((v3 > 0.0) - (v3 < 0.0))
+        v4 = v + dt*a3
+        a4 = u - c_g*sin(p + dt*v3) - c_b*v4 - c_c*((v4 > 0.0) - (v4 < 0.0))
+
+        x[0] = p + dt*(v + 2.0*(v2 + v3) + v4)/6.0
+        x[1] = v + dt*(a1 + 2.0*(a2 + a3) + a4)/6.0
+
+    def _implicit_velocity(self, pos, vel, tau, dt):
+        """
+        Velocity after a time step dt. The motor torque and gravity are
+        evaluated explicitly at pos, damping and coulomb friction
+        implicitly at the new velocity. The coulomb friction is exact,
+        i.e. the pendulum sticks if the friction can absorb the motion.
+        """
+
+        # acceleration without dissipation (zero velocity)
+        accn = self.plant.forward_dynamics([pos, 0.0], tau)
+        vel = vel + dt*accn
+        friction = dt*self.plant.coulomb_fric/self.plant.inertia
+        vel = vel - np.clip(vel, -friction, friction)
+        return vel / (1.0 + dt*self.plant.b/self.plant.inertia)
+
+    def symplectic_euler_integrator(self, t, y, dt, tau):
+        """
+        Semi-implicit (symplectic) Euler integrator for the simulated
+        plant. The velocity is updated first (damping and friction
+        implicitly), the position with the new velocity. The energy of the
+        free, undamped pendulum does not drift, which allows larger time
+        steps than the explicit Euler integrator.
+
+        Parameters
+        ----------
+        t : float
+            time, unit: s
+        y: type as self.plant expects a state
+            state of the pendulum
+        dt: float
+            time step, unit: s
+        tau: type as self.plant expects an actuation
+            torque input
+
+        Returns
+        -------
+        array-like : the mean integrand (y(t+dt) - y(t)) / dt
+        """
+
+        if isinstance(tau, (list, tuple, np.ndarray)):
+            tau = tau[0]
+        vel = self._implicit_velocity(y[0], y[1], tau, dt)
+        return np.array([vel, (vel - y[1]) / dt])
+
+    def verlet_integrator(self, t, y, dt, tau):
+        """
+        Velocity Verlet integrator for the simulated plant.
+        Two half steps of the velocity (damping and friction implicitly)
+        around a full step of the position. Second order accurate and
+        symplectic for the undamped pendulum.
+
+        Parameters
+        ----------
+        t : float
+            time, unit: s
+        y: type as self.plant expects a state
+            state of the pendulum
+        dt: float
+            time step, unit: s
+        tau: type as self.plant expects an actuation
+            torque input
+
+        Returns
+        -------
+        array-like : the mean integrand (y(t+dt) - y(t)) / dt
+        """
+
+        if isinstance(tau, (list, tuple, np.ndarray)):
+            tau = tau[0]
+        vel_half = self._implicit_velocity(y[0], y[1], tau, 0.5*dt)
+        pos = y[0] + dt*vel_half
+        vel = self._implicit_velocity(pos, vel_half, tau, 0.5*dt)
+        return np.array([vel_half, (vel - y[1]) / dt])
+
+    def dormand_prince_integrator(self, t, y, dt, tau):
+        """
+        Adaptive Dormand-Prince (RK45) integrator for the simulated plant.
+        Integrates from t to t+dt with as few internal steps as the error
+        tolerances self.rtol and self.atol allow. The internal step size is
+        kept between calls and the internal steps are stored for
+        dense_output.
+
+        Parameters
+        ----------
+        t : float
+            time, unit: s
+        y: type as self.plant expects a state
+            state of the pendulum
+        dt: float
+            time step, unit: s
+        tau: type as self.plant expects an actuation
+            torque input, constant during the time step
+
+        Returns
+        -------
+        array-like : the mean integrand (y(t+dt) - y(t)) / dt
+        """
+
+        y0 = np.array(y, dtype=float)
+        y = np.copy(y0)
+        t = float(t)
+        t_end = t + dt
+        # smallest step, accepted without error control to guarantee
+        # progress (e.g. at discontinuities of the Coulomb friction)
+        min_step = 1e-10*dt
+        h_next = dt if self._dp_step is None else self._dp_step
+
+        k = np.zeros((7, y.shape[0]))
+        if (len(self._dense_segments) > 0 and
+                np.allclose(self._dp_last[0], y, rtol=1e-14, atol=1e-14) and
+                np.array_equal(self._dp_last[1], tau)):
+            # continuation of the last step with the same torque
+            k[0] = self._dp_last[2]
+        else:
+            k[0] = self.plant.rhs(t, y, tau)
+        self._dense_segments = []
+        while t_end - t > 1e-12*dt:
+            h = min(h_next, t_end - t)
+            for i in range(1, 6):
+                k[i] = self.plant.rhs(t + DP_C[i]*h,
+                                      y + h*DP_A[i].dot(k[:i]), tau)
+            y_new = y + h*DP_B.dot(k[:6])
+            k[6] = self.plant.rhs(t + h, y_new, tau)
+
+            scale = self.atol + self.rtol*np.maximum(np.abs(y),
+                                                     np.abs(y_new))
+            error = np.sqrt(np.mean((h*DP_E.dot(k)/scale)**2))
+            if error == 0.0:
+                factor = 10.0
+            else:
+                factor = min(10.0, max(0.2, 0.9*error**-0.2))
+
+            if error <= 1.0 or h <= min_step:
+                self._dense_segments.append((t, h, y, k.T.dot(DP_P)))
+                t += h
+                y = y_new
+                # first same as last: the last stage is the first of the
+                # next step
+                k[0] = k[6]
+                if h < h_next:
+                    # shortened to reach t_end, keep the proposed step
+                    h_next = max(h_next, factor*h)
+                else:
+                    h_next = factor*h
+            else:
+                h_next = max(factor*h, min_step)
+        self._dp_step = h_next
+        self._dp_last = (y, np.copy(tau), np.copy(k[0]))
+        return (y - y0) / dt
+
+    def dense_output(self, t):
+        """
+        Evaluate the state at arbitrary times within the last step of the
+        "dormand_prince" integrator with the continuous extension of the
+        method (order 4), e.g. to record the trajectory at a finer or
+        different time grid than the controller sampling.
+
+        Parameters
+        ----------
+        t : float or array-like, shape=(T,)
+            time(s) within the last step, unit: s
+
+        Returns
+        -------
+        array-like, shape=(2*dof,) or (T, 2*dof)
+            state(s) at the time(s) t
+        """
+
+        if len(self._dense_segments) == 0:
+            raise ValueError("No dense output available, the last step "
+                             "was not computed with the dormand_prince "
+                             "integrator.")
+        times = np.atleast_1d(np.asarray(t, dtype=float))
+        t_first = self._dense_segments[0][0]
+        t_last = self._dense_segments[-1][0] + self._dense_segments[-1][1]
+        tolerance = 1e-12*max(1.0, abs(t_last))
+        if (np.any(times < t_first - tolerance) or
+                np.any(times > t_last + tolerance)):
+            raise ValueError(f"The dense output is only available for "
+                             f"times in [{t_first}, {t_last}].")
+
+        starts = np.array([segment[0] for segment in self._dense_segments])
+        indices = np.clip(np.searchsorted(starts, times, side="right") - 1,
+                          0, len(starts) - 1)
+        states = np.zeros((len(times), len(self._dense_segments[0][2])))
+        for j, (time, i) in enumerate(zip(times, indices)):
+            t0, h, y0, Q = self._dense_segments[i]
+            theta = (time - t0) / h
+            states[j] = y0 + h*Q.dot(theta**np.arange(1, 5))
+        if np.ndim(t) == 0:
+            return states[0]
+        return states
+
+    def step(self, tau, dt, integrator="runge_kutta", record=True):
         """
         Performs a single step of the plant.
 
@@ -146,17 +524,37 @@ class Simulator:
         integrator: string
             "euler" for euler integrator
             "runge_kutta" for Runge-Kutta integrator
+            "dormand_prince" for the adaptive Dormand-Prince (RK45)
+            integrator, dt is then the interval between two controller
+            samples and the internal step size is chosen by error control
+            "symplectic_euler" for the semi-implicit euler integrator
+            "velocity_verlet" for the velocity verlet integrator
+            "fast_runge_kutta" for the Runge-Kutta integrator on python
+            floats (only for the PendulumPlant)
+        record: bool, default=True
+            whether to record the new state in the data recorder
         """
 
-        if integrator == "runge_kutta":
+        if integrator == "fast_runge_kutta":
+            self.fast_runge_kutta_integrator(tau, dt)
+        elif integrator == "runge_kutta":
             self.x += dt * self.runge_integrator(self.t, self.x, dt, tau)
+        elif integrator == "dormand_prince":
+            self.x += dt * self.dormand_prince_integrator(self.t, self.x,
+                                                          dt, tau)
+        elif integrator == "symplectic_euler":
+            self.x += dt * self.symplectic_euler_integrator(self.t, self.x,
+                                                            dt, tau)
+        elif integrator == "velocity_verlet":
+            self.x += dt * self.verlet_integrator(self.t, self.x, dt, tau)
         elif integrator == "euler":
             self.x += dt * self.euler_integrator(self.t, self.x, tau)
         else:
             raise NotImplementedError(
                    f'Sorry, the integrator {integrator} is not implemented.')
         self.t += dt
-        self.record_data(self.t, self.x.copy(), tau)
+        if record:
+            self.record_data(self.t, self.x, tau)
 
     def simulate(self, t0, x0, tf, dt, controller=None,
                  integrator="runge_kutta"):
@@ -177,20 +575,28 @@ class Simulator:
                     If None, a free pendulum is simulated.
         integrator: string
             "euler" for euler integrator,
-            "runge_kutta" for Runge-Kutta integrator
+            "runge_kutta" for Runge-Kutta integrator,
+            "dormand_prince" for the adaptive Dormand-Prince integrator,
+            "symplectic_euler" for the semi-implicit euler integrator,
+            "velocity_verlet" for the velocity verlet integrator,
+            "fast_runge_kutta" for the Runge-Kutta integrator on python
+            floats (only for the PendulumPlant)
 
         Returns
         -------
-        self.t_values : list
+        self.t_values : list or array-like
             a list of time values
-        self.x_values : list
+            (array of shape (T,) for the "array" recorder)
+        self.x_values : list or array-like
             a list of states
-        self.tau_values : list
+            (array of shape (T, 2*dof) for the "array" recorder)
+        self.tau_values : list or array-like
             a list of torques
+            (array of shape (T, n_actuators) for the "array" recorder)
         """
 
         self.set_state(t0, x0)
-        self.reset_data_recorder()
+        self.reset_data_recorder(n=int((tf - t0) / dt) + 2)
 
         while (self.t <= tf):
             if controller is not None:
@@ -350,8 +756,12 @@ class Simulator:
             a list of torques
         """
 
+        import matplotlib.pyplot as plt
+        from matplotlib.animation import FuncAnimation
+        import matplotlib.animation as mplanimation
+
         self.set_state(t0, x0)
-        self.reset_data_recorder()
+        self.reset_data_recorder(n=int((tf - t0) / dt) + 2)
 
         fig = plt.figure(figsize=(20, 20))
         self.animation_ax = plt.axes()
@@ -406,6 +816,8 @@ class Simulator:
 
 
 def get_arrow(radius, centX, centY, angle_, theta2_, color_='black'):
+    from matplotlib.patches import Arc, RegularPolygon
+
     arc = Arc([centX, centY],
               radius,
               radius,
@@ -0,0 +1,232 @@
+"""
+Unit Tests
+==========
+"""
+
+
+import unittest
+import numpy as np
+
+from simple_pendulum.model.pendulum_plant import PendulumPlant
+from simple_pendulum.simulation.simulation import Simulator
+from simple_pendulum.simulation.batch_simulation import BatchSimulator
+from simple_pendulum.controllers.abstract_controller import \
+    AbstractController
+from simple_pendulum.controllers.lqr.lqr_controller import LQRController
+from simple_pendulum.trajectory_optimization.ilqr.pendulum import (
+                            pendulum_discrete_dynamics_symplectic_euler,
+                            pendulum_discrete_dynamics_verlet)
+
+
+class Test(unittest.TestCase):
+
+    n_pendulums = 20
+    epsilon = 1e-9
+
+    def test_0_batch_simulation(self):
+        """
+        Unit test comparing the batch simulator with single simulations
+        """
+        plants = []
+        for _ in range(self.n_pendulums):
+            mass = np.random.rand() + 0.1
+            length = np.random.rand() + 0.1
+            plants.append(PendulumPlant(mass=mass,
+                                        length=length,
+                                        damping=np.random.rand()*0.2,
+                                        gravity=9.81,
+                                        coulomb_fric=np.random.rand()*0.1,
+                                        inertia=mass*length*length,
+                                        torque_limit=1.0))
+
+        batch_sim = BatchSimulator.from_plants(plants)
+        x0 = (np.random.rand(self.n_pendulums, 2) - 0.5) * 4.0
+        tau = (np.random.rand(self.n_pendulums) - 0.5) * 4.0
+
+        for integrator in ["euler", "runge_kutta"]:
+            batch_sim.set_state(0.0, x0)
+            for _ in range(100):
+                batch_sim.step(tau, 0.01, integrator=integrator)
+            _, X = batch_sim.get_state()
+
+            for i, plant in enumerate(plants):
+                sim = Simulator(plant=plant)
+                sim.set_state(0.0, x0[i])
+                for _ in range(100):
+                    sim.step(tau[i], 0.01, integrator=integrator)
+                _, x = sim.get_state()
+                self.assertTrue(np.max(np.abs(X[i] - x)) < self.epsilon)
+
+    def test_1_batch_simulation_recording(self):
+        """
+        Unit test for the shapes of the batch simulator recordings
+        """
+        batch_sim = BatchSimulator(n=self.n_pendulums, torque_limit=2.0)
+        T, X, U = batch_sim.simulate(t0=0.0,
+                                     x0=[0.5, 0.0],
+                                     tf=1.0,
+                                     dt=0.01)
+        self.assertEqual(X.shape, (len(T), self.n_pendulums, 2))
+        self.assertEqual(U.shape, (len(T), self.n_pendulums))
+
+    def test_2_array_recorder(self):
+        """
+        Unit test comparing the array recorder with the list recorder
+        """
+        plant = PendulumPlant(torque_limit=1.0)
+        list_sim = Simulator(plant=plant, recorder="list")
+        array_sim = Simulator(plant=plant, recorder="array")
+        off_sim = Simulator(plant=plant, recorder=None)
+
+        T1, X1, U1 = list_sim.simulate(t0=0.0, x0=[0.5, 0.0], tf=2.0, dt=0.01)
+        T2, X2, U2 = array_sim.simulate(t0=0.0, x0=[0.5, 0.0], tf=2.0, dt=0.01)
+        T3, X3, U3 = off_sim.simulate(t0=0.0, x0=[0.5, 0.0], tf=2.0, dt=0.01)
+
+        self.assertEqual(X2.shape, (len(T1), 2))
+        self.assertEqual(U2.shape, (len(T1), plant.n_actuators))
+        self.assertTrue(np.max(np.abs(np.asarray(X1) - X2)) < self.epsilon)
+        self.assertEqual(len(T3), 0)
+
+        # buffers grow beyond the preallocated size
+        array_sim.reset_data_recorder(n=1)
+        for _ in range(10):
+            array_sim.step(0.0, 0.01)
+        self.assertEqual(array_sim.x_values.shape, (10, 2))
+
+    def test_3_dormand_prince(self):
+        """
+        Unit test comparing the adaptive Dormand-Prince integrator with a
+        fine Runge-Kutta simulation
+        """
+        plant = PendulumPlant(mass=0.57, length=0.5, damping=0.05,
+                              torque_limit=2.0)
+        n_rhs = [0]
+        rhs = plant.rhs
+
+        def counting_rhs(t, state, tau):
+            n_rhs[0] += 1
+            return rhs(t, state, tau)
+        plant.rhs = counting_rhs
+
+        reference = Simulator(plant=plant, recorder=None)
+        reference.set_state(0.0, [2.5, 0.0])
+        for _ in range(20000):
+            reference.step(0.0, 1e-4)
+        n_rhs[0] = 0
+
+        sim = Simulator(plant=plant, rtol=1e-9, atol=1e-11)
+        sim.set_state(0.0, [2.5, 0.0])
+        for _ in range(20):
+            sim.step(0.0, 0.1, integrator="dormand_prince")
+        self.assertTrue(np.max(np.abs(sim.x - reference.x)) < 1e-6)
+        # runge_kutta with dt=1e-3 needs 8000 evaluations
+        self.assertTrue(n_rhs[0] < 2000)
+
+        # dense output within the last step
+        t_last, x_last = sim.t, np.copy(sim.x)
+        self.assertTrue(np.allclose(sim.dense_output(t_last), x_last))
+        X = sim.dense_output(np.linspace(t_last - 0.1, t_last, 5))
+        self.assertEqual(X.shape, (5, 2))
+        self.assertTrue(np.allclose(X[0], sim.x_values[-2]))
+        self.assertRaises(ValueError, sim.dense_output, t_last + 1.0)
+
+    def test_4_symplectic_integrators(self):
+        """
+        Unit test for the energy behaviour of the symplectic integrators
+        at a large time step
+        """
+        plant = PendulumPlant(mass=0.57, length=0.5, damping=0.0,
+                              torque_limit=2.0)
+        E0 = plant.total_energy([2.5, 0.0])
+        for integrator, tolerance in [("symplectic_euler", 0.15),
+                                      ("velocity_verlet", 0.01)]:
+            sim = Simulator(plant=plant, recorder="array")
+            sim.set_state(0.0, [2.5, 0.0])
+            for _ in range(400):
+                sim.step(0.0, 0.05, integrator=integrator)
+            E = [plant.total_energy(x) for x in sim.x_values]
+            self.assertTrue(np.max(np.abs(np.array(E) - E0)) < tolerance*E0)
+
+        # explicit euler gains energy
+        sim.set_state(0.0, [2.5, 0.0])
+        for _ in range(400):
+            sim.step(0.0, 0.05, integrator="euler")
+        self.assertTrue(plant.total_energy(sim.x) > 2.0*E0)
+
+        # coulomb friction sticks instead of chattering around zero
+        plant.b = 0.1
+        plant.coulomb_fric = 0.2
+        sim.set_state(0.0, [2.5, 0.0])
+        for _ in range(400):
+            sim.step(0.0, 0.05, integrator="velocity_verlet")
+        self.assertEqual(sim.x[1], 0.0)
+
+    def test_5_symplectic_planning_dynamics(self):
+        """
+        Unit test comparing the symplectic integrators of the simulator
+        with the discrete dynamics for trajectory optimization
+        """
+        plant = PendulumPlant(mass=0.57, length=0.5, damping=0.1,
+                              torque_limit=2.0)
+        sim = Simulator(plant=plant)
+        x0 = np.array([2.5, 0.3])
+        for integrator, dynamics in [
+                ("symplectic_euler",
+                 pendulum_discrete_dynamics_symplectic_euler),
+                ("velocity_verlet", pendulum_discrete_dynamics_verlet)]:
+            sim.set_state(0.0, x0)
+            sim.step(np.array([0.5]), 0.05, integrator=integrator)
+            x = dynamics(x0, np.array([0.5]), 0.05, m=plant.m, l=plant.l,
+                         b=plant.b, cf=0.0, g=plant.g,
+                         inertia=plant.inertia)
+            self.assertTrue(np.max(np.abs(sim.x - x)) < self.epsilon)
+
+    def test_6_fast_runge_kutta(self):
+        """
+        Unit test comparing the scalar Runge-Kutta kernel with the
+        Runge-Kutta integrator
+        """
+        plant = PendulumPlant(mass=0.57, length=0.5, damping=0.1,
+                              coulomb_fric=0.05, torque_limit=1.0)
+        sim = Simulator(plant=plant, recorder="array")
+        fast_sim = Simulator(plant=plant, recorder="array")
+        for x0 in [[2.5, 0.0], [0.0, 0.0], [-1.0, 4.0]]:
+            sim.set_state(0.0, x0)
+            fast_sim.set_state(0.0, x0)
+            for i in range(500):
+                # exceeds the torque limit
+                tau = np.array([2.0*np.sin(0.02*i)])
+                sim.step(tau, 0.005, integrator="runge_kutta")
+                fast_sim.step(tau, 0.005, integrator="fast_runge_kutta")
+            self.assertTrue(np.max(np.abs(sim.x_values -
+                                          fast_sim.x_values)) < 1e-12)
+            self.assertEqual(sim.t, fast_sim.t)
+
+    def test_7_batch_simulation_controller(self):
+        """
+        Unit test for the batch simulation with a controller, with the
+        vectorized and the default batch control output
+        """
+        class LoopedLQRController(LQRController):
+            get_control_output_batch = \
+                AbstractController.get_control_output_batch
+
+        x0 = np.zeros((self.n_pendulums, 2))
+        x0[:, 0] = np.pi + (np.random.rand(self.n_pendulums) - 0.5)*0.2
+        X = []
+        for controller_class in [LQRController, LoopedLQRController]:
+            controller = controller_class(mass=0.57288, length=0.5,
+                                          damping=0.15, torque_limit=2.0)
+            batch_sim = BatchSimulator(n=self.n_pendulums, mass=0.57288,
+                                       length=0.5, damping=0.15,
+                                       torque_limit=2.0)
+            _, X_c, U_c = batch_sim.simulate(t0=0.0, x0=x0, tf=2.0,
+                                             dt=0.01, controller=controller)
+            X.append(X_c)
+        self.assertTrue(np.max(np.abs(X[0] - X[1])) < self.epsilon)
+        # stabilized at the top
+        self.assertTrue(np.max(np.abs(X[0][-1, :, 0] - np.pi)) < 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,351 @@
+"""
+Vectorized Gym Environment
+==========================
+"""
+
+
+# Other imports
+import gym
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv
+
+
+class SimplePendulumVecEnv(VecEnv):
+    """
+    A vectorized environment for reinforcement learning which steps all
+    pendulums of a BatchSimulator at once.
+    """
+    def __init__(self,
+                 simulator,
+                 max_steps=5000,
+                 target=[np.pi, 0.0],
+                 state_target_epsilon=[1e-2, 1e-2],
+                 reward_type='continuous',
+                 dt=1e-3,
+                 integrator='runge_kutta',
+                 state_representation=2,
+                 validation_limit=-150,
+                 scale_action=True,
+                 random_init="start_vicinity"):
+        """
+        A vectorized environment for reinforcement learning.
+        It implements the VecEnv interface of stable-baselines3 with one
+        environment per pendulum of the batch simulator. Observations,
+        rewards and resets are computed for all environments with array
+        operations and behave like the ones of the SimplePendulumEnv.
+        Environments whose episode has ended are reset automatically, the
+        last observation of the episode is returned in the info dict
+        under the key "terminal_observation".
+
+        Parameters
+        ----------
+        simulator : BatchSimulator object
+            the number of environments is the number of pendulums
+            of the simulator
+        max_steps : int, default=5000
+            maximum steps the agent can take before the episode
+            is terminated
+        target : array-like, default=[np.pi, 0.0]
+            the target state of the pendulum
+        state_target_epsilon: array-like, default=[1e-2, 1e-2]
+            target epsilon for discrete reward type
+        reward_type : string, default='continuous'
+            the reward type selects the reward function which is used
+            options are: 'continuous', 'discrete', 'soft_binary',
+                         'soft_binary_with_repellor', 'open_ai_gym'
+        dt : float, default=1e-3
+            timestep for the simulation
+        integrator : string, default='runge_kutta'
+            the integrator which is used by the simulator
+            options : 'euler', 'runge_kutta'
+        state_representation : int, default=2
+            determines how the state space of the pendulum is represented
+            2 means state = [position, velocity]
+            3 means state = [cos(position), sin(position), velocity]
+        validation_limit : float, default=-150
+            If the reward during validation episodes surpasses this value
+            the training stops early
+        scale_action : bool, default=True
+            whether to scale the output of the model with the torque limit
+            of the simulator.
+            If True the model is expected so return values in the intervall
+            [-1, 1] as action.
+        random_init : string, default="start_vicinity"
+            A string determining the random state initialisation at the
+            start of every episode
+            "False" : The pendulum is set to [0, 0],
+            "start_vicinity" : The pendulum position and velocity
+                               are set in the range [-0.31, -0.31],
+            "everywhere" : The pendulum is set to a random state in the whole
+                           possible state space
+        """
+        self.simulator = simulator
+        self.max_steps = max_steps
+        self.target = target
+        self.target[0] = self.target[0] % (2*np.pi)
+        self.state_target_epsilon = state_target_epsilon
+        self.reward_type = reward_type
+        self.dt = dt
+        self.integrator = integrator
+        self.state_representation = state_representation
+        self.validation_limit = validation_limit
+        self.scale_action = scale_action
+        self.random_init = random_init
+
+        # one torque limit per pendulum
+        self.torque_limit = simulator.torque_limit
+        max_torque = float(np.max(self.torque_limit))
+
+        if state_representation == 2:
+            # state is [th, vel]
+            self.low = np.array([-6*2*np.pi, -8])
+            self.high = np.array([6*2*np.pi, 8])
+        elif state_representation == 3:
+            # state is [cos(th), sin(th), vel]
+            self.low = np.array([-1., -1., -8.])
+            self.high = np.array([1., 1., 8.])
+        else:
+            raise NotImplementedError(
+                f'Sorry, state representation {state_representation} ' +
+                'is not implemented.')
+        observation_space = gym.spaces.Box(self.low, self.high)
+
+        if scale_action:
+            action_space = gym.spaces.Box(-1, 1, shape=[1])
+        else:
+            action_space = gym.spaces.Box(-max_torque, max_torque,
+                                          shape=[1])
+
+        super().__init__(simulator.n, observation_space, action_space)
+
+        self.state_shape = self.observation_space.shape
+        self.n_actions = self.action_space.shape[0]
+        self.n_states = self.observation_space.shape[0]
+        self.action_limits = [-max_torque, max_torque]
+
+        self.np_random = np.random.RandomState()
+        self.simulator.set_state(0, [0.0, 0.0])
+        self.step_count = np.zeros(self.num_envs, dtype=int)
+        self.actions = np.zeros(self.num_envs)
+
+    def reset(self):
+        """
+        Reset all environments with the random initialization
+        random_init.
+
+        Returns
+        -------
+        observations : array-like, shape=(num_envs, n_states)
+            the observations of the initial states
+        """
+        self.simulator.reset_data_recorder()
+        self.step_count[:] = 0
+        self.simulator.set_state(0, self.initial_states(self.num_envs))
+        return self.get_observation_batch(self.simulator.x)
+
+    def initial_states(self, n):
+        """
+        Draw random initial states.
+
+        Parameters
+        ----------
+        n : int
+            number of states
+
+        Returns
+        -------
+        states : array-like, shape=(n, 2)
+
+        Raises:
+        -------
+        NotImplementedError
+            when random_init does not indicate one of the implemented
+            initializations
+        """
+        if self.random_init == "False":
+            return np.zeros((n, 2))
+        elif self.random_init == "start_vicinity":
+            pos_range = np.pi/10
+            vel_range = np.pi/10
+        elif self.random_init == "everywhere":
+            pos_range = np.pi
+            vel_range = 1.0
+        else:
+            raise NotImplementedError(
+                f'Sorry, random initialization {self.random_init}' +
+                'is not implemented.')
+        ranges = np.array([pos_range, vel_range])
+        return self.np_random.rand(n, 2)*2*ranges - ranges
+
+    def step_async(self, actions):
+        """
+        Store the actions for the next call of step_wait.
+
+        Parameters
+        ----------
+        actions : array-like, shape=(num_envs, 1)
+            the torques that are applied to the pendulums
+        """
+        self.actions = np.asarray(actions, dtype=float).reshape(
+                                                            self.num_envs)
+
+    def step_wait(self):
+        """
+        Take a step in all environments with the actions from step_async.
+
+        Returns
+        -------
+        observations : array-like, shape=(num_envs, n_states)
+            the observations from the environments after the step
+            (after the reset for environments whose episode has ended)
+        rewards : array-like, shape=(num_envs,)
+            the rewards received on this step
+        dones : array-like, shape=(num_envs,)
+            whether the episodes have terminated
+        infos : list of dictionaries
+            contain the terminal observation of ended episodes
+        """
+        if self.scale_action:
+            a = self.torque_limit * self.actions  # rescaling the actions
+        else:
+            a = self.actions
+        self.simulator.step(a, self.dt, self.integrator)
+        current_state = self.simulator.x
+        rewards = self.swingup_reward_batch(current_state, a)
+        observations = self.get_observation_batch(current_state)
+        dones = self.step_count > self.max_steps
+        self.step_count += 1
+        infos = [{} for _ in range(self.num_envs)]
+
+        for i in np.flatnonzero(dones):
+            infos[i]["terminal_observation"] = observations[i].copy()
+        if np.any(dones):
+            n_done = np.count_nonzero(dones)
+            current_state[dones] = self.initial_states(n_done)
+            observations[dones] = self.get_observation_batch(
+                                                    current_state[dones])
+            self.step_count[dones] = 0
+
+        return observations, rewards, dones, infos
+
+    def close(self):
+        pass
+
+    def seed(self, seed=None):
+        """
+        Seed the random initialization of the environments.
+
+        Parameters
+        ----------
+        seed : int, default=None
+
+        Returns
+        -------
+        seeds : list
+            the seed of every environment
+        """
+        self.np_random.seed(seed)
+        return [seed for _ in range(self.num_envs)]
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name)
+                for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None,
+                   **method_kwargs):
+        method = getattr(self, method_name)
+        return [method(*method_args, **method_kwargs)
+                for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
+
+    def _get_indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
+
+    # some helper methods
+    def get_observation_batch(self, states):
+        """
+        Transform the states from the simulator to observations, see
+        SimplePendulumEnv.get_observation.
+
+        Parameters
+        ----------
+        states : array-like, shape=(n, 2)
+            states as output by the simulator
+
+        Returns
+        -------
+        observations : array-like, shape=(n, n_states)
+            observations in environment format
+        """
+        pos = states[:, 0]
+        vel = np.clip(states[:, 1], self.low[-1], self.high[-1])
+
+        if self.state_representation == 2:
+            pos = (pos + 6*np.pi) % (np.pi*6*2) - 6*np.pi
+            observations = np.stack((pos, vel), axis=1)
+        elif self.state_representation == 3:
+            observations = np.stack((np.cos(pos), np.sin(pos), vel), axis=1)
+
+        return observations.astype(np.float32)
+
+    def swingup_reward_batch(self, states, actions):
+        """
+        Calculate the rewards of all pendulums for swinging up to the
+        instable fixpoint, see SimplePendulumEnv.swingup_reward.
+
+        Parameters
+        ----------
+        states : array-like, shape=(n, 2)
+            the states of the pendulums
+        actions : array-like, shape=(n,)
+            the torques applied to the pendulums
+
+        Returns
+        -------
+        rewards : array-like, shape=(n,)
+            the rewards for swinging up
+
+        Raises
+        ------
+        NotImplementedError
+            when the requested reward_type is not implemented
+        """
+        pos = states[:, 0] % (2*np.pi)
+        pos_diff = self.target[0] - pos
+        pos_diff = np.abs((pos_diff + np.pi) % (np.pi * 2) - np.pi)
+        vel = np.clip(states[:, 1], self.low[-1], self.high[-1])
+
+        if self.reward_type == 'continuous':
+            rewards = - pos_diff
+        elif self.reward_type == 'discrete':
+            rewards = (pos_diff < self.state_target_epsilon[0]).astype(float)
+        elif self.reward_type == 'soft_binary':
+            rewards = np.exp(-pos_diff**2/(2*0.25**2))
+        elif self.reward_type == 'soft_binary_with_repellor':
+            rewards = np.exp(-pos_diff ** 2 / (2 * 0.25 ** 2))
+            pos_diff_repellor = pos - 0
+            rewards -= np.exp(-pos_diff_repellor ** 2 / (2 * 0.25 ** 2))
+        elif self.reward_type == "open_ai_gym":
+            vel_diff = self.target[1] - vel
+            rewards = (-(pos_diff)**2.0 -
+                       0.1*(vel_diff)**2.0 -
+                       0.001*actions**2.0)
+        elif self.reward_type == "open_ai_gym_red_torque":
+            vel_diff = self.target[1] - vel
+            rewards = (-(pos_diff)**2.0 -
+                       0.1*(vel_diff)**2.0 -
+                       0.01*actions**2.0)
+        else:
+            raise NotImplementedError(
+                f'Sorry, reward type {self.reward_type} is not implemented.')
+
+        return rewards.astype(np.float32)
@@ -0,0 +1,161 @@
+"""
+Box QP
+======
+
+Quadratic programs with box constraints for the control-limited
+backward pass of the iLQR algorithm [1].
+
+[1] Y. Tassa, N. Mansard and E. Todorov, "Control-limited differential
+dynamic programming," 2014 IEEE International Conference on Robotics and
+Automation (ICRA), 2014, pp. 1168-1175.
+"""
+
+import numpy as np
+
+
+def box_qp(H, g, lower, upper, x0=None, max_iter=100, min_grad=1e-8,
+           min_step=1e-22, armijo=0.1):
+    """
+    Projected Newton method for
+
+        min 0.5 x^T H x + g^T x   s.t.   lower <= x <= upper
+
+    At every iteration the variables which are at a bound with the gradient
+    pointing outwards are clamped and a Newton step is taken in the
+    remaining (free) variables, followed by a projected backtracking line
+    search.
+
+    Parameters
+    ----------
+    H : array-like, shape=(n, n)
+        positive definite Hessian
+    g : array-like, shape=(n,)
+        gradient
+    lower : array-like, shape=(n,)
+        lower bounds
+    upper : array-like, shape=(n,)
+        upper bounds
+    x0 : array-like, shape=(n,), default=None
+        initial guess, projected onto the box. Zeros if None.
+    max_iter : int, default=100
+        maximum number of Newton iterations
+    min_grad : float, default=1e-8
+        the iteration stops when the norm of the gradient of the free
+        variables is below min_grad
+    min_step : float, default=1e-22
+        smallest step size of the line search
+    armijo : float, default=0.1
+        required fraction of the linearly predicted improvement in the
+        line search
+
+    Returns
+    -------
+    x : array-like, shape=(n,)
+        solution
+    free : array-like, shape=(n,), dtype=bool
+        mask of the variables which are not clamped at a bound
+    """
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+    n = len(g)
+    if x0 is None:
+        x = np.zeros(n)
+    else:
+        x = np.asarray(x0, dtype=float)
+    x = np.clip(x, lower, upper)
+
+    def value(x):
+        return 0.5*x.dot(H.dot(x)) + g.dot(x)
+
+    free = np.ones(n, dtype=bool)
+    for _ in range(max_iter):
+        grad = g + H.dot(x)
+        clamped = (((x <= lower) & (grad > 0.0)) |
+                   ((x >= upper) & (grad < 0.0)))
+        free = ~clamped
+        if not np.any(free) or np.linalg.norm(grad[free]) < min_grad:
+            break
+
+        # Newton step in the free variables
+        step = np.zeros(n)
+        step[free] = -np.linalg.solve(H[np.ix_(free, free)], grad[free])
+
+        # projected backtracking line search
+        f_x = value(x)
+        alpha = 1.0
+        while alpha > min_step:
+            x_new = np.clip(x + alpha*step, lower, upper)
+            if value(x_new) - f_x <= armijo*grad.dot(x_new - x):
+                break
+            alpha *= 0.6
+        else:
+            break
+        x = x_new
+    return x, free
+
+
+def clamped_gains(Q_uu, Q_u, Q_ux, lower, upper, k0=None):
+    """
+    Feedforward and feedback gains of the control-limited backward pass.
+    The feedforward gain k solves the box QP of the control update, the
+    rows of the feedback gain K which belong to clamped controls are zero.
+
+    Parameters
+    ----------
+    Q_uu : array-like, shape=(n_u, n_u)
+        (regularized) Hessian of the Q function with respect to u
+    Q_u : array-like, shape=(n_u,)
+        gradient of the Q function with respect to u
+    Q_ux : array-like, shape=(n_u, n_x)
+        mixed derivatives of the Q function
+    lower : array-like, shape=(n_u,)
+        lower bounds of the control update (u_min - u)
+    upper : array-like, shape=(n_u,)
+        upper bounds of the control update (u_max - u)
+    k0 : array-like, shape=(n_u,), default=None
+        initial guess for k (e.g. the gain of the previous iteration)
+
+    Returns
+    -------
+    k : array-like, shape=(n_u,)
+        feedforward gain
+    K : array-like, shape=(n_u, n_x)
+        feedback gain
+    """
+    k, free = box_qp(Q_uu, Q_u, lower, upper, x0=k0)
+    K = np.zeros(Q_ux.shape)
+    if np.any(free):
+        K[free] = -np.linalg.solve(Q_uu[np.ix_(free, free)], Q_ux[free])
+    return k, K
+
+
+def control_bounds(u_min, u_max, n_u):
+    """
+    Control limits of the control-limited iLQR calculators as arrays.
+    With control limits the gains are computed with a box-constrained
+    backward pass and the controls of the forward pass are clipped to
+    the limits.
+
+    Parameters
+    ----------
+    u_min : array-like or float
+        lower control limits, shape=(n_u,) or float
+        no lower limits if None
+    u_max : array-like or float
+        upper control limits, shape=(n_u,) or float
+        no upper limits if None
+    n_u : int
+        The size of the control space.
+
+    Returns
+    -------
+    bounds : tuple
+        lower and upper limits (arrays of shape (n_u,), -inf/inf where
+        there is no limit), None if there are no limits at all
+    """
+    if u_min is None and u_max is None:
+        return None
+    lower = -np.inf if u_min is None else u_min
+    upper = np.inf if u_max is None else u_max
+    return (np.broadcast_to(lower, (n_u,)).astype(float),
+            np.broadcast_to(upper, (n_u,)).astype(float))
@@ -5,9 +5,91 @@ iLQR Calculator
 Large parts taken from `Russ Tedrake <https://github.com/RussTedrake/underactuated>`_.
 """
 
+from functools import partial
+
 import numpy as np
+import sympy as smp
 import pydrake.symbolic as sym
 
+from simple_pendulum.trajectory_optimization.ilqr.riccati import \
+    RiccatiBackwardPass
+from simple_pendulum.trajectory_optimization.ilqr.line_search import \
+    line_search
+from simple_pendulum.trajectory_optimization.ilqr.ilqr_loop import \
+    run_ilqr_loop
+from simple_pendulum.trajectory_optimization.ilqr.box_qp import \
+    control_bounds
+
+
+# cache of the compiled derivatives, see iLQR_Calculator.init_derivatives
+_derivative_cache = {}
+_derivative_cache_size = 32
+
+
+def _value_key(value):
+    """
+    hashable key of a parameter value (numbers, arrays, lists)
+    """
+    if isinstance(value, (np.ndarray, list, tuple)):
+        value = np.asarray(value, dtype=float)
+        return (value.shape, tuple(value.ravel()))
+    return value
+
+
+def _function_key(func):
+    """
+    hashable key of a function. For functools.partial objects the key
+    is built from the wrapped function and the values of the bound
+    parameters, so that equal cost/dynamics functions share a key.
+    """
+    if isinstance(func, partial):
+        kwargs = tuple(sorted((k, _value_key(v))
+                              for k, v in func.keywords.items()))
+        args = tuple(_value_key(a) for a in func.args)
+        return (_function_key(func.func), args, kwargs)
+    return func
+
+
+def _compile_expression(expr, x_sym, u_sym):
+    """
+    Lower an array of pydrake symbolic expressions to a vectorized numpy
+    function f(x, u) with x of shape (N, n_x) and u of shape (N, n_u)
+    which returns the values at all N points as array of shape
+    (N,) + expr.shape.
+    """
+    expr = np.atleast_1d(expr)
+    shape = expr.shape
+    entries = expr.ravel()
+
+    if hasattr(sym, "to_sympy"):
+        memo = {}
+        args = [sym.to_sympy(v, memo=memo) for v in list(x_sym) +
+                list(u_sym)]
+        smp_entries = [sym.to_sympy(e, memo=memo) for e in entries]
+        func = smp.lambdify(args, smp_entries, modules="numpy", cse=True)
+
+        def evaluate(x, u):
+            x = np.atleast_2d(x)
+            u = np.atleast_2d(u)
+            values = func(*x.T, *u.T)
+            out = np.empty((x.shape[0], len(values)))
+            for i, v in enumerate(values):
+                out[:, i] = v
+            return out.reshape((x.shape[0],) + shape)
+    else:
+        # older pydrake versions cannot export to sympy,
+        # evaluate point by point instead
+        def evaluate(x, u):
+            x = np.atleast_2d(x)
+            u = np.atleast_2d(u)
+            out = np.empty((x.shape[0], len(entries)))
+            for n in range(x.shape[0]):
+                env = {x_sym[i]: x[n, i] for i in range(len(x_sym))}
+                env.update({u_sym[i]: u[n, i] for i in range(len(u_sym))})
+                out[n] = sym.Evaluate(entries, env).ravel()
+            return out.reshape((x.shape[0],) + shape)
+    return evaluate
+
 
 class iLQR_Calculator():
     '''
@@ -28,6 +110,12 @@ class iLQR_Calculator():
         '''
         self.n_x = n_x
         self.n_u = n_u
+        # feedback gains of the last run_ilqr call
+        self.K_trj = None
+        # no control limits
+        self.set_control_limits()
+
+        self._riccati = RiccatiBackwardPass(n_x=n_x, n_u=n_u)
 
     def set_start(self, x0):
         '''
@@ -40,6 +128,24 @@ class iLQR_Calculator():
         '''
         self.x0 = np.asarray(x0)
 
+    def set_control_limits(self, u_min=None, u_max=None):
+        '''
+        Set control limits (e.g. torque limits) for the ilqr optimization,
+        see box_qp.control_bounds.
+
+        Parameters
+        ----------
+        u_min : array-like, default=None
+            lower control limits, shape=(n_u,) or float
+            no lower limits if None
+        u_max : array-like, default=None
+            upper control limits, shape=(n_u,) or float
+            no upper limits if None
+        '''
+        self.u_min = u_min
+        self.u_max = u_max
+        self._u_bounds = control_bounds(u_min, u_max, self.n_u)
+
     def set_discrete_dynamics(self, dynamics_func):
         '''
         Sets the dynamics function for the iLQR calculation.
@@ -99,7 +205,32 @@ class iLQR_Calculator():
     def init_derivatives(self):
         """
         Initialize the derivatives of the dynamics.
+
+        The symbolic derivatives are compiled to vectorized numpy functions
+        which evaluate all knot points of a trajectory in one call.
+        The compiled functions are cached, so that calling this method
+        again with cost and dynamics functions with the same parameters
+        (e.g. functools.partial objects with equal keywords) reuses them.
         """
+        key = (self.n_x, self.n_u,
+               _function_key(self.stage_cost),
+               _function_key(self.final_cost),
+               _function_key(self.discrete_dynamics))
+        try:
+            cached = _derivative_cache.get(key)
+        except TypeError:
+            # unhashable parameters, do not cache
+            key = None
+            cached = None
+        if cached is None:
+            cached = self._compile_derivatives()
+            if key is not None:
+                if len(_derivative_cache) >= _derivative_cache_size:
+                    _derivative_cache.pop(next(iter(_derivative_cache)))
+                _derivative_cache[key] = cached
+        self.__dict__.update(cached)
+
+    def _compile_derivatives(self):
         self.x_sym = np.array([sym.Variable("x_{}".format(i))
                                for i in range(self.n_x)])
         self.u_sym = np.array([sym.Variable("u_{}".format(i))
@@ -122,49 +253,41 @@ class iLQR_Calculator():
         self.f_x = sym.Jacobian(f, x)
         self.f_u = sym.Jacobian(f, u)
 
-    def _compute_stage_cost_derivatives(self, x, u):
-        env = {self.x_sym[i]: x[i] for i in range(x.shape[0])}
-        env.update({self.u_sym[i]: u[i] for i in range(u.shape[0])})
-
-        l_x = sym.Evaluate(self.l_x, env).ravel()
-        l_u = sym.Evaluate(self.l_u, env).ravel()
-        l_xx = sym.Evaluate(self.l_xx, env)
-        l_ux = sym.Evaluate(self.l_ux, env)
-        l_uu = sym.Evaluate(self.l_uu, env)
-
-        f_x = sym.Evaluate(self.f_x, env)
-        f_u = sym.Evaluate(self.f_u, env)
+        derivatives = {"x_sym": self.x_sym, "u_sym": self.u_sym}
+        for name in ["l_x", "l_u", "l_xx", "l_ux", "l_uu",
+                     "l_final_x", "l_final_xx", "f_x", "f_u"]:
+            expr = getattr(self, name)
+            derivatives[name] = expr
+            derivatives["_"+name+"_func"] = _compile_expression(
+                                                expr, self.x_sym, self.u_sym)
+        return derivatives
 
-        return l_x, l_u, l_xx, l_ux, l_uu, f_x, f_u
+    def _compute_stage_cost_derivatives(self, x, u):
+        """
+        stage cost and dynamics derivatives at one point (x, u)
+        or at all points of the trajectories x (N, n_x), u (N, n_u)
+        """
+        trj = np.ndim(x) == 2
+        x = np.atleast_2d(x)
+        u = np.atleast_2d(u)
+
+        derivatives = (self._l_x_func(x, u),
+                       self._l_u_func(x, u),
+                       self._l_xx_func(x, u),
+                       self._l_ux_func(x, u),
+                       self._l_uu_func(x, u),
+                       self._f_x_func(x, u),
+                       self._f_u_func(x, u))
+        if not trj:
+            derivatives = tuple(d[0] for d in derivatives)
+        return derivatives
 
     def _compute_final_cost_derivatives(self, x):
-        env = {self.x_sym[i]: x[i] for i in range(x.shape[0])}
-        l_final_x = sym.Evaluate(self.l_final_x, env).ravel()
-        l_final_xx = sym.Evaluate(self.l_final_xx, env)
+        u = np.zeros((1, self.n_u))
+        l_final_x = self._l_final_x_func(x, u)[0]
+        l_final_xx = self._l_final_xx_func(x, u)[0]
         return l_final_x, l_final_xx
 
-    def _Q_terms(self, l_x, l_u, l_xx, l_ux, l_uu, f_x, f_u, V_x, V_xx):
-        Q_x = f_x.T.dot(V_x) + l_x
-        Q_u = f_u.T.dot(V_x) + l_u
-        Q_xx = l_xx + f_x.T.dot(V_xx.dot(f_x))
-        Q_ux = l_ux + f_u.T.dot(V_xx.dot(f_x))
-        Q_uu = l_uu + f_u.T.dot(V_xx.dot(f_u))
-        return Q_x, Q_u, Q_xx, Q_ux, Q_uu
-
-    def _gains(self, Q_uu, Q_u, Q_ux):
-        Q_uu_inv = np.linalg.inv(Q_uu + Q_uu.T)
-        k = -2*Q_uu_inv.dot(Q_u.T)
-        K = -2*Q_uu_inv.dot(Q_ux)
-        return k, K
-
-    def _V_terms(self, Q_x, Q_u, Q_xx, Q_ux, Q_uu, K, k):
-        V_x = Q_x + K.T.dot(Q_u) + 0.5*(Q_ux.T.dot(k) + K.T.dot(Q_uu.T.dot(k)))
-        V_xx = Q_xx + Q_ux.T.dot(K) + K.T.dot(Q_ux) + K.T.dot(Q_uu.dot(K))
-        return V_x, V_xx
-
-    def _expected_cost_reduction(self, Q_u, Q_uu, k):
-        return -Q_u.T.dot(k) - 0.5 * k.T.dot(Q_uu.dot(k))
-
     def _forward_pass(self, x_trj, u_trj, k_trj, K_trj):
         x_trj_new = np.zeros(x_trj.shape)
         x_trj_new[0, :] = x_trj[0, :]
@@ -172,35 +295,35 @@ class iLQR_Calculator():
         for n in range(u_trj.shape[0]):
             u_trj_new[n, :] = u_trj[n] + k_trj[n] + \
                               K_trj[n].dot((x_trj_new[n] - x_trj[n]))
+            if self._u_bounds is not None:
+                u_trj_new[n, :] = np.clip(u_trj_new[n], *self._u_bounds)
             x_trj_new[n+1, :] = self.discrete_dynamics(x_trj_new[n],
                                                        u_trj_new[n])
         return x_trj_new, u_trj_new
 
+    def _line_search(self, x_trj, u_trj, k_trj, K_trj, alphas):
+        # forward passes of all step sizes in one batch
+        x_trj_new, u_trj_new, total_cost, _ = line_search(
+                        self.discrete_dynamics, self.stage_cost,
+                        self.final_cost, x_trj, u_trj, k_trj, K_trj,
+                        alphas, self._u_bounds)
+        return x_trj_new, u_trj_new, total_cost
+
     def _backward_pass(self, x_trj, u_trj, regu):
-        k_trj = np.zeros([u_trj.shape[0], u_trj.shape[1]])
-        K_trj = np.zeros([u_trj.shape[0], u_trj.shape[1], x_trj.shape[1]])
-        expected_cost_redu = 0
         l_final_x, l_final_xx = self._compute_final_cost_derivatives(x_trj[-1])
-        V_x = l_final_x
-        V_xx = l_final_xx
-        for n in range(u_trj.shape[0]-1, -1, -1):
-            l_x, l_u, l_xx, l_ux, l_uu, f_x, f_u = (
-                    self._compute_stage_cost_derivatives(x_trj[n], u_trj[n]))
-            Q_x, Q_u, Q_xx, Q_ux, Q_uu = self._Q_terms(l_x, l_u, l_xx, l_ux,
-                                                       l_uu, f_x, f_u,
-                                                       V_x, V_xx)
-            # We add regularization to ensure that Q_uu is invertible
-            # and nicely conditioned
-            Q_uu_regu = Q_uu + np.eye(Q_uu.shape[0])*regu
-            k, K = self._gains(Q_uu_regu, Q_u, Q_ux)
-            k_trj[n, :] = k
-            K_trj[n, :, :] = K
-            V_x, V_xx = self._V_terms(Q_x, Q_u, Q_xx, Q_ux, Q_uu, K, k)
-            expected_cost_redu += self._expected_cost_reduction(Q_u, Q_uu, k)
+        # derivatives at all knot points at once
+        (l_x, l_u, l_xx, l_ux, l_uu,
+         f_x, f_u) = self._compute_stage_cost_derivatives(
+                                x_trj[:u_trj.shape[0]], u_trj)
+        k_trj, K_trj, expected_cost_redu = self._riccati.compute(
+                                l_x, l_u, l_xx, l_ux, l_uu, f_x, f_u,
+                                l_final_x, l_final_xx, regu, u_trj,
+                                self.u_min, self.u_max)
         return k_trj, K_trj, expected_cost_redu
 
     def run_ilqr(self, N=50, init_u_trj=None, init_x_trj=None, shift=False,
-                 max_iter=50, break_cost_redu=1e-6, regu_init=100):
+                 max_iter=50, break_cost_redu=1e-6, regu_init=100,
+                 alphas=None, deadline=None):
         """
         Run the iLQR optimization and receive a optimal trajectory for the
         defined cost function.
@@ -224,6 +347,20 @@ class iLQR_Calculator():
             cost at which the optimization breaks off early
         regu_init : float, default=100
            initialization value for the regularizer
+        alphas : array-like, default=None
+            step sizes of a line search, e.g. [1.0, 0.5, 0.25, 0.125].
+            If given, the forward pass is evaluated for all step sizes in
+            one batch and the candidate with the lowest cost is used.
+            This requires dynamics and cost functions which broadcast over
+            the columns of x and u (as the functions in pendulum.py).
+            If None, only the full step is evaluated.
+        deadline : float, default=None
+            wall clock time in seconds after which the optimization returns
+            the best trajectory found so far. An iteration is only started
+            if it is expected to finish before the deadline (estimated with
+            the mean duration of the previous iterations). The first
+            iteration is always executed.
+            If None, the optimization is only limited by max_iter.
 
         Returns
         -------
@@ -240,70 +377,22 @@ class iLQR_Calculator():
              during the optimization
         redu_trace : array-like
             trace of the cost reduction development during the optimization
+
+        The feedback gains K_trj (shape=(N-1, n_u, n_x)) of the last
+        backward pass are stored in self.K_trj (None if no iteration was
+        computed).
         """
-        if init_u_trj is not None:
-            u_trj = init_u_trj
-            if shift:
-                u_trj = np.delete(u_trj, 0, axis=0)
-                u_trj = np.append(u_trj, [u_trj[-1]], axis=0)
-        else:
-            u_trj = np.random.randn(N-1, self.n_u)*0.0001
-
-        if init_x_trj is not None:
-            x_trj = init_x_trj
-            if shift:
-                x_trj = np.delete(x_trj, 0, axis=0)
-                last_state = [self.discrete_dynamics(x_trj[-1],
-                              np.array(u_trj[-1]))]
-                x_trj = np.append(x_trj, last_state, axis=0)
-        else:
-            x_trj = self._rollout(u_trj)
-
-        total_cost = self._cost_trj(x_trj, u_trj)
-        regu = regu_init
-        max_regu = 10000
-        min_regu = 0.01
-
-        # Setup traces
-        cost_trace = [total_cost]
-        redu_ratio_trace = [1]
-        redu_trace = []
-        regu_trace = [regu]
-
-        # Run main loop
-        for it in range(max_iter):
-            # Backward and forward pass
-            k_trj, K_trj, expected_cost_redu = self._backward_pass(x_trj,
-                                                                   u_trj,
-                                                                   regu)
-            x_trj_new, u_trj_new = self._forward_pass(x_trj,
-                                                      u_trj,
-                                                      k_trj,
-                                                      K_trj)
-            # Evaluate new trajectory
-            total_cost = self._cost_trj(x_trj_new, u_trj_new)
-            cost_redu = cost_trace[-1] - total_cost
-            redu_ratio = cost_redu / abs(expected_cost_redu)
-            # Accept or reject iteration
-            if cost_redu > 0:
-                # Improvement! Accept new trajectories and lower regularization
-                redu_ratio_trace.append(redu_ratio)
-                cost_trace.append(total_cost)
-                x_trj = x_trj_new
-                u_trj = u_trj_new
-                regu *= 0.7
-            else:
-                # Reject new trajectories and increase regularization
-                regu *= 2.0
-                cost_trace.append(cost_trace[-1])
-                redu_ratio_trace.append(0)
-            regu = min(max(regu, min_regu), max_regu)
-            regu_trace.append(regu)
-            redu_trace.append(cost_redu)
-
-            # Early termination if expected improvement is small
-            if expected_cost_redu <= break_cost_redu:
-                break
+        (x_trj, u_trj,
+         cost_trace, regu_trace,
+         redu_ratio_trace,
+         redu_trace, self.K_trj) = run_ilqr_loop(
+                self._rollout, self._cost_trj, self._backward_pass,
+                self._forward_pass, self._line_search,
+                self.discrete_dynamics, self.n_u, self._u_bounds,
+                N=N, init_u_trj=init_u_trj, init_x_trj=init_x_trj,
+                shift=shift, max_iter=max_iter,
+                break_cost_redu=break_cost_redu, regu_init=regu_init,
+                alphas=alphas, deadline=deadline)
 
         return x_trj, u_trj, cost_trace, regu_trace, \
             redu_ratio_trace, redu_trace
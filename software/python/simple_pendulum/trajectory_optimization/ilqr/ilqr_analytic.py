@@ -0,0 +1,593 @@
+"""
+Analytic
+========
+
+iLQR with closed-form derivatives of the pendulum models in
+:mod:`simple_pendulum.trajectory_optimization.ilqr.pendulum`.
+No symbolic library is needed.
+"""
+
+import inspect
+import math
+import numpy as np
+
+from simple_pendulum.trajectory_optimization.ilqr.riccati import \
+    RiccatiBackwardPass
+from simple_pendulum.trajectory_optimization.ilqr.line_search import \
+    cost_trj_batch
+from simple_pendulum.trajectory_optimization.ilqr.ilqr_loop import \
+    run_ilqr_loop
+from simple_pendulum.trajectory_optimization.ilqr.box_qp import \
+    control_bounds
+
+
+# pendulum functions with known closed-form derivatives
+_dynamics_models = {
+    "pendulum_discrete_dynamics_euler": (2, "euler"),
+    "pendulum_discrete_dynamics_rungekutta": (2, "runge_kutta"),
+    "pendulum3_discrete_dynamics_euler": (3, "euler"),
+    "pendulum3_discrete_dynamics_rungekutta": (3, "runge_kutta"),
+}
+_stage_cost_models = {
+    "pendulum_swingup_stage_cost": 2,
+    "pendulum3_swingup_stage_cost": 3,
+}
+_final_cost_models = {
+    "pendulum_swingup_final_cost": 2,
+    "pendulum3_swingup_final_cost": 3,
+}
+
+
+def _model_parameters(func, models):
+    """
+    Identify a pendulum function (plain or functools.partial) and collect
+    its parameters (function defaults updated with the bound keywords).
+
+    Returns
+    -------
+    model : the entry of the function in models
+    parameters : dict
+    """
+    keywords = getattr(func, "keywords", {})
+    base = getattr(func, "func", func)
+    name = getattr(base, "__name__", None)
+    if name not in models or getattr(func, "args", ()):
+        raise NotImplementedError(
+            f'Sorry, there are no analytic derivatives for {func}. '
+            'Use the pydrake or sympy iLQR_Calculator for general '
+            'functions.')
+    parameters = {k: v.default
+                  for k, v in inspect.signature(base).parameters.items()
+                  if v.default is not inspect.Parameter.empty}
+    parameters.update(keywords)
+    return models[name], parameters
+
+
+def _continuous_dynamics(pos, vel, u, p):
+    """
+    pendulum accelerations for arrays of positions, velocities and torques
+    """
+    return (u - p["m"]*p["g"]*p["l"]*np.sin(pos) - p["b"]*vel -
+            p["cf"]*np.arctan(1e8*vel)*2/np.pi) / p["inertia"]
+
+
+def _continuous_jacobian(pos, vel, p):
+    """
+    Jacobian of the continuous pendulum dynamics xd = [vel, acc]
+    with respect to x, shape=(N, 2, 2). The Jacobian with respect to u
+    is constant [0, 1/inertia].
+    """
+    A = np.zeros((len(pos), 2, 2))
+    A[:, 0, 1] = 1.0
+    A[:, 1, 0] = -p["m"]*p["g"]*p["l"]*np.cos(pos) / p["inertia"]
+    A[:, 1, 1] = -(p["b"] +
+                   p["cf"]*2/np.pi*1e8/(1.0 + (1e8*vel)**2)) / p["inertia"]
+    return A
+
+
+def pendulum_dynamics_derivatives(x, u, integrator, p):
+    """
+    Derivatives of the discrete pendulum dynamics with the state
+    x = [position, velocity] at all knot points.
+
+    Parameters
+    ----------
+    x : array-like, shape=(N, 2)
+        states
+    u : array-like, shape=(N, 1)
+        control inputs
+    integrator : string
+        "euler" or "runge_kutta"
+    p : dict
+        pendulum parameters dt, m, l, b, cf, g, inertia
+
+    Returns
+    -------
+    f_x : array-like, shape=(N, 2, 2)
+    f_u : array-like, shape=(N, 2, 1)
+    """
+    dt = p["dt"]
+    N = x.shape[0]
+    eye = np.eye(2)
+    B = np.zeros((N, 2, 1))
+    B[:, 1, 0] = 1.0 / p["inertia"]
+
+    if integrator == "euler":
+        A = _continuous_jacobian(x[:, 0], x[:, 1], p)
+        return eye + dt*A, dt*B
+
+    # chain rule through the four Runge-Kutta stages
+    u = u[:, 0]
+    y = x
+    f_x = np.zeros((N, 2, 2))
+    f_u = np.zeros((N, 2, 1))
+    k_x = None
+    for stage, (h, w) in enumerate([(0.0, 1.0), (0.5, 2.0),
+                                    (0.5, 2.0), (1.0, 1.0)]):
+        if stage > 0:
+            y = x + h*dt*k
+            dy_x = eye + h*dt*k_x
+            dy_u = h*dt*k_u
+        A = _continuous_jacobian(y[:, 0], y[:, 1], p)
+        k = np.stack((y[:, 1], _continuous_dynamics(y[:, 0], y[:, 1],
+                                                     u, p)), axis=1)
+        if stage == 0:
+            k_x = A
+            k_u = B
+        else:
+            k_x = A @ dy_x
+            k_u = A @ dy_u + B
+        f_x += w*k_x
+        f_u += w*k_u
+    return eye + dt/6.0*f_x, dt/6.0*f_u
+
+
+def pendulum3_dynamics_derivatives(x, u, integrator, p):
+    """
+    Derivatives of the discrete pendulum dynamics with the state
+    x = [cos(position), sin(position), velocity] at all knot points.
+
+    Parameters
+    ----------
+    x : array-like, shape=(N, 3)
+        states
+    u : array-like, shape=(N, 1)
+        control inputs
+    integrator : string
+        "euler" or "runge_kutta"
+    p : dict
+        pendulum parameters dt, m, l, b, cf, g, inertia
+
+    Returns
+    -------
+    f_x : array-like, shape=(N, 3, 3)
+    f_u : array-like, shape=(N, 3, 1)
+    """
+    N = x.shape[0]
+    c, s = x[:, 0], x[:, 1]
+    r2 = c**2 + s**2
+    x2 = np.stack((np.arctan2(s, c), x[:, 2]), axis=1)
+
+    # [cos, sin, vel] -> [pos, vel]
+    P = np.zeros((N, 2, 3))
+    P[:, 0, 0] = -s / r2
+    P[:, 0, 1] = c / r2
+    P[:, 1, 2] = 1.0
+
+    g_x, g_u = pendulum_dynamics_derivatives(x2, u, integrator, p)
+
+    # [pos, vel] -> [cos, sin, vel] of the next state
+    if integrator == "euler":
+        pos_next = x2[:, 0] + p["dt"]*x2[:, 1]
+    else:
+        pos_next = _rungekutta_position(x2, u[:, 0], p)
+    O = np.zeros((N, 3, 2))
+    O[:, 0, 0] = -np.sin(pos_next)
+    O[:, 1, 0] = np.cos(pos_next)
+    O[:, 2, 1] = 1.0
+
+    return O @ g_x @ P, O @ g_u
+
+
+def _rungekutta_position(x, u, p):
+    """
+    position after one Runge-Kutta step for states x of shape (N, 2)
+    """
+    dt = p["dt"]
+    k = []
+    y = x
+    for h in [0.5, 0.5, 1.0, None]:
+        kn = np.stack((y[:, 1], _continuous_dynamics(y[:, 0], y[:, 1],
+                                                      u, p)), axis=1)
+        k.append(kn)
+        if h is not None:
+            y = x + h*dt*kn
+    return x[:, 0] + dt/6.0*(k[0][:, 0] + 2*(k[1][:, 0] + k[2][:, 0]) +
+                             k[3][:, 0])
+
+
+def _pendulum_step(integrator, p):
+    """
+    Scalar version of the discrete pendulum dynamics for fast rollouts.
+    Returns a function step(pos, vel, u) -> (pos, vel) which works on
+    floats with the same arithmetic as the functions in pendulum.py.
+    """
+    dt = p["dt"]
+    mgl = p["m"]*p["g"]*p["l"]
+    b, cf, inertia = p["b"], p["cf"], p["inertia"]
+    sin, atan, pi = math.sin, math.atan, math.pi
+
+    def acc(pos, vel, u):
+        return (u - mgl*sin(pos) - b*vel - cf*atan(1e8*vel)*2/pi) / inertia
+
+    if integrator == "euler":
+        def step(pos, vel, u):
+            return pos + vel*dt, vel + acc(pos, vel, u)*dt
+    else:
+        h = 0.5*dt
+
+        def step(pos, vel, u):
+            a1 = acc(pos, vel, u)
+            p2, v2 = pos + h*vel, vel + h*a1
+            a2 = acc(p2, v2, u)
+            p3, v3 = pos + h*v2, vel + h*a2
+            a3 = acc(p3, v3, u)
+            p4, v4 = pos + dt*v3, vel + dt*a3
+            a4 = acc(p4, v4, u)
+            return (pos + (vel + 2*(v2 + v3) + v4) / 6.0*dt,
+                    vel + (a1 + 2*(a2 + a3) + a4) / 6.0*dt)
+    return step
+
+
+def pendulum_cost_derivatives(x, p, n_x=2):
+    """
+    Derivatives of the state part of the pendulum swingup costs
+    (stage or final cost) at all knot points.
+
+    Parameters
+    ----------
+    x : array-like, shape=(N, n_x)
+        states
+    p : dict
+        cost parameters goal, Cp, Cv, Cen, m, l, g
+    n_x : int, default=2
+        2 for x = [position, velocity],
+        3 for x = [cos(position), sin(position), velocity]
+
+    Returns
+    -------
+    l_x : array-like, shape=(N, n_x)
+    l_xx : array-like, shape=(N, n_x, n_x)
+    """
+    eps = 1e-6
+    goal = np.asarray(p["goal"], dtype=float)
+    m, l, g = p["m"], p["l"], p["g"]
+    Cp, Cv, Cen = p["Cp"], p["Cv"], p["Cen"]
+    N = x.shape[0]
+    l_x = np.zeros((N, n_x))
+    l_xx = np.zeros((N, n_x, n_x))
+
+    # energy error e and its gradient de
+    vel = x[:, n_x-1]
+    de = np.zeros((N, n_x))
+    de[:, n_x-1] = m*l**2*vel
+    if n_x == 2:
+        e = (0.5*m*(l*vel)**2 + m*g*l*(1.0-np.cos(x[:, 0])) -
+             0.5*m*(l*goal[1])**2 - m*g*l*(1.0-np.cos(goal[0])) + eps)
+        de[:, 0] = m*g*l*np.sin(x[:, 0])
+        dde00 = m*g*l*np.cos(x[:, 0])
+    else:
+        e = (0.5*m*(l*vel)**2 + m*g*l*(1.0-x[:, 0]) -
+             0.5*m*(l*goal[2])**2 - m*g*l*(1.0-goal[0]) + eps)
+        de[:, 0] = -m*g*l
+        dde00 = 0.0
+
+    pos_weights = np.full(n_x, Cp)
+    pos_weights[n_x-1] = Cv
+    l_x[:] = 2*pos_weights*(x - goal + eps) + 2*Cen*e[:, np.newaxis]*de
+    l_xx[:] = 2*Cen*de[:, :, np.newaxis]*de[:, np.newaxis, :]
+    l_xx[:, np.arange(n_x), np.arange(n_x)] += 2*pos_weights
+    l_xx[:, 0, 0] += 2*Cen*e*dde00
+    l_xx[:, n_x-1, n_x-1] += 2*Cen*e*m*l**2
+    return l_x, l_xx
+
+
+class iLQR_Calculator():
+    '''
+    Class to calculate an optimal trajectory with an iterative
+    linear quadratic regulator (iLQR). This implementation uses closed-form
+    derivatives of the pendulum dynamics and swingup costs.
+    '''
+    def __init__(self, n_x=2, n_u=1):
+        '''
+        Class to calculate an optimal trajectory with an iterative
+        linear quadratic regulator (iLQR). This implementation uses
+        closed-form derivatives of the pendulum dynamics and swingup costs.
+
+        The dynamics and cost functions have to be the pendulum functions
+        from simple_pendulum.trajectory_optimization.ilqr.pendulum
+        (parameters bound with functools.partial).
+
+        Parameters
+        ----------
+        n_x : int, default=2
+            The size of the state space.
+        n_u : int, default=1
+            The size of the control space.
+        '''
+        self.n_x = n_x
+        self.n_u = n_u
+        # feedback gains of the last run_ilqr call
+        self.K_trj = None
+        # no control limits
+        self.set_control_limits()
+
+        self._riccati = RiccatiBackwardPass(n_x=n_x, n_u=n_u)
+
+    def set_start(self, x0):
+        '''
+        Set the start state for the trajectory.
+
+        Parameters
+        ----------
+        x0 : array-like
+            the start state. Should have the shape of (n_x,)
+        '''
+        self.x0 = np.asarray(x0)
+
+    def set_control_limits(self, u_min=None, u_max=None):
+        '''
+        Set control limits (e.g. torque limits) for the ilqr optimization,
+        see box_qp.control_bounds.
+
+        Parameters
+        ----------
+        u_min : array-like, default=None
+            lower control limits, shape=(n_u,) or float
+            no lower limits if None
+        u_max : array-like, default=None
+            upper control limits, shape=(n_u,) or float
+            no upper limits if None
+        '''
+        self.u_min = u_min
+        self.u_max = u_max
+        self._u_bounds = control_bounds(u_min, u_max, self.n_u)
+
+    def set_discrete_dynamics(self, dynamics_func):
+        '''
+        Sets the dynamics function for the iLQR calculation.
+
+        Parameters
+        ----------
+        danamics_func : function
+            dynamics_func should be a function with inputs (x, u) and output xd
+        '''
+        self.discrete_dynamics = dynamics_func
+
+    def _rollout(self, u_trj):
+        N = u_trj.shape[0]
+        x_trj, _ = self._forward_pass(np.zeros((N+1, self.n_x)), u_trj,
+                                      np.zeros((N, self.n_u)),
+                                      np.zeros((N, self.n_u, self.n_x)),
+                                      x0=self.x0)
+        return x_trj
+
+    def set_stage_cost(self, stage_cost_func):
+        '''
+        Set the stage cost (running cost) for the ilqr optimization.
+
+        Parameters
+        ----------
+        stage_cost_func : function
+            stage_cost_func should be a function with inputs (x, u)
+            and output cost
+        '''
+        self.stage_cost = stage_cost_func
+
+    def set_final_cost(self, final_cost_func):
+        '''
+        Set the final cost for the ilqr optimization.
+
+        Parameters
+        ----------
+        final_cost_func : function
+            final_cost_func should be a function with inputs x
+            and output cost
+        '''
+        self.final_cost = final_cost_func
+
+    def _cost_trj(self, x_trj, u_trj):
+        # the pendulum cost functions broadcast over all knot points
+        N = x_trj.shape[0]
+        ln = np.sum(self.stage_cost(x_trj[:-1].T, u_trj.T)) / N
+        lf = self.final_cost(x_trj[-1, :])
+        return ln + lf
+
+    def init_derivatives(self):
+        """
+        Initialize the derivatives of the dynamics.
+        Identifies the pendulum dynamics and cost functions and their
+        parameters. No symbolic derivatives are computed.
+        """
+        (n_x, self._integrator), self._dyn_par = _model_parameters(
+                                self.discrete_dynamics, _dynamics_models)
+        s_n_x, self._stage_par = _model_parameters(self.stage_cost,
+                                                   _stage_cost_models)
+        f_n_x, self._final_par = _model_parameters(self.final_cost,
+                                                   _final_cost_models)
+        if not n_x == s_n_x == f_n_x == self.n_x:
+            raise ValueError(
+                f'Dynamics and costs do not match the state size {self.n_x}.')
+        if n_x == 2:
+            self._dynamics_derivatives = pendulum_dynamics_derivatives
+        else:
+            self._dynamics_derivatives = pendulum3_dynamics_derivatives
+        self._step = _pendulum_step(self._integrator, self._dyn_par)
+
+    def _compute_stage_cost_derivatives(self, x, u):
+        """
+        stage cost and dynamics derivatives at all points of the
+        trajectories x (N, n_x), u (N, n_u)
+        """
+        x = np.atleast_2d(x)
+        u = np.atleast_2d(u)
+        N = x.shape[0]
+
+        l_x, l_xx = pendulum_cost_derivatives(x, self._stage_par, self.n_x)
+        l_u = 2*self._stage_par["Cu"]*u
+        l_ux = np.zeros((N, self.n_u, self.n_x))
+        l_uu = np.full((N, self.n_u, self.n_u), 2*self._stage_par["Cu"])
+        f_x, f_u = self._dynamics_derivatives(x, u, self._integrator,
+                                              self._dyn_par)
+        return l_x, l_u, l_xx, l_ux, l_uu, f_x, f_u
+
+    def _compute_final_cost_derivatives(self, x):
+        l_final_x, l_final_xx = pendulum_cost_derivatives(
+                                    np.atleast_2d(x), self._final_par,
+                                    self.n_x)
+        return l_final_x[0], l_final_xx[0]
+
+    def _forward_pass(self, x_trj, u_trj, k_trj, K_trj, x0=None):
+        # scalar loop over the knot points with the closed-form dynamics
+        # u_new = u + k + K (x_new - x)
+        if x0 is None:
+            x0 = x_trj[0]
+        x_ref = x_trj.tolist()
+        u_ff = (u_trj[:, 0] + k_trj[:, 0]).tolist()
+        K = K_trj[:, 0, :].tolist()
+        step = self._step
+        three_states = self.n_x == 3
+        if self._u_bounds is None:
+            u_lo, u_hi = -math.inf, math.inf
+        else:
+            u_lo, u_hi = self._u_bounds[0][0], self._u_bounds[1][0]
+
+        N = u_trj.shape[0]
+        x_new = [list(x0)] + N*[None]
+        u_new = N*[0.0]
+        x = x_new[0]
+        if three_states:
+            pos = math.atan2(x[1], x[0])
+        else:
+            pos = x[0]
+        vel = x[-1]
+        for n in range(N):
+            xr = x_ref[n]
+            Kn = K[n]
+            u = u_ff[n] + Kn[-1]*(vel - xr[-1])
+            if three_states:
+                u += Kn[0]*(x[0] - xr[0]) + Kn[1]*(x[1] - xr[1])
+            else:
+                u += Kn[0]*(pos - xr[0])
+            u = min(max(u, u_lo), u_hi)
+            u_new[n] = u
+            pos, vel = step(pos, vel, u)
+            if three_states:
+                x = [math.cos(pos), math.sin(pos), vel]
+                # continue from the angle of the rotated state
+                pos = math.atan2(x[1], x[0])
+            else:
+                x = [pos, vel]
+            x_new[n+1] = x
+        return np.array(x_new), np.array(u_new)[:, np.newaxis]
+
+    def _line_search(self, x_trj, u_trj, k_trj, K_trj, alphas):
+        # for the scalar rollouts a loop over the step sizes is faster
+        # than a numpy batch over the candidates
+        candidates = [self._forward_pass(x_trj, u_trj, alpha*k_trj, K_trj)
+                      for alpha in alphas]
+        x_trjs = np.array([c[0] for c in candidates])
+        u_trjs = np.array([c[1] for c in candidates])
+        costs = cost_trj_batch(self.stage_cost, self.final_cost,
+                               x_trjs, u_trjs)
+        costs = np.where(np.isfinite(costs), costs, np.inf)
+        best = int(np.argmin(costs))
+        return x_trjs[best], u_trjs[best], costs[best]
+
+    def _backward_pass(self, x_trj, u_trj, regu):
+        l_final_x, l_final_xx = self._compute_final_cost_derivatives(x_trj[-1])
+        # derivatives at all knot points at once
+        (l_x, l_u, l_xx, l_ux, l_uu,
+         f_x, f_u) = self._compute_stage_cost_derivatives(
+                                x_trj[:u_trj.shape[0]], u_trj)
+        k_trj, K_trj, expected_cost_redu = self._riccati.compute(
+                                l_x, l_u, l_xx, l_ux, l_uu, f_x, f_u,
+                                l_final_x, l_final_xx, regu, u_trj,
+                                self.u_min, self.u_max)
+        return k_trj, K_trj, expected_cost_redu
+
+    def run_ilqr(self, N=50, init_u_trj=None, init_x_trj=None, shift=False,
+                 max_iter=50, break_cost_redu=1e-6, regu_init=100,
+                 alphas=None, deadline=None):
+        """
+        Run the iLQR optimization and receive a optimal trajectory for the
+        defined cost function.
+
+        Parameters
+        ----------
+        N : int, default=50
+            The number of waypoints for the trajectory
+        init_u_trj : array-like, default=None
+            initial guess for the control trajectory
+            ignored if None
+        init_x_trj : array_like, default=None
+            initial guess for the state space trajectory
+            ignored if None
+        shift : bool, default=False
+            whether to shift the initial guess trajectories by one entry
+            (delete the first entry and duplicate the last entry)
+        max_iter : int, default=50
+            optimization iterations the alogrithm makes at every timestep
+        break_cost_redu : float, default=1e-6
+            cost at which the optimization breaks off early
+        regu_init : float, default=100
+           initialization value for the regularizer
+        alphas : array-like, default=None
+            step sizes of a line search, e.g. [1.0, 0.5, 0.25, 0.125].
+            If given, the forward pass is evaluated for all step sizes in
+            one batch and the candidate with the lowest cost is used.
+            The candidates are rolled out with the scalar pendulum
+            dynamics and their costs are evaluated in one batch.
+            If None, only the full step is evaluated.
+        deadline : float, default=None
+            wall clock time in seconds after which the optimization returns
+            the best trajectory found so far. An iteration is only started
+            if it is expected to finish before the deadline (estimated with
+            the mean duration of the previous iterations). The first
+            iteration is always executed.
+            If None, the optimization is only limited by max_iter.
+
+        Returns
+        -------
+        x_trj : array-like
+            state space trajectory
+        u_trj : array-like
+            control trajectory
+        cost_trace : array-like
+            trace of the cost development during the optimization
+        regu_trace : array-like
+            trace of the regularizer development during the optimization
+        redu_ratio_trace : array-like
+            trace of ratio of cost_reduction and expected cost reduction
+             during the optimization
+        redu_trace : array-like
+            trace of the cost reduction development during the optimization
+
+        The feedback gains K_trj (shape=(N-1, n_u, n_x)) of the last
+        backward pass are stored in self.K_trj (None if no iteration was
+        computed).
+        """
+        (x_trj, u_trj,
+         cost_trace, regu_trace,
+         redu_ratio_trace,
+         redu_trace, self.K_trj) = run_ilqr_loop(
+                self._rollout, self._cost_trj, self._backward_pass,
+                self._forward_pass, self._line_search,
+                self.discrete_dynamics, self.n_u, self._u_bounds,
+                N=N, init_u_trj=init_u_trj, init_x_trj=init_x_trj,
+                shift=shift, max_iter=max_iter,
+                break_cost_redu=break_cost_redu, regu_init=regu_init,
+                alphas=alphas, deadline=deadline)
+
+        return x_trj, u_trj, cost_trace, regu_trace, \
+            redu_ratio_trace, redu_trace
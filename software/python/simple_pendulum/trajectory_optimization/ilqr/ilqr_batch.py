@@ -0,0 +1,367 @@
+"""
+Batch
+=====
+
+iLQR for many pendulum problems (start states and/or pendulum parameters)
+at once. All problems are solved in lockstep with stacked arrays.
+"""
+
+import numpy as np
+
+from simple_pendulum.trajectory_optimization.ilqr.ilqr_analytic import (
+    _model_parameters,
+    _dynamics_models,
+    _stage_cost_models,
+    _final_cost_models,
+    pendulum_dynamics_derivatives,
+    pendulum3_dynamics_derivatives,
+    pendulum_cost_derivatives)
+
+
+class iLQR_BatchCalculator():
+    '''
+    Class to calculate optimal trajectories for many problems at once with
+    an iterative linear quadratic regulator (iLQR). The problems share
+    the dynamics and cost functions but can have different start states and
+    pendulum parameters. This implementation uses the closed-form
+    derivatives of the pendulum dynamics and swingup costs of the analytic
+    iLQR_Calculator.
+    '''
+    def __init__(self, n_x=2, n_u=1):
+        '''
+        Class to calculate optimal trajectories for many problems at once
+        with an iterative linear quadratic regulator (iLQR).
+
+        The dynamics and cost functions have to be the pendulum functions
+        from simple_pendulum.trajectory_optimization.ilqr.pendulum
+        (parameters bound with functools.partial).
+
+        Parameters
+        ----------
+        n_x : int, default=2
+            The size of the state space.
+        n_u : int, default=1
+            The size of the control space.
+        '''
+        self.n_x = n_x
+        self.n_u = n_u
+        self.x0 = np.zeros((1, n_x))
+        self.parameters = {}
+
+    def set_start(self, x0):
+        '''
+        Set the start states of the problems.
+
+        Parameters
+        ----------
+        x0 : array-like
+            the start states, shape=(M, n_x) for M problems or shape=(n_x,)
+            for the same start state in all problems
+        '''
+        self.x0 = np.atleast_2d(np.asarray(x0, dtype=float))
+
+    def set_parameters(self, **parameters):
+        '''
+        Set pendulum parameters which differ between the problems.
+        The parameters replace the parameters of the same name in the
+        dynamics and cost functions, e.g.
+        set_parameters(m=masses, b=dampings).
+
+        Parameters
+        ----------
+        **parameters : array-like, shape=(M,)
+            parameter values of the M problems
+            (keywords of the pendulum functions: m, l, b, cf, g, inertia)
+        '''
+        self.parameters = {k: np.asarray(v, dtype=float).ravel()
+                           for k, v in parameters.items()}
+
+    def set_discrete_dynamics(self, dynamics_func):
+        '''
+        Sets the dynamics function for the iLQR calculation.
+
+        Parameters
+        ----------
+        danamics_func : function
+            dynamics_func should be a function with inputs (x, u) and output xd
+        '''
+        self.discrete_dynamics = dynamics_func
+
+    def set_stage_cost(self, stage_cost_func):
+        '''
+        Set the stage cost (running cost) for the ilqr optimization.
+
+        Parameters
+        ----------
+        stage_cost_func : function
+            stage_cost_func should be a function with inputs (x, u)
+            and output cost
+        '''
+        self.stage_cost = stage_cost_func
+
+    def set_final_cost(self, final_cost_func):
+        '''
+        Set the final cost for the ilqr optimization.
+
+        Parameters
+        ----------
+        final_cost_func : function
+            final_cost_func should be a function with inputs x
+            and output cost
+        '''
+        self.final_cost = final_cost_func
+
+    def init_derivatives(self):
+        """
+        Initialize the derivatives of the dynamics.
+        Identifies the pendulum dynamics and cost functions and their
+        parameters. No symbolic derivatives are computed.
+        """
+        (n_x, self._integrator), self._dyn_par = _model_parameters(
+                                self.discrete_dynamics, _dynamics_models)
+        s_n_x, self._stage_par = _model_parameters(self.stage_cost,
+                                                   _stage_cost_models)
+        f_n_x, self._final_par = _model_parameters(self.final_cost,
+                                                   _final_cost_models)
+        if not n_x == s_n_x == f_n_x == self.n_x:
+            raise ValueError(
+                f'Dynamics and costs do not match the state size {self.n_x}.')
+        if n_x == 2:
+            self._dynamics_derivatives = pendulum_dynamics_derivatives
+        else:
+            self._dynamics_derivatives = pendulum3_dynamics_derivatives
+        self._dyn_func = getattr(self.discrete_dynamics, "func",
+                                 self.discrete_dynamics)
+        self._stage_func = getattr(self.stage_cost, "func", self.stage_cost)
+        self._final_func = getattr(self.final_cost, "func", self.final_cost)
+
+    def _problem_parameters(self, par, idx, shape=()):
+        # parameters of the problems idx, the problem axis is the first
+        # axis of shape, the other axes are broadcast
+        p = dict(par)
+        for key, value in self._batch_parameters.items():
+            if key in p:
+                p[key] = value[idx].reshape((-1,) + shape)
+        return p
+
+    def _rollout(self, x0, u_trjs, idx):
+        M, N = u_trjs.shape[:2]
+        x_trjs = np.zeros((M, N+1, self.n_x))
+        x_trjs[:, 0] = x0
+        p = self._problem_parameters(self._dyn_par, idx)
+        for n in range(N):
+            x_trjs[:, n+1] = self._dyn_func(x_trjs[:, n].T,
+                                            u_trjs[:, n].T, **p).T
+        return x_trjs
+
+    def _forward_pass(self, x_trjs, u_trjs, k_trjs, K_trjs, idx):
+        # u_new = u + k + K (x_new - x) for all problems at every knot
+        M, N = u_trjs.shape[:2]
+        x_new = np.zeros_like(x_trjs)
+        u_new = np.zeros_like(u_trjs)
+        x_new[:, 0] = x_trjs[:, 0]
+        u_ff = u_trjs + k_trjs
+        p = self._problem_parameters(self._dyn_par, idx)
+        for n in range(N):
+            dx = x_new[:, n] - x_trjs[:, n]
+            u_new[:, n] = u_ff[:, n] + np.einsum("mij,mj->mi",
+                                                 K_trjs[:, n], dx)
+            x_new[:, n+1] = self._dyn_func(x_new[:, n].T,
+                                           u_new[:, n].T, **p).T
+        return x_new, u_new
+
+    def _cost_trjs(self, x_trjs, u_trjs, idx):
+        # the pendulum cost functions broadcast over problems and knots,
+        # same normalization as the single trajectory cost
+        N = x_trjs.shape[1]
+        p = self._problem_parameters(self._stage_par, idx, (1,))
+        ln = np.sum(np.broadcast_to(
+                self._stage_func(np.moveaxis(x_trjs[:, :-1], 2, 0),
+                                 np.moveaxis(u_trjs, 2, 0), **p),
+                x_trjs.shape[:1] + (N-1,)), axis=1) / N
+        p = self._problem_parameters(self._final_par, idx)
+        lf = self._final_func(x_trjs[:, -1].T, **p)
+        return ln + lf
+
+    def _backward_pass(self, x_trjs, u_trjs, regu, idx):
+        M, N = u_trjs.shape[:2]
+        n_x, n_u = self.n_x, self.n_u
+
+        # derivatives at all knot points of all problems at once,
+        # the parameters are repeated for the knot points of each problem
+        x = x_trjs[:, :-1].reshape(M*N, n_x)
+        u = u_trjs.reshape(M*N, n_u)
+        rep = np.repeat(idx, N)
+        stage_par = self._problem_parameters(self._stage_par, rep)
+        l_x, l_xx = pendulum_cost_derivatives(x, stage_par, n_x)
+        l_x = l_x.reshape(M, N, n_x)
+        l_xx = l_xx.reshape(M, N, n_x, n_x)
+        l_u = (2*self._stage_par["Cu"]*u_trjs)
+        l_uu = 2*self._stage_par["Cu"]*np.eye(n_u)
+        f_x, f_u = self._dynamics_derivatives(
+                        x, u, self._integrator,
+                        self._problem_parameters(self._dyn_par, rep))
+        f_x = f_x.reshape(M, N, n_x, n_x)
+        f_u = f_u.reshape(M, N, n_x, n_u)
+        V_x, V_xx = pendulum_cost_derivatives(
+                        x_trjs[:, -1],
+                        self._problem_parameters(self._final_par, idx), n_x)
+
+        k_trjs = np.zeros((M, N, n_u))
+        K_trjs = np.zeros((M, N, n_u, n_x))
+        expected_cost_redu = np.zeros(M)
+        regu_eye = regu[:, np.newaxis, np.newaxis]*np.eye(n_u)
+        for n in range(N-1, -1, -1):
+            # Q terms of all problems, l_ux is zero for the pendulum costs
+            f_xT = np.swapaxes(f_x[:, n], 1, 2)
+            f_uT = np.swapaxes(f_u[:, n], 1, 2)
+            f_uT_V_xx = f_uT @ V_xx
+            Q_x = l_x[:, n] + np.einsum("mij,mj->mi", f_xT, V_x)
+            Q_u = l_u[:, n] + np.einsum("mij,mj->mi", f_uT, V_x)
+            Q_xx = l_xx[:, n] + f_xT @ V_xx @ f_x[:, n]
+            Q_ux = f_uT_V_xx @ f_x[:, n]
+            Q_uu = l_uu + f_uT_V_xx @ f_u[:, n]
+
+            # gains, every problem has its own regularization
+            if n_u == 1:
+                q_inv = -1.0 / (Q_uu[:, 0, 0] + regu)
+                k = Q_u*q_inv[:, np.newaxis]
+                K = Q_ux*q_inv[:, np.newaxis, np.newaxis]
+            else:
+                Q_uu_regu = 0.5*(Q_uu + np.swapaxes(Q_uu, 1, 2)) + regu_eye
+                k = -np.linalg.solve(Q_uu_regu,
+                                     Q_u[:, :, np.newaxis])[:, :, 0]
+                K = -np.linalg.solve(Q_uu_regu, Q_ux)
+            k_trjs[:, n] = k
+            K_trjs[:, n] = K
+
+            # value function
+            K_T = np.swapaxes(K, 1, 2)
+            Q_uu_k = np.einsum("mij,mj->mi", Q_uu, k)
+            V_x = (Q_x + np.einsum("mij,mj->mi", K_T, Q_u) +
+                   0.5*(np.einsum("mji,mj->mi", Q_ux, k) +
+                        np.einsum("mij,mj->mi", K_T, Q_uu_k)))
+            V_xx = (Q_xx + np.swapaxes(Q_ux, 1, 2) @ K + K_T @ Q_ux +
+                    K_T @ Q_uu @ K)
+            expected_cost_redu -= (np.sum(Q_u*k, axis=1) +
+                                   0.5*np.sum(k*Q_uu_k, axis=1))
+        return k_trjs, K_trjs, expected_cost_redu
+
+    def run_ilqr(self, N=50, init_u_trj=None, max_iter=50,
+                 break_cost_redu=1e-6, regu_init=100):
+        """
+        Run the iLQR optimization for all problems.
+        The number of problems M is given by the start states and the
+        parameters (set_start, set_parameters). Every problem is accepted or
+        rejected, regularized and terminated on its own. Problems which
+        reached break_cost_redu are not computed any further.
+
+        Parameters
+        ----------
+        N : int, default=50
+            The number of waypoints for the trajectories
+        init_u_trj : array-like, default=None
+            initial guess for the control trajectories,
+            shape=(N-1, n_u) for all problems or shape=(M, N-1, n_u)
+            random if None
+        max_iter : int, default=50
+            maximum number of optimization iterations
+        break_cost_redu : float, default=1e-6
+            expected cost reduction at which the optimization of a problem
+            stops
+        regu_init : float, default=100
+           initialization value for the regularizers
+
+        Returns
+        -------
+        x_trjs : array-like, shape=(M, N, n_x)
+            state space trajectories
+        u_trjs : array-like, shape=(M, N-1, n_u)
+            control trajectories
+        cost_trace : array-like, shape=(iterations+1, M)
+            trace of the costs during the optimization
+        regu_trace : array-like, shape=(iterations+1, M)
+            trace of the regularizers during the optimization
+        redu_ratio_trace : array-like, shape=(iterations+1, M)
+            trace of ratio of cost_reduction and expected cost reduction
+            during the optimization
+        redu_trace : array-like, shape=(iterations, M)
+            trace of the cost reductions during the optimization
+
+        The number of iterations of every problem is stored in
+        self.iterations.
+        """
+        sizes = [self.x0.shape[0]] + [len(v) for v in
+                                      self.parameters.values()]
+        M = max(sizes)
+        if any(s not in (1, M) for s in sizes):
+            raise ValueError(f'The number of start states and parameter '
+                             f'values do not match: {sizes}')
+        if self.x0.shape[0] == 1:
+            x0 = np.repeat(self.x0, M, axis=0)
+        else:
+            x0 = self.x0
+        self._batch_parameters = {k: np.broadcast_to(v, (M,)) for k, v in
+                                  self.parameters.items()}
+
+        if init_u_trj is not None:
+            u_trjs = np.array(np.broadcast_to(
+                            init_u_trj, (M,) + np.shape(init_u_trj)[-2:]),
+                            dtype=float)
+        else:
+            u_trjs = np.random.randn(M, N-1, self.n_u)*0.0001
+
+        problems = np.arange(M)
+        x_trjs = self._rollout(x0, u_trjs, problems)
+        costs = self._cost_trjs(x_trjs, u_trjs, problems)
+        regu = np.full(M, float(regu_init))
+        max_regu = 10000
+        min_regu = 0.01
+        active = np.ones(M, dtype=bool)
+        self.iterations = np.zeros(M, dtype=int)
+
+        # Setup traces
+        cost_trace = [costs.copy()]
+        redu_ratio_trace = [np.ones(M)]
+        redu_trace = []
+        regu_trace = [regu.copy()]
+
+        # Run main loop
+        for it in range(max_iter):
+            idx = np.flatnonzero(active)
+            if len(idx) == 0:
+                break
+            self.iterations[idx] += 1
+            # Backward and forward pass of the active problems
+            k_trjs, K_trjs, expected_cost_redu = self._backward_pass(
+                                x_trjs[idx], u_trjs[idx], regu[idx], idx)
+            x_new, u_new = self._forward_pass(x_trjs[idx], u_trjs[idx],
+                                              k_trjs, K_trjs, idx)
+            # Evaluate new trajectories
+            new_costs = self._cost_trjs(x_new, u_new, idx)
+            cost_redu = costs[idx] - new_costs
+            redu_ratio = cost_redu / np.abs(expected_cost_redu)
+
+            # Accept or reject the iteration of every problem
+            redu_ratio_it = np.zeros(M)
+            redu_it = np.zeros(M)
+            accept = cost_redu > 0
+            acc = idx[accept]
+            x_trjs[acc] = x_new[accept]
+            u_trjs[acc] = u_new[accept]
+            costs[acc] = new_costs[accept]
+            redu_ratio_it[acc] = redu_ratio[accept]
+            redu_it[idx] = cost_redu
+            regu[idx] *= np.where(accept, 0.7, 2.0)
+            regu = np.clip(regu, min_regu, max_regu)
+
+            cost_trace.append(costs.copy())
+            redu_ratio_trace.append(redu_ratio_it)
+            regu_trace.append(regu.copy())
+            redu_trace.append(redu_it)
+
+            # Early termination if expected improvement is small
+            active[idx[expected_cost_redu <= break_cost_redu]] = False
+
+        return x_trjs, u_trjs, np.array(cost_trace), np.array(regu_trace), \
+            np.array(redu_ratio_trace), np.array(redu_trace)
@@ -0,0 +1,147 @@
+"""
+iLQR Loop
+=========
+"""
+
+import time
+import numpy as np
+
+
+def run_ilqr_loop(rollout, cost_trj, backward_pass, forward_pass,
+                  line_search, discrete_dynamics, n_u, u_bounds=None,
+                  N=50, init_u_trj=None, init_x_trj=None, shift=False,
+                  max_iter=50, break_cost_redu=1e-6, regu_init=100,
+                  alphas=None, deadline=None):
+    """
+    Main loop of the iLQR algorithm which is shared by the iLQR
+    calculators. The calculators only supply the functions which
+    depend on how the derivatives are computed.
+
+    Parameters
+    ----------
+    rollout : function
+        rollout(u_trj), state trajectory from the start state
+    cost_trj : function
+        cost_trj(x_trj, u_trj), total cost of a trajectory
+    backward_pass : function
+        backward_pass(x_trj, u_trj, regu),
+        returns k_trj, K_trj and the expected cost reduction
+    forward_pass : function
+        forward_pass(x_trj, u_trj, k_trj, K_trj),
+        returns the new state and control trajectories
+    line_search : function
+        line_search(x_trj, u_trj, k_trj, K_trj, alphas), returns the state
+        and control trajectories and the cost of the best step size
+    discrete_dynamics : function
+        dynamics function with inputs (x, u) and output of the next state
+    n_u : int
+        The size of the control space.
+    u_bounds : tuple, default=None
+        lower and upper control limits (arrays of shape (n_u,)),
+        no limits if None
+    N, init_u_trj, init_x_trj, shift, max_iter, break_cost_redu,
+    regu_init, alphas, deadline
+        see run_ilqr of the calculators
+
+    Returns
+    -------
+    x_trj : array-like
+        state space trajectory
+    u_trj : array-like
+        control trajectory
+    cost_trace : array-like
+        trace of the cost development during the optimization
+    regu_trace : array-like
+        trace of the regularizer development during the optimization
+    redu_ratio_trace : array-like
+        trace of ratio of cost_reduction and expected cost reduction
+         during the optimization
+    redu_trace : array-like
+        trace of the cost reduction development during the optimization
+    K_trj : array-like
+        feedback gains of the last backward pass
+        (None if no iteration was computed)
+    """
+    t_start = time.perf_counter()
+    if init_u_trj is not None:
+        u_trj = init_u_trj
+        if shift:
+            u_trj = np.delete(u_trj, 0, axis=0)
+            u_trj = np.append(u_trj, [u_trj[-1]], axis=0)
+    else:
+        u_trj = np.random.randn(N-1, n_u)*0.0001
+
+    if u_bounds is not None:
+        u_trj = np.clip(u_trj, *u_bounds)
+
+    if init_x_trj is not None:
+        x_trj = init_x_trj
+        if shift:
+            x_trj = np.delete(x_trj, 0, axis=0)
+            last_state = [discrete_dynamics(x_trj[-1], np.array(u_trj[-1]))]
+            x_trj = np.append(x_trj, last_state, axis=0)
+    else:
+        x_trj = rollout(u_trj)
+
+    total_cost = cost_trj(x_trj, u_trj)
+    regu = regu_init
+    max_regu = 10000
+    min_regu = 0.01
+
+    # Setup traces
+    cost_trace = [total_cost]
+    redu_ratio_trace = [1]
+    redu_trace = []
+    regu_trace = [regu]
+
+    # Run main loop
+    K_trj = None
+    t_loop = time.perf_counter()
+    for it in range(max_iter):
+        # Anytime mode: stop if the next iteration would overrun the
+        # deadline, the accepted trajectory is the best one so far
+        if deadline is not None and it > 0:
+            t_now = time.perf_counter()
+            t_iter = (t_now - t_loop) / it
+            if t_now - t_start + t_iter > deadline:
+                break
+        # Backward and forward pass
+        k_trj, K_trj, expected_cost_redu = backward_pass(x_trj, u_trj, regu)
+        if alphas is None:
+            x_trj_new, u_trj_new = forward_pass(x_trj, u_trj, k_trj, K_trj)
+            # Evaluate new trajectory
+            total_cost = cost_trj(x_trj_new, u_trj_new)
+        else:
+            x_trj_new, u_trj_new, total_cost = line_search(x_trj, u_trj,
+                                                           k_trj, K_trj,
+                                                           alphas)
+        cost_redu = cost_trace[-1] - total_cost
+        redu_ratio = cost_redu / abs(expected_cost_redu)
+        # Accept or reject iteration
+        if cost_redu > 0:
+            # Improvement! Accept new trajectories and lower regularization
+            redu_ratio_trace.append(redu_ratio)
+            cost_trace.append(total_cost)
+            x_trj = x_trj_new
+            u_trj = u_trj_new
+            regu *= 0.7
+        else:
+            # Reject new trajectories and increase regularization
+            regu *= 2.0
+            cost_trace.append(cost_trace[-1])
+            redu_ratio_trace.append(0)
+        regu = min(max(regu, min_regu), max_regu)
+        regu_trace.append(regu)
+        redu_trace.append(cost_redu)
+
+        # Early termination if expected improvement is small
+        if expected_cost_redu <= break_cost_redu:
+            break
+
+    # the backward pass may reuse its gain arrays in the next call
+    # (e.g. RiccatiBackwardPass), keep a copy
+    if K_trj is not None:
+        K_trj = np.array(K_trj)
+
+    return x_trj, u_trj, cost_trace, regu_trace, \
+        redu_ratio_trace, redu_trace, K_trj
@@ -5,9 +5,78 @@ Symbolic
 Large parts taken from `Russ Tedrake <https://github.com/RussTedrake/underactuated>`_.
 """
 
+import os
+import sys
+import hashlib
+import inspect
+import importlib.util
 import numpy as np
 import sympy as smp
 
+from simple_pendulum.trajectory_optimization.ilqr.riccati import \
+    RiccatiBackwardPass
+from simple_pendulum.trajectory_optimization.ilqr.line_search import \
+    line_search
+from simple_pendulum.trajectory_optimization.ilqr.ilqr_loop import \
+    run_ilqr_loop
+from simple_pendulum.trajectory_optimization.ilqr.box_qp import \
+    control_bounds
+
+# directory of the generated derivative modules, can be changed with the
+# environment variable SIMPLE_PENDULUM_ILQR_CACHE (empty: no cache)
+default_cache_dir = os.environ.get(
+    "SIMPLE_PENDULUM_ILQR_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache",
+                 "simple_pendulum", "ilqr_sympy")) or None
+
+# bump to invalidate all existing cache files
+_cache_format = 1
+
+_derivative_names = ["l_x", "l_u", "l_xx", "l_ux", "l_uu",
+                     "l_final_x", "l_final_xx", "f_x", "f_u"]
+
+
+def _function_key(func):
+    """
+    Description of a dynamics or cost function for the cache key.
+    Functions and functools.partial objects of module level functions are
+    described by the source of their module, their name and the keyword
+    arguments of the partial object.
+
+    Parameters
+    ----------
+    func : function
+        function or functools.partial object
+
+    Returns
+    -------
+    key : string
+        description of the function, None if the function can not be
+        identified reliably (lambdas, closures, positional arguments of
+        partial objects, functions without source)
+    """
+    base = getattr(func, "func", func)
+    name = getattr(base, "__qualname__", "<unknown>")
+    module = sys.modules.get(getattr(base, "__module__", None))
+    if "<" in name or module is None or getattr(func, "args", ()):
+        return None
+    try:
+        source = inspect.getsource(module)
+    except (OSError, TypeError):
+        return None
+    keywords = sorted((k, np.asarray(v).tolist())
+                      for k, v in getattr(func, "keywords", {}).items())
+    return repr([hashlib.sha256(source.encode()).hexdigest(),
+                 base.__module__, name, keywords])
+
+
+def _load_module(path):
+    spec = importlib.util.spec_from_file_location(
+        "_ilqr_sympy_derivatives", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
 
 class iLQR_Calculator():
     '''
@@ -28,6 +97,14 @@ class iLQR_Calculator():
         """
         self.n_x = n_x
         self.n_u = n_u
+        # feedback gains of the last run_ilqr call
+        self.K_trj = None
+        # no control limits
+        self.set_control_limits()
+        self._riccati = RiccatiBackwardPass(n_x=n_x, n_u=n_u)
+        # stacked derivatives of the knot points, allocated in the first
+        # backward pass
+        self._stacks = None
 
         self.x_sym = smp.symbols("x:"+str(self.n_x))
         self.u_sym = smp.symbols("u:"+str(self.n_u))
@@ -43,6 +120,24 @@ class iLQR_Calculator():
         """
         self.x0 = x0
 
+    def set_control_limits(self, u_min=None, u_max=None):
+        '''
+        Set control limits (e.g. torque limits) for the ilqr optimization,
+        see box_qp.control_bounds.
+
+        Parameters
+        ----------
+        u_min : array-like, default=None
+            lower control limits, shape=(n_u,) or float
+            no lower limits if None
+        u_max : array-like, default=None
+            upper control limits, shape=(n_u,) or float
+            no upper limits if None
+        '''
+        self.u_min = u_min
+        self.u_max = u_max
+        self._u_bounds = control_bounds(u_min, u_max, self.n_u)
+
     def set_discrete_dynamics(self, dynamics_func):
         '''
         Sets the dynamics function for the iLQR calculation.
@@ -99,10 +194,42 @@ class iLQR_Calculator():
         total = ln + lf
         return total
 
-    def init_derivatives(self):
+    def init_derivatives(self, cache_dir=default_cache_dir):
         """
         Initialize the derivatives of the dynamics.
+
+        The lambdified derivative functions are stored as a generated python
+        module in cache_dir, keyed by a hash of the dynamics and cost
+        functions (source of their modules and keyword arguments) and the
+        state representation. Later calls with the same problem import the
+        module instead of differentiating again.
+
+        Parameters
+        ----------
+        cache_dir : string, default=default_cache_dir
+            directory of the generated modules (~/.cache/simple_pendulum/
+            ilqr_sympy or the environment variable
+            SIMPLE_PENDULUM_ILQR_CACHE), None disables the cache.
+            The modules are imported, so the directory must not be
+            writable by other users. Problems with functions
+            which can not be identified reliably (e.g. lambdas) are not
+            cached.
         """
+        path = None
+        if cache_dir is not None:
+            key = self._cache_key()
+            if key is not None:
+                path = os.path.join(cache_dir, f"ilqr_derivatives_{key}.py")
+                if os.path.exists(path):
+                    try:
+                        module = _load_module(path)
+                        for name in _derivative_names:
+                            setattr(self, name, getattr(module, name))
+                        return
+                    except (SyntaxError, ImportError, AttributeError):
+                        # damaged file, generate it again
+                        pass
+
         x = self.x_sym
         u = self.u_sym
 
@@ -132,13 +259,44 @@ class iLQR_Calculator():
         self.l_final_xx = smp.lambdify([x], l_final_xx, "numpy")
 
         f = self.discrete_dynamics(x, u)
-        print(x)
         f_x = smp.Matrix([f]).jacobian(x)
         self.f_x = smp.lambdify([x, u], f_x, "numpy")
 
         f_u = smp.Matrix([f]).jacobian(u)
         self.f_u = smp.lambdify([x, u], f_u, "numpy")
 
+        if path is not None:
+            self._write_cache(path)
+
+    def _cache_key(self):
+        functions = [_function_key(f) for f in [self.discrete_dynamics,
+                                                self.stage_cost,
+                                                self.final_cost]]
+        if None in functions:
+            return None
+        key = repr([_cache_format, smp.__version__, np.__version__,
+                    self.n_x, self.n_u] + functions)
+        return hashlib.sha256(key.encode()).hexdigest()[:24]
+
+    def _write_cache(self, path):
+        lines = ["# generated by simple_pendulum ilqr_sympy, do not edit",
+                 "from numpy import *", "import numpy", ""]
+        for name in _derivative_names:
+            source = inspect.getsource(getattr(self, name))
+            lines += ["",
+                      source.replace("def _lambdifygenerated(",
+                                     f"def {name}(", 1)]
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w") as f:
+                f.write("\n".join(lines))
+            # atomic, concurrent processes never import a partial file
+            os.replace(tmp_path, path)
+        except OSError:
+            # e.g. read-only file system, the cache is optional
+            pass
+
     def compute_stage_cost_derivatives(self, x, u):
         l_x = np.atleast_1d(np.squeeze(self.l_x(x, u)))
         l_u = np.atleast_1d(np.squeeze(self.l_u(x, u)))
@@ -188,31 +346,51 @@ class iLQR_Calculator():
             u_trj_new[n, :] = u_trj[n] + k_trj[n] \
                               + np.matmul(K_trj[n],
                                           ((x_trj_new[n] - x_trj[n])))
+            if self._u_bounds is not None:
+                u_trj_new[n, :] = np.clip(u_trj_new[n], *self._u_bounds)
             x_trj_new[n+1, :] = self.discrete_dynamics(x_trj_new[n],
                                                        u_trj_new[n])
         return x_trj_new, u_trj_new
 
+    def _line_search(self, x_trj, u_trj, k_trj, K_trj, alphas):
+        # forward passes of all step sizes in one batch
+        x_trj_new, u_trj_new, total_cost, _ = line_search(
+                        self.discrete_dynamics, self.stage_cost,
+                        self.final_cost, x_trj, u_trj, k_trj, K_trj,
+                        alphas, self._u_bounds)
+        return x_trj_new, u_trj_new, total_cost
+
+    def _stage_cost_derivative_stacks(self, x_trj, u_trj):
+        # derivatives of all knot points in preallocated (N, ...) arrays
+        N = u_trj.shape[0]
+        n_x, n_u = self.n_x, self.n_u
+        if self._stacks is None or self._stacks[0].shape[0] != N:
+            self._stacks = (np.zeros((N, n_x)), np.zeros((N, n_u)),
+                            np.zeros((N, n_x, n_x)), np.zeros((N, n_u, n_x)),
+                            np.zeros((N, n_u, n_u)), np.zeros((N, n_x, n_x)),
+                            np.zeros((N, n_x, n_u)))
+        for n in range(N):
+            derivatives = self.compute_stage_cost_derivatives(x_trj[n],
+                                                              u_trj[n])
+            for stack, d in zip(self._stacks, derivatives):
+                stack[n] = d
+        return self._stacks
+
     def backward_pass(self, x_trj, u_trj, regu):
-        k_trj = np.zeros([u_trj.shape[0], u_trj.shape[1]])
-        K_trj = np.zeros([u_trj.shape[0], u_trj.shape[1], x_trj.shape[1]])
-        expected_cost_redu = 0
         l_final_x, l_final_xx = self.compute_final_cost_derivatives(x_trj[-1])
-        V_x = l_final_x
-        V_xx = l_final_xx
-        for n in range(u_trj.shape[0]-1, -1, -1):
-            l_x, l_u, l_xx, l_ux, l_uu, f_x, f_u = self.compute_stage_cost_derivatives(x_trj[n], u_trj[n])
-            Q_x, Q_u, Q_xx, Q_ux, Q_uu = self.Q_terms(l_x, l_u, l_xx, l_ux, l_uu, f_x, f_u, V_x, V_xx)
-            # We add regularization to ensure that Q_uu is invertible and nicely conditioned
-            Q_uu_regu = Q_uu + np.eye(Q_uu.shape[0])*regu
-            k, K = self.gains(Q_uu_regu, Q_u, Q_ux)
-            k_trj[n, :] = k
-            K_trj[n, :, :] = K
-            V_x, V_xx = self.V_terms(Q_x, Q_u, Q_xx, Q_ux, Q_uu, K, k)
-            expected_cost_redu += self.expected_cost_reduction(Q_u, Q_uu, k)
+        (l_x, l_u, l_xx, l_ux, l_uu,
+         f_x, f_u) = self._stage_cost_derivative_stacks(x_trj, u_trj)
+        u_min, u_max = (None, None) if self._u_bounds is None \
+            else self._u_bounds
+        k_trj, K_trj, expected_cost_redu = self._riccati.compute(
+                                l_x, l_u, l_xx, l_ux, l_uu, f_x, f_u,
+                                l_final_x, l_final_xx, regu, u_trj,
+                                u_min, u_max)
         return k_trj, K_trj, expected_cost_redu
 
     def run_ilqr(self, N=50, init_u_trj=None, init_x_trj=None, shift=False,
-                 max_iter=50, break_cost_redu=1e-6, regu_init=100):
+                 max_iter=50, break_cost_redu=1e-6, regu_init=100,
+                 alphas=None, deadline=None):
         """
         Run the iLQR optimization and receive a optimal trajectory for the
         defined cost function.
@@ -236,6 +414,20 @@ class iLQR_Calculator():
             cost at which the optimization breaks off early
         regu_init : float, default=100
            initialization value for the regularizer
+        alphas : array-like, default=None
+            step sizes of a line search, e.g. [1.0, 0.5, 0.25, 0.125].
+            If given, the forward pass is evaluated for all step sizes in
+            one batch and the candidate with the lowest cost is used.
+            This requires dynamics and cost functions which broadcast over
+            the columns of x and u (as the functions in pendulum.py).
+            If None, only the full step is evaluated.
+        deadline : float, default=None
+            wall clock time in seconds after which the optimization returns
+            the best trajectory found so far. An iteration is only started
+            if it is expected to finish before the deadline (estimated with
+            the mean duration of the previous iterations). The first
+            iteration is always executed.
+            If None, the optimization is only limited by max_iter.
 
         Returns
         -------
@@ -252,68 +444,22 @@ class iLQR_Calculator():
              during the optimization
         redu_trace : array-like
             trace of the cost reduction development during the optimization
+
+        The feedback gains K_trj (shape=(N-1, n_u, n_x)) of the last
+        backward pass are stored in self.K_trj (None if no iteration was
+        computed).
         """
-        # First forward rollout
-        if init_u_trj is not None:
-            u_trj = init_u_trj
-            if shift:
-                u_trj = np.delete(u_trj, 0, axis=0)
-                u_trj = np.append(u_trj, [u_trj[-1]], axis=0)
-        else:
-            u_trj = np.random.randn(N-1, self.n_u)*0.0001
-
-        if init_x_trj is not None:
-            x_trj = init_x_trj
-            if shift:
-                x_trj = np.delete(x_trj, 0, axis=0)
-                x_trj = np.append(x_trj,
-                                  [self.discrete_dynamics(x_trj[-1],
-                                   np.array(u_trj[-1]))], axis=0)
-        else:
-            x_trj = self.rollout(u_trj)
-
-        total_cost = self.cost_trj(x_trj, u_trj)
-        regu = regu_init
-        max_regu = 10000
-        min_regu = 0.01
-
-        # Setup traces
-        cost_trace = [total_cost]
-        redu_ratio_trace = [1]
-        redu_trace = []
-        regu_trace = [regu]
-
-        # Run main loop
-        for it in range(max_iter):
-            # Backward and forward pass
-            k_trj, K_trj, expected_cost_redu = self.backward_pass(x_trj,
-                                                                  u_trj,
-                                                                  regu)
-            x_trj_new, u_trj_new = self.forward_pass(x_trj, u_trj,
-                                                     k_trj, K_trj)
-            # Evaluate new trajectory
-            total_cost = self.cost_trj(x_trj_new, u_trj_new)
-            cost_redu = cost_trace[-1] - total_cost
-            redu_ratio = cost_redu / abs(expected_cost_redu)
-            # Accept or reject iteration
-            if cost_redu > 0:
-                # Improvement! Accept new trajectories and lower regularization
-                redu_ratio_trace.append(redu_ratio)
-                cost_trace.append(total_cost)
-                x_trj = x_trj_new
-                u_trj = u_trj_new
-                regu *= 0.7
-            else:
-                # Reject new trajectories and increase regularization
-                regu *= 2.0
-                cost_trace.append(cost_trace[-1])
-                redu_ratio_trace.append(0)
-            regu = min(max(regu, min_regu), max_regu)
-            regu_trace.append(regu)
-            redu_trace.append(cost_redu)
-
-            # Early termination if expected improvement is small
-            if expected_cost_redu <= break_cost_redu:
-                break
-
-        return x_trj, u_trj, cost_trace, regu_trace, redu_ratio_trace, redu_trace
+        (x_trj, u_trj,
+         cost_trace, regu_trace,
+         redu_ratio_trace,
+         redu_trace, self.K_trj) = run_ilqr_loop(
+                self.rollout, self.cost_trj, self.backward_pass,
+                self.forward_pass, self._line_search,
+                self.discrete_dynamics, self.n_u, self._u_bounds,
+                N=N, init_u_trj=init_u_trj, init_x_trj=init_x_trj,
+                shift=shift, max_iter=max_iter,
+                break_cost_redu=break_cost_redu, regu_init=regu_init,
+                alphas=alphas, deadline=deadline)
+
+        return x_trj, u_trj, cost_trace, regu_trace, \
+            redu_ratio_trace, redu_trace
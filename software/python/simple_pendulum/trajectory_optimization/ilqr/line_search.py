@@ -0,0 +1,130 @@
+"""
+Line Search
+===========
+"""
+
+import numpy as np
+
+
+def forward_pass_batch(discrete_dynamics, x_trj, u_trj, k_trj, K_trj,
+                       alphas, u_bounds=None):
+    """
+    Forward pass of the iLQR algorithm for several step sizes at once.
+    The candidate trajectories are rolled out together, i.e. the dynamics
+    function is called once per knot point with the states of all
+    candidates as columns of an array of shape (n_x, M).
+    This works for dynamics functions which broadcast over the columns
+    of x and u, such as the pendulum dynamics in pendulum.py.
+
+    Parameters
+    ----------
+    discrete_dynamics : function
+        dynamics function with inputs (x, u) and output of the next state
+    x_trj : array-like, shape=(N+1, n_x)
+        state trajectory of the current iteration
+    u_trj : array-like, shape=(N, n_u)
+        control trajectory of the current iteration
+    k_trj : array-like, shape=(N, n_u)
+        feedforward gains
+    K_trj : array-like, shape=(N, n_u, n_x)
+        feedback gains
+    alphas : array-like, shape=(M,)
+        step sizes for the feedforward gains
+    u_bounds : tuple, default=None
+        lower and upper control limits (arrays of shape (n_u,)),
+        the controls are clipped to the limits. No limits if None.
+
+    Returns
+    -------
+    x_trjs : array-like, shape=(M, N+1, n_x)
+        state trajectories of the candidates
+    u_trjs : array-like, shape=(M, N, n_u)
+        control trajectories of the candidates
+        u = u_trj + alpha*k_trj + K_trj (x_new - x_trj)
+    """
+    alphas = np.asarray(alphas, dtype=float)
+    M = alphas.shape[0]
+    N = u_trj.shape[0]
+    x_trjs = np.zeros((M, N+1, x_trj.shape[1]))
+    u_trjs = np.zeros((M, N, u_trj.shape[1]))
+    x_trjs[:, 0] = x_trj[0]
+    du_ff = alphas[:, np.newaxis, np.newaxis]*k_trj + u_trj
+    for n in range(N):
+        dx = x_trjs[:, n] - x_trj[n]
+        u = du_ff[:, n] + dx.dot(K_trj[n].T)
+        if u_bounds is not None:
+            u = np.clip(u, *u_bounds)
+        u_trjs[:, n] = u
+        x_trjs[:, n+1] = np.asarray(discrete_dynamics(x_trjs[:, n].T,
+                                                      u.T)).T
+    return x_trjs, u_trjs
+
+
+def cost_trj_batch(stage_cost, final_cost, x_trjs, u_trjs):
+    """
+    Costs of several candidate trajectories at once, with the same
+    normalization as the cost of a single trajectory in the iLQR
+    calculators. The cost functions have to broadcast over the columns
+    of x and u, such as the pendulum costs in pendulum.py.
+
+    Parameters
+    ----------
+    stage_cost : function
+        stage cost function with inputs (x, u)
+    final_cost : function
+        final cost function with input x
+    x_trjs : array-like, shape=(M, N+1, n_x)
+        state trajectories of the candidates
+    u_trjs : array-like, shape=(M, N, n_u)
+        control trajectories of the candidates
+
+    Returns
+    -------
+    costs : array-like, shape=(M,)
+    """
+    N = x_trjs.shape[1]
+    x = np.moveaxis(x_trjs[:, :-1], 2, 0)
+    u = np.moveaxis(u_trjs, 2, 0)
+    ln = np.sum(np.broadcast_to(stage_cost(x, u), x.shape[1:]), axis=1) / N
+    lf = final_cost(x_trjs[:, -1].T)
+    return ln + lf
+
+
+def line_search(discrete_dynamics, stage_cost, final_cost,
+                x_trj, u_trj, k_trj, K_trj, alphas, u_bounds=None):
+    """
+    Parallel backtracking line search. The forward pass is evaluated for
+    all step sizes in one batch and the candidate with the lowest cost is
+    returned.
+
+    Parameters
+    ----------
+    discrete_dynamics, stage_cost, final_cost : function
+        dynamics and cost functions of the iLQR problem
+    x_trj, u_trj, k_trj, K_trj : array-like
+        trajectories and gains of the current iteration,
+        see forward_pass_batch
+    alphas : array-like, shape=(M,)
+        step sizes
+    u_bounds : tuple, default=None
+        lower and upper control limits, see forward_pass_batch
+
+    Returns
+    -------
+    x_trj_new : array-like, shape=(N+1, n_x)
+        state trajectory of the best candidate
+    u_trj_new : array-like, shape=(N, n_u)
+        control trajectory of the best candidate
+    total_cost : float
+        cost of the best candidate
+    alpha : float
+        step size of the best candidate
+    """
+    alphas = np.asarray(alphas, dtype=float)
+    x_trjs, u_trjs = forward_pass_batch(discrete_dynamics, x_trj, u_trj,
+                                        k_trj, K_trj, alphas, u_bounds)
+    costs = cost_trj_batch(stage_cost, final_cost, x_trjs, u_trjs)
+    # diverged candidates are never selected
+    costs = np.where(np.isfinite(costs), costs, np.inf)
+    best = int(np.argmin(costs))
+    return x_trjs[best], u_trjs[best], costs[best], alphas[best]
@@ -3,38 +3,43 @@ Pendulum Dynamics
 =================
 """
 
+import sys
 import numpy as np
-import sympy as smp
-
-try:
-    import pydrake.symbolic as sym
-    pydrake_available = True
-except ModuleNotFoundError:
-    pydrake_available = False
-    sym = None
 
 
 def check_type(x):
     """
     checks the type of x and returns the suitable library
     (pydrake.symbolic, sympy or numpy) for furhter calculations on x.
+    sympy and pydrake are not imported here, symbolic inputs only exist
+    if the caller has already imported the library.
     """
-    if isinstance(x, (tuple, np.ndarray)) and isinstance(x[0], smp.Expr):
+    smp = sys.modules.get("sympy")
+    sym = sys.modules.get("pydrake.symbolic")
+    if (smp is not None and isinstance(x, (tuple, np.ndarray)) and
+            isinstance(x[0], smp.Expr)):
         md = smp
-    elif isinstance(x, np.ndarray) and x.dtype == object and pydrake_available:
+    elif isinstance(x, np.ndarray) and x.dtype == object and sym is not None:
         md = sym
     else:
         md = np
     return md
 
 
+def is_sympy(md):
+    """
+    whether md (as returned by check_type) is the sympy library
+    """
+    return md.__name__ == "sympy"
+
+
 def pendulum_continuous_dynamics(x, u, m=0.5, l=0.5,
                                  b=0.15, cf=0.0, g=9.81, inertia=0.125):
     md = check_type(x)
 
     pos = x[0]
     vel = x[1]
-    if md == smp or md == sym:
+    if md != np:
         accn = (u[0] - m * g * l * md.sin(pos) - b * vel -
                 cf*md.atan(1e8*vel)*2/np.pi) / inertia
     elif md == np:
@@ -51,7 +56,7 @@ def pendulum_discrete_dynamics_euler(x, u, dt, m=0.57288, l=0.5, b=0.15,
     x_d = pendulum_continuous_dynamics(x, u, m=m, l=l, b=b, cf=cf,
                                        g=g, inertia=inertia)
     x_next = x + x_d*dt
-    if md == smp:
+    if is_sympy(md):
         x_next = tuple(x_next)
     return x_next
 
@@ -71,7 +76,74 @@ def pendulum_discrete_dynamics_rungekutta(x, u, dt, m=0.5, l=0.5,
                                       cf=cf, g=g, inertia=inertia)
     x_d = (k1 + 2 * (k2 + k3) + k4) / 6.0
     x_next = x + x_d*dt
-    if md == smp:
+    if is_sympy(md):
+        x_next = tuple(x_next)
+    return x_next
+
+
+def pendulum_implicit_velocity(vel, torque, dt, b=0.15, cf=0.0,
+                               inertia=0.125, md=np):
+    """
+    velocity after a time step dt with damping and coulomb friction
+    evaluated implicitly at the new velocity vel_next:
+
+        inertia (vel_next - vel) = dt (torque - b vel_next
+                                       - cf sign(vel_next))
+
+    torque collects the explicitly evaluated torques (motor, gravity).
+    The exact solution removes the momentum cf dt (clipped to the
+    momentum, i.e. the pendulum sticks) before the damping. As for the
+    other dynamics in this file the friction is smoothed to keep the
+    function differentiable: clip(p, -c, c) is replaced by
+    2c/pi atan(pi p / 2c).
+    """
+    momentum = inertia*vel + dt*torque
+    if np.any(np.asarray(cf) != 0.0):
+        c = 2.0*cf*dt/np.pi
+        if md == np:
+            c_safe = np.where(c > 0.0, c, 1.0)
+            momentum = momentum - np.where(
+                c > 0.0, c*np.arctan(momentum/c_safe), 0.0)
+        else:
+            momentum = momentum - c*md.atan(momentum/c)
+    return momentum / (inertia + b*dt)
+
+
+def pendulum_discrete_dynamics_symplectic_euler(x, u, dt, m=0.5, l=0.5,
+                                                b=0.15, cf=0.0, g=9.81,
+                                                inertia=0.125):
+    """
+    semi-implicit (symplectic) euler step: the velocity is updated first
+    (damping and friction implicitly), the position with the new velocity
+    """
+    md = check_type(x)
+
+    torque = u[0] - m*g*l*md.sin(x[0])
+    vel = pendulum_implicit_velocity(x[1], torque, dt, b=b, cf=cf,
+                                     inertia=inertia, md=md)
+    x_next = np.array([x[0] + dt*vel, vel])
+    if is_sympy(md):
+        x_next = tuple(x_next)
+    return x_next
+
+
+def pendulum_discrete_dynamics_verlet(x, u, dt, m=0.5, l=0.5, b=0.15,
+                                      cf=0.0, g=9.81, inertia=0.125):
+    """
+    velocity verlet step: two half steps of the velocity around a full
+    step of the position, damping and friction implicitly
+    """
+    md = check_type(x)
+
+    torque = u[0] - m*g*l*md.sin(x[0])
+    vel_half = pendulum_implicit_velocity(x[1], torque, 0.5*dt, b=b, cf=cf,
+                                          inertia=inertia, md=md)
+    pos = x[0] + dt*vel_half
+    torque = u[0] - m*g*l*md.sin(pos)
+    vel = pendulum_implicit_velocity(vel_half, torque, 0.5*dt, b=b, cf=cf,
+                                     inertia=inertia, md=md)
+    x_next = np.array([pos, vel])
+    if is_sympy(md):
         x_next = tuple(x_next)
     return x_next
 
@@ -112,12 +184,12 @@ def pendulum3_discrete_dynamics_euler(x, u, dt, m=0.5, l=0.5, b=0.15,
 
     if md == np:
         x2 = np.array([np.arctan2(x[1], x[0]), x[2]])
-    if md == smp or md == sym:
+    if md != np:
         x2 = np.array([md.atan2(x[1], x[0]), x[2]])
     x_next = pendulum_discrete_dynamics_euler(x2, u, dt, m=m, l=l,
                                               b=b, cf=cf, g=g, inertia=inertia)
     x3 = np.array([md.cos(x_next[0]), md.sin(x_next[0]), x_next[1]])
-    if md == smp:
+    if is_sympy(md):
         x3 = tuple(x3)
     return x3
 
@@ -129,13 +201,50 @@ def pendulum3_discrete_dynamics_rungekutta(x, u, dt, m=0.5, l=0.5, b=0.15,
 
     if md == np:
         x2 = np.array([np.arctan2(x[1], x[0]), x[2]])
-    if md == smp or md == sym:
+    if md != np:
         x2 = np.array([md.atan2(x[1], x[0]), x[2]])
     x_next = pendulum_discrete_dynamics_rungekutta(x2, u, dt, m=m,
                                                    l=l, b=b, cf=cf, g=g,
                                                    inertia=inertia)
     x3 = np.array([md.cos(x_next[0]), md.sin(x_next[0]), x_next[1]])
-    if md == smp:
+    if is_sympy(md):
+        x3 = tuple(x3)
+    return x3
+
+
+def pendulum3_discrete_dynamics_symplectic_euler(x, u, dt, m=0.5, l=0.5,
+                                                 b=0.15, cf=0.0, g=9.81,
+                                                 inertia=0.125):
+    # pendulum state x = [cos(theta), sin(theta), thetadot]
+    md = check_type(x)
+
+    if md == np:
+        x2 = np.array([np.arctan2(x[1], x[0]), x[2]])
+    if md != np:
+        x2 = np.array([md.atan2(x[1], x[0]), x[2]])
+    x_next = pendulum_discrete_dynamics_symplectic_euler(x2, u, dt, m=m,
+                                                         l=l, b=b, cf=cf,
+                                                         g=g,
+                                                         inertia=inertia)
+    x3 = np.array([md.cos(x_next[0]), md.sin(x_next[0]), x_next[1]])
+    if is_sympy(md):
+        x3 = tuple(x3)
+    return x3
+
+
+def pendulum3_discrete_dynamics_verlet(x, u, dt, m=0.5, l=0.5, b=0.15,
+                                       cf=0.0, g=9.81, inertia=0.125):
+    # pendulum state x = [cos(theta), sin(theta), thetadot]
+    md = check_type(x)
+
+    if md == np:
+        x2 = np.array([np.arctan2(x[1], x[0]), x[2]])
+    if md != np:
+        x2 = np.array([md.atan2(x[1], x[0]), x[2]])
+    x_next = pendulum_discrete_dynamics_verlet(x2, u, dt, m=m, l=l, b=b,
+                                               cf=cf, g=g, inertia=inertia)
+    x3 = np.array([md.cos(x_next[0]), md.sin(x_next[0]), x_next[1]])
+    if is_sympy(md):
         x3 = tuple(x3)
     return x3
 
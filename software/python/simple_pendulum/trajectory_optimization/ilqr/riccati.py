@@ -0,0 +1,220 @@
+"""
+Riccati Backward Pass
+=====================
+"""
+
+import numpy as np
+
+from simple_pendulum.trajectory_optimization.ilqr.box_qp import \
+    clamped_gains
+
+
+class RiccatiBackwardPass():
+    '''
+    Backward pass of the iLQR algorithm for derivatives which are given
+    for all knot points of a trajectory as stacked arrays
+    (e.g. f_x with shape (N, n_x, n_x)).
+    '''
+    def __init__(self, n_x=2, n_u=1):
+        '''
+        Backward pass of the iLQR algorithm for derivatives which are given
+        for all knot points of a trajectory as stacked arrays.
+        All work arrays are allocated once (and reallocated only when the
+        horizon changes), so that the recursion does not allocate memory
+        at every knot point. For n_u=1 the inversion of Q_uu is done in
+        closed form.
+        With control limits, the gains are computed with the box-constrained
+        (control-limited) backward pass of Tassa et al. (2014).
+
+        Parameters
+        ----------
+        n_x : int, default=2
+            The size of the state space.
+        n_u : int, default=1
+            The size of the control space.
+        '''
+        self.n_x = n_x
+        self.n_u = n_u
+        self.N = 0
+        n = n_x + n_u
+
+        # value function
+        self.V_x = np.zeros(n_x)
+        self.V_xx = np.zeros((n_x, n_x))
+
+        # Q terms of the joint vector [x, u]
+        # Q = [[Q_xx, Q_xu], [Q_ux, Q_uu]], q = [Q_x, Q_u]
+        self.Q = np.zeros((n, n))
+        self.q = np.zeros(n)
+        self.Q_x = self.q[:n_x]
+        self.Q_u = self.q[n_x:]
+        self.Q_ux = self.Q[n_x:, :n_x]
+        self.Q_uu = self.Q[n_x:, n_x:]
+
+        # gains of the joint vector, [x, u] = G x + [0, k] with G = [I, K]
+        self._G = np.zeros((n, n_x))
+        self._G[:n_x, :n_x] = np.eye(n_x)
+        self._g = np.zeros(n)
+        self._K = self._G[n_x:]
+        self._k = self._g[n_x:]
+
+        # intermediate products
+        self._FT_Vxx = np.zeros((n, n_x))
+        self._QG = np.zeros((n, n_x))
+        self._n = np.zeros(n)
+
+    def resize(self, N):
+        '''
+        Allocate the work arrays for a horizon of N knot points.
+
+        Parameters
+        ----------
+        N : int
+            number of control inputs of the trajectory
+        '''
+        if N != self.N:
+            self.N = N
+            n = self.n_x + self.n_u
+            self.k_trj = np.zeros((N, self.n_u))
+            self.K_trj = np.zeros((N, self.n_u, self.n_x))
+            # stacked derivatives of the joint vector [x, u]
+            self._F = np.zeros((N, self.n_x, n))
+            self._FT = np.zeros((N, n, self.n_x))
+            self._L = np.zeros((N, n, n))
+            self._l = np.zeros((N, n))
+
+    def compute(self, l_x, l_u, l_xx, l_ux, l_uu, f_x, f_u,
+                l_final_x, l_final_xx, regu, u_trj=None, u_min=None,
+                u_max=None):
+        '''
+        Compute the feedforward and feedback gains of the trajectory.
+
+        Parameters
+        ----------
+        l_x, l_u, l_xx, l_ux, l_uu : array-like
+            stage cost derivatives at all N knot points,
+            shapes (N, n_x), (N, n_u), (N, n_x, n_x), (N, n_u, n_x),
+            (N, n_u, n_u)
+        f_x, f_u : array-like
+            dynamics derivatives at all N knot points,
+            shapes (N, n_x, n_x), (N, n_x, n_u)
+        l_final_x, l_final_xx : array-like
+            final cost derivatives, shapes (n_x,), (n_x, n_x)
+        regu : float
+            regularization added to Q_uu
+        u_trj : array-like, shape=(N, n_u), default=None
+            control trajectory, only needed with control limits
+        u_min : array-like, shape=(n_u,), default=None
+            lower control limits, no lower limits if None
+        u_max : array-like, shape=(n_u,), default=None
+            upper control limits, no upper limits if None
+
+        Returns
+        -------
+        k_trj : array-like, shape=(N, n_u)
+            feedforward gains
+        K_trj : array-like, shape=(N, n_u, n_x)
+            feedback gains
+        expected_cost_redu : float
+            expected cost reduction
+
+        The gain arrays are work arrays of this object and are overwritten
+        by the next call. Copy them if they have to be kept.
+        '''
+        N = f_x.shape[0]
+        n_x = self.n_x
+        self.resize(N)
+        k_trj, K_trj = self.k_trj, self.K_trj
+
+        # assemble the derivatives of the joint vector [x, u]
+        F, FT, L, l = self._F, self._FT, self._L, self._l
+        F[:, :, :n_x] = f_x
+        F[:, :, n_x:] = f_u
+        np.copyto(FT, np.swapaxes(F, 1, 2))
+        L[:, :n_x, :n_x] = l_xx
+        L[:, n_x:, :n_x] = l_ux
+        L[:, :n_x, n_x:] = np.swapaxes(l_ux, 1, 2)
+        L[:, n_x:, n_x:] = l_uu
+        l[:, :n_x] = l_x
+        l[:, n_x:] = l_u
+
+        V_x, V_xx = self.V_x, self.V_xx
+        Q, q, Q_u, Q_ux, Q_uu = self.Q, self.q, self.Q_u, self.Q_ux, self.Q_uu
+        G, g, K, k = self._G, self._g, self._K, self._k
+        FT_Vxx, QG, tmp = self._FT_Vxx, self._QG, self._n
+        scalar_u = self.n_u == 1
+
+        # bounds of the control updates k for the control-limited pass
+        constrained = u_min is not None or u_max is not None
+        if constrained:
+            if u_min is None:
+                u_min = -np.inf
+            if u_max is None:
+                u_max = np.inf
+            lower = np.broadcast_to(u_min, (N, self.n_u)) - u_trj
+            upper = np.broadcast_to(u_max, (N, self.n_u)) - u_trj
+
+        np.copyto(V_x, l_final_x)
+        np.copyto(V_xx, l_final_xx)
+        expected_cost_redu = 0.0
+        for n in range(N-1, -1, -1):
+            # Q terms
+            # Q = L + F^T V_xx F, q = l + F^T V_x
+            np.dot(FT[n], V_xx, out=FT_Vxx)
+            np.dot(FT_Vxx, F[n], out=Q)
+            Q += L[n]
+            np.dot(FT[n], V_x, out=q)
+            q += l[n]
+
+            # gains, we add regularization to ensure that Q_uu is
+            # invertible and nicely conditioned
+            if scalar_u:
+                Q_uu_n = Q[n_x, n_x]
+                q_inv = -1.0 / (Q_uu_n + regu)
+                np.multiply(Q_ux, q_inv, out=K)
+                k_n = q[n_x]*q_inv
+                if constrained:
+                    # minimum of the 1d quadratic in the box, a clamped
+                    # control gets no feedback
+                    if k_n < lower[n, 0]:
+                        k_n = lower[n, 0]
+                        K[:] = 0.0
+                    elif k_n > upper[n, 0]:
+                        k_n = upper[n, 0]
+                        K[:] = 0.0
+                k[0] = k_n
+                # expected cost reduction -Q_u^T k - 0.5 k^T Q_uu k
+                expected_cost_redu -= q[n_x]*k_n + 0.5*k_n*Q_uu_n*k_n
+            elif constrained:
+                Q_uu_regu = 0.5*(Q_uu + Q_uu.T) + np.eye(self.n_u)*regu
+                # warm start the box QP with the gain of the last call
+                k[:], K[:] = clamped_gains(Q_uu_regu, Q_u, Q_ux,
+                                           lower[n], upper[n], k0=k_trj[n])
+                expected_cost_redu -= (np.dot(Q_u, k) +
+                                       0.5*np.dot(k, Q_uu.dot(k)))
+            else:
+                Q_uu_regu = 0.5*(Q_uu + Q_uu.T) + np.eye(self.n_u)*regu
+                Q_uu_inv = np.linalg.inv(Q_uu_regu)
+                np.dot(-Q_uu_inv, Q_u, out=k)
+                np.dot(-Q_uu_inv, Q_ux, out=K)
+                expected_cost_redu -= (np.dot(Q_u, k) +
+                                       0.5*np.dot(k, Q_uu.dot(k)))
+            K_trj[n] = K
+            k_trj[n] = k
+
+            # value function
+            # V_x = Q_x + K^T Q_u + 0.5*(Q_ux^T k + K^T Q_uu^T k)
+            #     = G^T (q + 0.5 Q^T [0, k])
+            # with control limits k and K are not the unconstrained optimum
+            # and the full expansion is used
+            # V_x = Q_x + K^T Q_u + Q_ux^T k + K^T Q_uu k = G^T (q + Q^T g)
+            np.dot(Q.T, g, out=tmp)
+            if not constrained:
+                tmp *= 0.5
+            tmp += q
+            np.dot(G.T, tmp, out=V_x)
+            # V_xx = Q_xx + Q_ux^T K + K^T Q_ux + K^T Q_uu K = G^T Q G
+            np.dot(Q, G, out=QG)
+            np.dot(G.T, QG, out=V_xx)
+
+        return k_trj, K_trj, expected_cost_redu
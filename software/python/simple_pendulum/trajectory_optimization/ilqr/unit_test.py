@@ -4,15 +4,28 @@ Unit Tests
 """
 
 
+import os
+import tempfile
 import unittest
 import numpy as np
 from functools import partial
+import pydrake.symbolic as sym
 
 from simple_pendulum.trajectory_optimization.ilqr.ilqr import iLQR_Calculator
 from simple_pendulum.trajectory_optimization.ilqr.ilqr_sympy import iLQR_Calculator as iLQR_Calculator_sympy
+from simple_pendulum.trajectory_optimization.ilqr.ilqr_analytic import iLQR_Calculator as iLQR_Calculator_analytic
+from simple_pendulum.trajectory_optimization.ilqr.ilqr_batch import iLQR_BatchCalculator
+from simple_pendulum.trajectory_optimization.ilqr.box_qp import box_qp
+from simple_pendulum.trajectory_optimization.ilqr.riccati import RiccatiBackwardPass
+from simple_pendulum.trajectory_optimization.ilqr.line_search import (
+                                    forward_pass_batch,
+                                    line_search
+                                    )
 
 from simple_pendulum.trajectory_optimization.ilqr.pendulum import (
                                     pendulum_discrete_dynamics_rungekutta,
+                                    pendulum_discrete_dynamics_verlet,
+                                    pendulum3_discrete_dynamics_symplectic_euler,
                                     pendulum_swingup_stage_cost,
                                     pendulum_swingup_final_cost,
                                     pendulum3_discrete_dynamics_rungekutta,
@@ -291,7 +304,7 @@ class Test(unittest.TestCase):
         iLQR.set_stage_cost(s_cost)
         iLQR.set_final_cost(f_cost)
 
-        iLQR.init_derivatives()
+        iLQR.init_derivatives(cache_dir=None)
         iLQR.set_start(x0)
 
         # computation
@@ -389,7 +402,7 @@ class Test(unittest.TestCase):
         iLQR.set_stage_cost(s_cost)
         iLQR.set_final_cost(f_cost)
 
-        iLQR.init_derivatives()
+        iLQR.init_derivatives(cache_dir=None)
         iLQR.set_start(x0)
 
         # computation
@@ -412,3 +425,293 @@ class Test(unittest.TestCase):
                       "final state: ", X[-1])
 
         self.assertTrue(stabilization_success)
+
+    def test_1_compiled_derivatives(self):
+        dyn = partial(pendulum3_discrete_dynamics_rungekutta,
+                      dt=0.01, m=0.57288, l=0.5, b=0.15, cf=0.1,
+                      g=9.81, inertia=0.143)
+        goal = np.array([-1.0, 0.0, 0.0])
+        s_cost = partial(pendulum3_swingup_stage_cost, goal=goal,
+                         Cu=10.0, Cp=10.0, Cv=10.0, Cen=1.0)
+        f_cost = partial(pendulum3_swingup_final_cost, goal=goal,
+                         Cp=1000.0, Cv=10.0, Cen=1.0)
+
+        iLQR = iLQR_Calculator(n_x=3, n_u=1)
+        iLQR.set_discrete_dynamics(dyn)
+        iLQR.set_stage_cost(s_cost)
+        iLQR.set_final_cost(f_cost)
+        iLQR.init_derivatives()
+
+        pos = np.linspace(-3.0, 3.0, 7)
+        x_trj = np.stack((np.cos(pos), np.sin(pos), pos), axis=1)
+        u_trj = np.linspace(-1.0, 1.0, 7)[:, np.newaxis]
+        derivatives = iLQR._compute_stage_cost_derivatives(x_trj, u_trj)
+        names = ["l_x", "l_u", "l_xx", "l_ux", "l_uu", "f_x", "f_u"]
+        for n in range(len(pos)):
+            env = {iLQR.x_sym[i]: x_trj[n, i] for i in range(3)}
+            env[iLQR.u_sym[0]] = u_trj[n, 0]
+            for name, d in zip(names, derivatives):
+                expected = sym.Evaluate(getattr(iLQR, name), env)
+                self.assertTrue(np.allclose(d[n].ravel(), expected.ravel()))
+
+        # a second calculator with equal parameters reuses the
+        # compiled functions
+        iLQR2 = iLQR_Calculator(n_x=3, n_u=1)
+        iLQR2.set_discrete_dynamics(partial(dyn))
+        iLQR2.set_stage_cost(s_cost)
+        iLQR2.set_final_cost(f_cost)
+        iLQR2.init_derivatives()
+        self.assertIs(iLQR._f_x_func, iLQR2._f_x_func)
+
+    def test_2_riccati_backward_pass(self):
+        N = 20
+        rng = np.random.default_rng(0)
+        for n_x, n_u in [(2, 1), (3, 1), (3, 2)]:
+            def sym_stack(*shape):
+                A = rng.normal(size=shape)
+                return A + np.swapaxes(A, -1, -2) + 2*n_x*np.eye(shape[-1])
+            l_x = rng.normal(size=(N, n_x))
+            l_u = rng.normal(size=(N, n_u))
+            l_xx = sym_stack(N, n_x, n_x)
+            l_ux = 0.1*rng.normal(size=(N, n_u, n_x))
+            l_uu = sym_stack(N, n_u, n_u)
+            f_x = np.eye(n_x) + 0.1*rng.normal(size=(N, n_x, n_x))
+            f_u = rng.normal(size=(N, n_x, n_u))
+            l_final_x = rng.normal(size=n_x)
+            l_final_xx = sym_stack(n_x, n_x)
+            regu = 0.5
+
+            riccati = RiccatiBackwardPass(n_x=n_x, n_u=n_u)
+            k_trj, K_trj, redu = riccati.compute(l_x, l_u, l_xx, l_ux, l_uu,
+                                                 f_x, f_u, l_final_x,
+                                                 l_final_xx, regu)
+
+            # reference: the recursion written out at every knot point
+            V_x = l_final_x
+            V_xx = l_final_xx
+            expected_redu = 0.0
+            for n in range(N-1, -1, -1):
+                Q_x = f_x[n].T.dot(V_x) + l_x[n]
+                Q_u = f_u[n].T.dot(V_x) + l_u[n]
+                Q_xx = l_xx[n] + f_x[n].T.dot(V_xx.dot(f_x[n]))
+                Q_ux = l_ux[n] + f_u[n].T.dot(V_xx.dot(f_x[n]))
+                Q_uu = l_uu[n] + f_u[n].T.dot(V_xx.dot(f_u[n]))
+                Q_uu_inv = np.linalg.inv(Q_uu + np.eye(n_u)*regu)
+                k = -Q_uu_inv.dot(Q_u)
+                K = -Q_uu_inv.dot(Q_ux)
+                self.assertTrue(np.allclose(k_trj[n], k))
+                self.assertTrue(np.allclose(K_trj[n], K))
+                V_x = (Q_x + K.T.dot(Q_u) +
+                       0.5*(Q_ux.T.dot(k) + K.T.dot(Q_uu.T.dot(k))))
+                V_xx = (Q_xx + Q_ux.T.dot(K) + K.T.dot(Q_ux) +
+                        K.T.dot(Q_uu.dot(K)))
+                expected_redu += -Q_u.dot(k) - 0.5*k.dot(Q_uu.dot(k))
+            self.assertTrue(np.isclose(redu, expected_redu))
+
+    def test_3_line_search(self):
+        dyn = partial(pendulum_discrete_dynamics_rungekutta,
+                      dt=0.01, m=0.57288, l=0.5, b=0.15, cf=0.0,
+                      g=9.81, inertia=0.143)
+        goal = np.array([np.pi, 0.0])
+        s_cost = partial(pendulum_swingup_stage_cost, goal=goal,
+                         Cu=0.1, Cp=0.0, Cv=0.0, Cen=0.0)
+        f_cost = partial(pendulum_swingup_final_cost, goal=goal,
+                         Cp=1000.0, Cv=10.0, Cen=0.0)
+
+        iLQR = iLQR_Calculator(n_x=2, n_u=1)
+        iLQR.set_discrete_dynamics(dyn)
+        iLQR.set_stage_cost(s_cost)
+        iLQR.set_final_cost(f_cost)
+        iLQR.init_derivatives()
+        iLQR.set_start(np.array([0.0, 0.0]))
+
+        u_trj = 0.1*np.ones((100, 1))
+        x_trj = iLQR._rollout(u_trj)
+        k_trj, K_trj, _ = iLQR._backward_pass(x_trj, u_trj, 100)
+
+        # the sympy calculator runs the same backward pass
+        iLQR_sympy = iLQR_Calculator_sympy(n_x=2, n_u=1)
+        iLQR_sympy.set_discrete_dynamics(dyn)
+        iLQR_sympy.set_stage_cost(s_cost)
+        iLQR_sympy.set_final_cost(f_cost)
+        iLQR_sympy.init_derivatives(cache_dir=None)
+        k_sympy, K_sympy, _ = iLQR_sympy.backward_pass(x_trj, u_trj, 100)
+        self.assertTrue(np.allclose(k_sympy, k_trj))
+        self.assertTrue(np.allclose(K_sympy, K_trj))
+
+        # the batched rollout agrees with the single forward passes
+        alphas = [1.0, 0.5, 0.25]
+        x_trjs, u_trjs = forward_pass_batch(dyn, x_trj, u_trj,
+                                            k_trj, K_trj, alphas)
+        costs = []
+        for i, alpha in enumerate(alphas):
+            x_new, u_new = iLQR._forward_pass(x_trj, u_trj,
+                                              alpha*k_trj, K_trj)
+            self.assertTrue(np.allclose(x_trjs[i], x_new))
+            self.assertTrue(np.allclose(u_trjs[i], u_new))
+            costs.append(iLQR._cost_trj(x_new, u_new))
+
+        # the line search returns the best candidate
+        _, _, cost, _ = line_search(dyn, s_cost, f_cost, x_trj, u_trj,
+                                    k_trj, K_trj, alphas)
+        self.assertTrue(np.isclose(cost, min(costs)))
+
+    def test_4_batch_calculator(self):
+        N = 100
+        masses = np.array([0.5, 0.57288, 0.65])
+        x0 = np.array([[0.0, 0.0], [0.3, -1.0], [-0.5, 2.0]])
+        u0 = np.random.randn(3, N-1, 1)*0.0001
+
+        def functions(m):
+            dyn = partial(pendulum_discrete_dynamics_rungekutta, dt=0.01,
+                          m=m, l=0.5, b=0.15, cf=0.0, g=9.81,
+                          inertia=m*0.25)
+            s_cost = partial(pendulum_swingup_stage_cost,
+                             goal=np.array([np.pi, 0]), Cu=0.1, Cp=0.1,
+                             Cv=0.1, Cen=1.0, m=m, l=0.5, g=9.81)
+            f_cost = partial(pendulum_swingup_final_cost,
+                             goal=np.array([np.pi, 0]), Cp=100.0, Cv=10.0,
+                             Cen=1.0, m=m, l=0.5, g=9.81)
+            return dyn, s_cost, f_cost
+
+        batch = iLQR_BatchCalculator(n_x=2, n_u=1)
+        dyn, s_cost, f_cost = functions(0.57288)
+        batch.set_discrete_dynamics(dyn)
+        batch.set_stage_cost(s_cost)
+        batch.set_final_cost(f_cost)
+        batch.init_derivatives()
+        batch.set_start(x0)
+        batch.set_parameters(m=masses, inertia=masses*0.25)
+        x_trjs, u_trjs, cost_trace, _, _, _ = batch.run_ilqr(
+                                N=N, init_u_trj=u0, max_iter=20)
+        self.assertEqual(x_trjs.shape, (3, N, 2))
+
+        # every problem is solved as by the single problem calculator
+        for i, m in enumerate(masses):
+            iLQR = iLQR_Calculator_analytic(n_x=2, n_u=1)
+            dyn, s_cost, f_cost = functions(m)
+            iLQR.set_discrete_dynamics(dyn)
+            iLQR.set_stage_cost(s_cost)
+            iLQR.set_final_cost(f_cost)
+            iLQR.init_derivatives()
+            iLQR.set_start(x0[i])
+            x_trj, u_trj, trace, _, _, _ = iLQR.run_ilqr(
+                                N=N, init_u_trj=u0[i], max_iter=20)
+            self.assertEqual(batch.iterations[i], len(trace) - 1)
+            self.assertTrue(np.allclose(u_trjs[i], u_trj))
+            self.assertTrue(np.isclose(cost_trace[-1, i], trace[-1]))
+
+    def test_5_box_qp(self):
+        rng = np.random.default_rng(1)
+        for _ in range(20):
+            A = rng.normal(size=(3, 3))
+            H = A.dot(A.T) + 0.1*np.eye(3)
+            g = rng.normal(size=3)*3.0
+            lower = -np.ones(3)
+            upper = np.ones(3)
+            x, free = box_qp(H, g, lower, upper)
+            # KKT conditions: zero gradient in the free variables,
+            # gradient pointing outwards at the clamped bounds
+            grad = g + H.dot(x)
+            self.assertTrue(np.all(x >= lower) and np.all(x <= upper))
+            self.assertTrue(np.allclose(grad[free], 0.0, atol=1e-6))
+            self.assertTrue(np.all(grad[(~free) & (x <= lower)] > 0))
+            self.assertTrue(np.all(grad[(~free) & (x >= upper)] < 0))
+
+    def test_6_control_limits(self):
+        m = 0.57288
+        dyn = partial(pendulum_discrete_dynamics_rungekutta, dt=0.02,
+                      m=m, l=0.5, b=0.15, cf=0.0, g=9.81,
+                      inertia=m*0.25)
+        s_cost = partial(pendulum_swingup_stage_cost,
+                         goal=np.array([np.pi, 0]), Cu=0.01, Cp=0.0,
+                         Cv=0.0, Cen=0.0, m=m, l=0.5, g=9.81)
+        f_cost = partial(pendulum_swingup_final_cost,
+                         goal=np.array([np.pi, 0]), Cp=1000.0, Cv=100.0,
+                         Cen=0.0, m=m, l=0.5, g=9.81)
+        torque_limit = 2.0
+        u0 = np.random.randn(149, 1)*0.0001
+
+        solutions = []
+        for calculator, kwargs in [(iLQR_Calculator, {}),
+                                   (iLQR_Calculator_sympy,
+                                    {"cache_dir": None})]:
+            iLQR = calculator(n_x=2, n_u=1)
+            iLQR.set_discrete_dynamics(dyn)
+            iLQR.set_stage_cost(s_cost)
+            iLQR.set_final_cost(f_cost)
+            iLQR.init_derivatives(**kwargs)
+            iLQR.set_start(np.array([0.0, 0.0]))
+            iLQR.set_control_limits(-torque_limit, torque_limit)
+            x_trj, u_trj, _, _, _, _ = iLQR.run_ilqr(init_u_trj=u0,
+                                                     max_iter=10)
+            self.assertTrue(np.max(np.abs(u_trj)) <= torque_limit)
+            solutions.append(u_trj)
+
+        # the pydrake and sympy backward passes agree
+        self.assertTrue(np.allclose(solutions[0], solutions[1]))
+
+    def test_7_sympy_derivative_cache(self):
+        dyn = partial(pendulum3_discrete_dynamics_rungekutta,
+                      dt=0.01, m=0.57288, l=0.5, b=0.15, cf=0.1,
+                      g=9.81, inertia=0.143)
+        goal = np.array([-1.0, 0.0, 0.0])
+        s_cost = partial(pendulum3_swingup_stage_cost, goal=goal,
+                         Cu=10.0, Cp=10.0, Cv=10.0, Cen=1.0)
+        f_cost = partial(pendulum3_swingup_final_cost, goal=goal,
+                         Cp=1000.0, Cv=10.0, Cen=1.0)
+        x = np.array([0.3, 0.9, -1.0])
+        u = np.array([0.4])
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            derivatives = []
+            for _ in range(2):
+                iLQR = iLQR_Calculator_sympy(n_x=3, n_u=1)
+                iLQR.set_discrete_dynamics(dyn)
+                iLQR.set_stage_cost(s_cost)
+                iLQR.set_final_cost(f_cost)
+                iLQR.init_derivatives(cache_dir=cache_dir)
+                derivatives.append(
+                    iLQR.compute_stage_cost_derivatives(x, u) +
+                    iLQR.compute_final_cost_derivatives(x))
+            # the second calculator imports the generated module
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            self.assertEqual(iLQR.f_x.__module__,
+                             "_ilqr_sympy_derivatives")
+            for d0, d1 in zip(*derivatives):
+                self.assertTrue(np.array_equal(d0, d1))
+
+            # other parameters give a different module
+            iLQR.set_discrete_dynamics(partial(dyn, b=0.2))
+            iLQR.init_derivatives(cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_8_symplectic_dynamics_derivatives(self):
+        x_sym = np.array([sym.Variable("x0"), sym.Variable("x1"),
+                          sym.Variable("x2")])
+        u_sym = np.array([sym.Variable("u0")])
+        for dyn_func, x in [
+                (pendulum_discrete_dynamics_verlet, np.array([0.4, -0.9])),
+                (pendulum3_discrete_dynamics_symplectic_euler,
+                 np.array([np.cos(0.4), np.sin(0.4), -0.9]))]:
+            dyn = partial(dyn_func, dt=0.05, m=0.57288, l=0.5, b=0.15,
+                          cf=0.1, g=9.81, inertia=0.143)
+            n_x = len(x)
+            u = np.array([0.3])
+            f = dyn(x_sym[:n_x], u_sym)
+            env = {v: val for v, val in zip(x_sym[:n_x], x)}
+            env[u_sym[0]] = u[0]
+            f_x = sym.Evaluate(sym.Jacobian(f, x_sym[:n_x]), env)
+            f_u = sym.Evaluate(sym.Jacobian(f, u_sym), env)
+            # symbolic and numeric dynamics agree
+            self.assertTrue(np.allclose(sym.Evaluate(f, env).ravel(),
+                                        dyn(x, u)))
+            # derivatives agree with finite differences
+            eps = 1e-6
+            for i in range(n_x):
+                dx = np.zeros(n_x)
+                dx[i] = eps
+                fd = (dyn(x + dx, u) - dyn(x - dx, u)) / (2*eps)
+                self.assertTrue(np.allclose(f_x[:, i], fd, atol=1e-6))
+            fd = (dyn(x, u + eps) - dyn(x, u - eps)) / (2*eps)
+            self.assertTrue(np.allclose(f_u[:, 0], fd, atol=1e-6))
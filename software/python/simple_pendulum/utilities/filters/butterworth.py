@@ -3,15 +3,7 @@ Butterworth Low-pass Filter
 ===========================
 """
 
-# import numpy as np
-import matplotlib.pyplot as plt
-from scipy import signal, optimize
-
-from scipy.optimize import curve_fit, least_squares
-from scipy.signal import medfilt
-# from scipy import signal, optimize
-from scipy.fftpack import rfft, irfft, rfftfreq
-from sklearn.linear_model import LinearRegression
+# scipy.signal is imported on the first use of data_filter
 
 
 # Butterworth filter
@@ -21,6 +13,8 @@ def data_filter(data_measured, order, cutoff):
     the Nyquist frequency or 200 Hz, returning enumerator (b) and
     denominator (a) polynomials for a Infinite Impulse Response (IIR) filter
     """
+    from scipy import signal
+
     b, a = signal.butter(order, cutoff)
 
     # applies a linear digital filter twice, once forward and once backwards.
@@ -0,0 +1,178 @@
+"""
+Import Time
+===========
+
+Measures the import time of the simple_pendulum modules in fresh python
+processes (python -X importtime, Python >= 3.7) and checks them against
+a budget and that they do not import heavy libraries.
+Run as
+
+    python -m simple_pendulum.utilities.import_time
+
+The exit code is 1 if a core module exceeds its budget or imports a heavy
+library.
+"""
+
+
+import os
+import sys
+import subprocess
+
+import simple_pendulum
+
+# modules which are imported in (forked) simulation workers or in the
+# motor control loop
+core_modules = [
+    "simple_pendulum.model.pendulum_plant",
+    "simple_pendulum.simulation.simulation",
+    "simple_pendulum.simulation.batch_simulation",
+    "simple_pendulum.trajectory_optimization.ilqr.pendulum",
+    "simple_pendulum.controllers.ilqr.iLQR_MPC_controller",
+    "simple_pendulum.controllers.lookup_table.lookup_table_controller",
+    "simple_pendulum.controllers.mlp.mlp_controller",
+    "simple_pendulum.utilities.filters.butterworth"]
+
+# libraries which must only be imported on first use by the core modules
+heavy_modules = ["matplotlib", "sympy", "pydrake", "sklearn", "pandas",
+                 "scipy.optimize", "scipy.spatial", "torch", "tensorflow"]
+
+# import time in seconds on top of the numpy import
+default_budget = 0.15
+
+
+def _subprocess_env():
+    # fresh processes import the same simple_pendulum package
+    package_root = os.path.dirname(os.path.dirname(simple_pendulum.__file__))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [package_root] + [p for p in [env.get("PYTHONPATH")] if p])
+    return env
+
+
+def imported_modules(module):
+    """
+    Names of all modules which are loaded after importing a module in a
+    fresh python process (including the modules of the interpreter
+    startup).
+
+    Parameters
+    ----------
+    module : string
+        name of the module, e.g. "simple_pendulum.simulation.simulation"
+
+    Returns
+    -------
+    list of strings
+    """
+    result = subprocess.run(
+        [sys.executable, "-c",
+         f"import {module}, sys; print('\\n'.join(sys.modules))"],
+        env=_subprocess_env(), stdout=subprocess.PIPE,
+        universal_newlines=True, check=True)
+    return result.stdout.split()
+
+
+def measure_import(module, repeats=3):
+    """
+    Measure the import time of a module in fresh python processes
+    (python -X importtime, Python >= 3.7).
+
+    Parameters
+    ----------
+    module : string
+        name of the module, e.g. "simple_pendulum.simulation.simulation"
+    repeats : int, default=3
+        number of processes, the fastest import is reported
+
+    Returns
+    -------
+    import_time : float
+        cumulative import time of the module in seconds
+    """
+    import_time = float("inf")
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            env=_subprocess_env(), stderr=subprocess.PIPE,
+            universal_newlines=True, check=True)
+        cumulative = 0.0
+        # lines: "import time: self [us] | cumulative | imported package"
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            fields = line[len("import time:"):].split("|")
+            name = fields[2].strip()
+            if fields[2] == " " + name and (
+                    module == name or module.startswith(name + ".")):
+                # the module and its parent packages, not the imports of
+                # the interpreter startup
+                cumulative += float(fields[1])*1e-6
+        import_time = min(import_time, cumulative)
+    return import_time
+
+
+def import_time_report(modules=None, budget=default_budget, repeats=3,
+                       measure_time=True, verbose=True):
+    """
+    Measure the import times of several modules and compare them to a
+    budget. The budget is relative to the import time of numpy, which all
+    modules need, so that the check does not depend on the speed of the
+    machine.
+
+    Parameters
+    ----------
+    modules : list of strings, default=None
+        names of the modules, core_modules if None
+    budget : float, default=default_budget
+        allowed import time in seconds in addition to the numpy import
+    repeats : int, default=3
+        number of measurements per module, the fastest is used
+    measure_time : bool, default=True
+        whether to measure the import times. The times need
+        python -X importtime and are only measured on Python >= 3.7.
+        Otherwise only the heavy imports are checked.
+    verbose : bool, default=True
+        whether to print the report
+
+    Returns
+    -------
+    report : dict
+        for every module a dict with the import time ("time", None if not
+        measured), the heavy libraries it imports ("heavy") and whether it
+        is within the budget and imports no heavy library ("ok")
+    """
+    if modules is None:
+        modules = core_modules
+    measure_time = measure_time and sys.version_info >= (3, 7)
+    if measure_time:
+        numpy_time = measure_import("numpy", repeats)
+
+    report = {}
+    for module in modules:
+        imported = imported_modules(module)
+        heavy = sorted({h for h in heavy_modules for name in imported
+                        if name == h or name.startswith(h + ".")})
+        import_time = None
+        ok = not heavy
+        if measure_time:
+            import_time = measure_import(module, repeats)
+            ok = ok and import_time <= numpy_time + budget
+        report[module] = {"time": import_time, "heavy": heavy, "ok": ok}
+
+    if verbose:
+        if measure_time:
+            print(f"numpy: {1000*numpy_time:.1f} ms, "
+                  f"budget: numpy + {1000*budget:.1f} ms")
+        for module, row in report.items():
+            status = "ok" if row["ok"] else "FAILED"
+            time_str = ("-".rjust(7) if row["time"] is None
+                        else f"{1000*row['time']:7.1f}")
+            print(f"{status:6s} {time_str} ms  {module}",
+                  f"(imports {', '.join(row['heavy'])})" if row["heavy"]
+                  else "")
+    return report
+
+
+if __name__ == "__main__":
+    report = import_time_report()
+    sys.exit(0 if all(row["ok"] for row in report.values()) else 1)
@@ -0,0 +1,42 @@
+"""
+Unit Tests
+==========
+"""
+
+
+import os
+import sys
+import unittest
+
+from simple_pendulum.utilities.import_time import import_time_report
+
+
+class Test(unittest.TestCase):
+
+    def test_0_deferred_imports(self):
+        """
+        Unit test checking that the core modules defer their heavy
+        dependencies
+        """
+        report = import_time_report(measure_time=False, verbose=False)
+        for module, row in report.items():
+            with self.subTest(module=module):
+                self.assertEqual(row["heavy"], [])
+
+    # wall clock times depend on the load of the machine, the budget is
+    # checked with python -m simple_pendulum.utilities.import_time
+    @unittest.skipUnless(os.environ.get("SIMPLE_PENDULUM_CHECK_IMPORT_TIME"),
+                         "set SIMPLE_PENDULUM_CHECK_IMPORT_TIME to check "
+                         "the import time budget")
+    @unittest.skipIf(sys.version_info < (3, 7),
+                     "python -X importtime needs Python >= 3.7")
+    def test_1_import_time_budget(self):
+        """
+        Unit test checking that the core modules stay within the import
+        time budget
+        """
+        report = import_time_report(verbose=False)
+        for module, row in report.items():
+            with self.subTest(module=module):
+                self.assertTrue(row["ok"],
+                                f"{module} took {row['time']:.3f} s")